@@ -0,0 +1,855 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks de la capa de almacenamiento de SuperHábit
+
+Uso:
+    python benchmark_almacenamiento.py [escenario] [filas]
+
+Escenarios disponibles:
+- carga_csv: filas/segundo al cargar registros.csv con el lector anterior
+  (csv.DictReader + cadena de if/elif por celda) y con el lector actual
+- memoria_registros: bytes por registro como dict, como fila compacta y en
+  columnas, del almacén completo (con índices) y de cada RegistroCumplimiento
+  materializado
+- rachas: racha actual, racha máxima y conteo del mes de todos los hábitos,
+  materializando los registros (como antes) y con los mapas de bits por hábito
+- resumen: estadísticas de todos los hábitos al iniciar, cargando registros.csv
+  y leyendo solo registros.agregados
+- marcado_masivo: marcar muchos (hábito, fecha) uno por uno y con
+  marcar_habitos_completados, que guarda todo de una vez (hasta 5.000 marcas)
+- latencia_escritura: latencia media y máxima de marcar un hábito sobre un
+  registros.csv grande, escribiendo cada cambio y con escritura diferida
+- escritura_instantanea: tiempo de reescribir registros.csv en el lugar (como
+  antes), con temporal y renombre, sincronizando con el disco (fsync) y
+  guardando además una copia de respaldo
+- carga_binaria: tiempo de abrir la colección de registros (con sus índices)
+  desde registros.csv y desde la instantánea binaria registros.bin
+- lectura_mapeada: memoria y tiempo de consultar los últimos 30 días de cada
+  hábito cargando registros.bin y leyéndolo mapeado en memoria (mmap)
+- particiones: latencia de marcar un hábito y armar la agenda de un usuario
+  con 10, 100, 1.000... usuarios (hasta 10.000), repitiendo el mismo usuario y
+  eligiéndolo al azar (abriendo su partición si el pool la había descargado)
+- servicio_http: solicitudes por segundo y latencias del servicio HTTP local
+  (servicio_http.py) con varios clientes concurrentes sobre hasta 1.000
+  usuarios: 80% agendas y 20% hábitos marcados
+- gestor_asincrono: demora máxima del event loop y operaciones por segundo al
+  atender usuarios al azar (hasta 1.000) llamando a GestorSuperHabit desde el
+  loop y con GestorSuperHabitAsincrono
+- concurrencia: 16 hilos que crean hábitos, marcan los mismos (hábito, día) y
+  arman agendas sobre pocos usuarios (con descargas del pool en el medio), y
+  después verifican que no haya IDs ni días repetidos, cambios perdidos o
+  índices desactualizados, en memoria y tras recargar del disco
+- primer_id: tiempo de obtener el primer ID nuevo de los registros al abrir la
+  colección, buscando el máximo de sus IDs (como antes) y leyendo la
+  secuencia guardada en registros.secuencia
+
+Cada escenario trabaja en un directorio temporal y no toca los datos del usuario.
+"""
+
+import sys
+import os
+import asyncio
+import csv
+import http.client
+import shutil
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dao import BaseDAO, RegistroDAO
+from gestor_superhabit import GestorSuperHabit
+from gestor_asincrono import GestorSuperHabitAsincrono
+import servicio_http
+from models import RegistroCumplimiento
+
+FILAS_POR_DEFECTO = 1_000_000
+HABITOS_SIMULADOS = 20
+USUARIOS_MAXIMOS = 10_000
+USUARIOS_SERVICIO = 1_000
+
+
+def generar_registros_csv(archivo: str, filas: int):
+    """Genera un registros.csv sintético con un registro por hábito y día"""
+    inicio = date.today() - timedelta(days=filas // HABITOS_SIMULADOS)
+    with open(archivo, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'habito_id', 'fecha', 'completado', 'fecha_completado', 'nota'])
+        for i in range(filas):
+            fecha = inicio + timedelta(days=i // HABITOS_SIMULADOS)
+            completado = i % 3 != 0
+            writer.writerow([
+                i + 1,
+                i % HABITOS_SIMULADOS + 1,
+                fecha.isoformat(),
+                completado,
+                datetime.combine(fecha, datetime.min.time()).isoformat() if completado else '',
+                'Nota de prueba' if i % 50 == 0 else ''
+            ])
+
+
+def _convertir_tipos_csv_anterior(row):
+    """Copia del conversor por celda usado antes del lector por columnas (referencia)"""
+    elemento = {}
+    for key, value in row.items():
+        if not value:
+            elemento[key] = None
+        elif key == 'id' or key.endswith('_id'):
+            elemento[key] = int(value)
+        elif key in ['duracion']:
+            elemento[key] = int(value)
+        elif key in ['activo', 'completado']:
+            elemento[key] = value.lower() == 'true'
+        elif key in ['fecha_creacion', 'fecha_registro'] and value:
+            try:
+                if isinstance(value, datetime):
+                    elemento[key] = value
+                else:
+                    elemento[key] = datetime.fromisoformat(value)
+            except:
+                elemento[key] = value
+        elif key == 'fecha' and value:
+            try:
+                from datetime import datetime as dt
+                if isinstance(value, str):
+                    if 'T' in value:
+                        elemento[key] = dt.fromisoformat(value)
+                    else:
+                        elemento[key] = dt.fromisoformat(value + 'T00:00:00')
+                else:
+                    elemento[key] = value
+            except:
+                elemento[key] = value
+        else:
+            elemento[key] = value
+    return elemento
+
+
+def _cargar_csv_anterior(archivo: str):
+    with open(archivo, 'r', newline='', encoding='utf-8') as f:
+        return [_convertir_tipos_csv_anterior(row) for row in csv.DictReader(f)]
+
+
+def _medir(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def benchmark_carga_csv(filas: int):
+    """Compara filas/segundo del lector anterior y del lector por columnas"""
+    print(f"📄 Generando registros.csv con {filas:,} filas...")
+    generar_registros_csv('registros.csv', filas)
+
+    anteriores, segundos_anterior = _medir(_cargar_csv_anterior, 'registros.csv')
+    actuales, segundos_actual = _medir(RegistroDAO()._cargar_csv, 'registros.csv')
+
+    if anteriores != list(actuales):
+        print("⚠️ Los dos lectores produjeron resultados distintos")
+
+    print(f"   Lector anterior: {segundos_anterior:.2f} s ({filas / segundos_anterior:,.0f} filas/s)")
+    print(f"   Lector actual:   {segundos_actual:.2f} s ({filas / segundos_actual:,.0f} filas/s)")
+    print(f"   Mejora: {segundos_anterior / segundos_actual:.1f}x")
+
+
+def _bytes_por_elemento(construir, total: int) -> float:
+    """Memoria retenida por lo que construye la función, dividida por elemento"""
+    tracemalloc.start()
+    resultado = construir()
+    memoria = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del resultado
+    return memoria / total
+
+
+def benchmark_memoria_registros(filas: int):
+    """Memoria por registro de cada representación en memoria"""
+    print(f"📄 Generando registros.csv con {filas:,} filas...")
+    generar_registros_csv('registros.csv', filas)
+    dao = RegistroDAO()
+    filas_dict = [fila.copy() for fila in dao._leer_csv('registros.csv')]
+
+    como_dict = _bytes_por_elemento(lambda: [dict(fila) for fila in filas_dict], filas)
+    como_fila = _bytes_por_elemento(lambda: [dao._a_fila(fila) for fila in filas_dict], filas)
+    en_columnas = _bytes_por_elemento(lambda: dao._crear_contenedor(filas_dict), filas)
+    del filas_dict
+
+    BaseDAO._almacenamiento_global.pop(dao.nombre_coleccion, None)
+    almacen = _bytes_por_elemento(lambda: dao.datos, filas)
+    objetos = _bytes_por_elemento(lambda: [RegistroCumplimiento.from_dict(fila) for fila in dao.datos], filas)
+
+    print(f"   Registro como dict:           {como_dict:,.0f} bytes")
+    print(f"   Registro como fila compacta:  {como_fila:,.0f} bytes")
+    print(f"   Registro en columnas:         {en_columnas:,.0f} bytes")
+    print(f"   Almacén cargado (con índices): {almacen:,.0f} bytes por registro")
+    print(f"   RegistroCumplimiento:         {objetos:,.0f} bytes por objeto")
+
+
+def _rachas_materializando(dao: RegistroDAO, habito_id: int, inicio_mes: date, hoy: date):
+    """Racha actual, racha máxima y completados del mes recorriendo objetos (referencia)"""
+    registros = dao.obtener_registros_completados_por_habito(habito_id)
+    fechas = sorted(r.fecha.date() for r in registros)
+
+    racha_actual = 0
+    esperada = hoy
+    for fecha in reversed(fechas):
+        if fecha != esperada:
+            break
+        racha_actual += 1
+        esperada -= timedelta(days=1)
+
+    racha_maxima = 1 if fechas else 0
+    racha = 1
+    for anterior, fecha in zip(fechas, fechas[1:]):
+        racha = racha + 1 if fecha == anterior + timedelta(days=1) else 1
+        racha_maxima = max(racha_maxima, racha)
+
+    completados_mes = sum(1 for fecha in fechas if inicio_mes <= fecha <= hoy)
+    return racha_actual, racha_maxima, completados_mes
+
+
+def _rachas_con_mapas(dao: RegistroDAO, habito_id: int, inicio_mes: date, hoy: date):
+    return (dao.calcular_racha_actual(habito_id),
+            dao.calcular_racha_maxima(habito_id),
+            dao.contar_completados_periodo(habito_id, inicio_mes, hoy))
+
+
+def benchmark_rachas(filas: int):
+    """Compara el cálculo de rachas materializando registros y con mapas de bits"""
+    print(f"📄 Generando registros.csv con {filas:,} filas...")
+    generar_registros_csv('registros.csv', filas)
+    dao = RegistroDAO()
+    dao.datos  # Cargar antes de medir
+    hoy = date.today()
+    inicio_mes = hoy.replace(day=1)
+    habitos = range(1, HABITOS_SIMULADOS + 1)
+
+    anteriores, segundos_anterior = _medir(
+        lambda: [_rachas_materializando(dao, h, inicio_mes, hoy) for h in habitos])
+    actuales, segundos_actual = _medir(
+        lambda: [_rachas_con_mapas(dao, h, inicio_mes, hoy) for h in habitos])
+
+    if anteriores != actuales:
+        print("⚠️ Los dos cálculos produjeron resultados distintos")
+
+    print(f"   Materializando registros: {segundos_anterior * 1000:,.1f} ms para {HABITOS_SIMULADOS} hábitos")
+    print(f"   Mapas de bits:            {segundos_actual * 1000:,.3f} ms para {HABITOS_SIMULADOS} hábitos")
+    print(f"   Mejora: {segundos_anterior / segundos_actual:,.0f}x")
+
+
+def _reiniciar_almacenamiento(dao: RegistroDAO):
+    """Olvida lo cargado en memoria, como al abrir la aplicación de nuevo"""
+    BaseDAO._almacenamiento_global.pop(dao._clave, None)
+    RegistroDAO._agregados_persistidos.pop(dao._clave, None)
+    dao._cerrar_mapeo()
+
+
+def benchmark_resumen(filas: int):
+    """Compara las estadísticas de inicio cargando la colección y leyendo los agregados guardados"""
+    print(f"📄 Generando registros.csv con {filas:,} filas...")
+    generar_registros_csv('registros.csv', filas)
+    dao = RegistroDAO()
+    habitos = range(1, HABITOS_SIMULADOS + 1)
+
+    _reiniciar_almacenamiento(dao)
+    cargando, segundos_carga = _medir(lambda: [dao.obtener_agregados(h) for h in habitos])
+    dao._guardar_agregados()
+
+    _reiniciar_almacenamiento(dao)
+    leyendo, segundos_agregados = _medir(lambda: [dao.obtener_agregados(h) for h in habitos])
+
+    if cargando != leyendo:
+        print("⚠️ Los agregados guardados no coinciden con los calculados")
+
+    print(f"   Cargando registros.csv:       {segundos_carga * 1000:,.1f} ms")
+    print(f"   Leyendo registros.agregados:  {segundos_agregados * 1000:,.1f} ms")
+    print(f"   Mejora: {segundos_carga / segundos_agregados:,.0f}x")
+
+
+MARCAS_MAXIMAS = 5_000
+
+
+def benchmark_marcado_masivo(filas: int):
+    """Compara marcar hábitos uno por uno con marcarlos en un solo lote"""
+    marcas_totales = min(filas, MARCAS_MAXIMAS)
+    hoy = date.today()
+    marcas = [(i % HABITOS_SIMULADOS + 1, hoy - timedelta(days=i // HABITOS_SIMULADOS), None)
+              for i in range(marcas_totales)]
+    # El lote usa otros hábitos para no encontrar ya creados los registros de la primera pasada
+    marcas_lote = [(habito_id + HABITOS_SIMULADOS, fecha, nota) for habito_id, fecha, nota in marcas]
+    dao = RegistroDAO()
+    
+    print(f"✅ Marcando {marcas_totales:,} días uno por uno...")
+    _, segundos_uno_a_uno = _medir(lambda: [dao.marcar_habito_completado(*marca) for marca in marcas])
+    
+    print(f"✅ Marcando {marcas_totales:,} días en un lote...")
+    _, segundos_lote = _medir(dao.marcar_habitos_completados, marcas_lote)
+    
+    _reiniciar_almacenamiento(dao)
+    guardados = [(fila['habito_id'], fila['fecha']) for fila in dao.obtener_todos()]
+    uno_a_uno = sorted(marca for marca in guardados if marca[0] <= HABITOS_SIMULADOS)
+    en_lote = sorted((habito_id - HABITOS_SIMULADOS, fecha) for habito_id, fecha in guardados
+                     if habito_id > HABITOS_SIMULADOS)
+    if uno_a_uno != en_lote or len(uno_a_uno) != marcas_totales:
+        print("⚠️ Los dos métodos guardaron registros distintos")
+    
+    print(f"   Uno por uno: {segundos_uno_a_uno * 1000:,.1f} ms")
+    print(f"   En un lote:  {segundos_lote * 1000:,.1f} ms")
+    print(f"   Mejora: {segundos_uno_a_uno / segundos_lote:,.1f}x")
+
+
+MARCAS_LATENCIA = 1_000
+
+
+def _latencias_marcado(dao: RegistroDAO, desplazamiento: int):
+    """Segundos que tarda cada marca de un hábito nuevo, más la escritura final de pendientes"""
+    hoy = date.today()
+    latencias = []
+    for dia in range(MARCAS_LATENCIA):
+        inicio = time.perf_counter()
+        dao.marcar_habito_completado(HABITOS_SIMULADOS + desplazamiento, hoy - timedelta(days=dia))
+        latencias.append(time.perf_counter() - inicio)
+    _, segundos_flush = _medir(dao.flush_todas)
+    return latencias, segundos_flush
+
+
+def benchmark_latencia_escritura(filas: int):
+    """Compara la latencia de cada cambio escribiéndolo enseguida y con escritura diferida"""
+    print(f"📄 Generando registros.csv con {filas:,} filas...")
+    generar_registros_csv('registros.csv', filas)
+    dao = RegistroDAO()
+    dao.datos  # Cargar antes de medir
+    
+    escritura_diferida = BaseDAO.escritura_diferida
+    try:
+        BaseDAO.escritura_diferida = False
+        inmediatas, _ = _latencias_marcado(dao, 1)
+        BaseDAO.escritura_diferida = True
+        diferidas, segundos_flush = _latencias_marcado(dao, 2)
+    finally:
+        BaseDAO.escritura_diferida = escritura_diferida
+    
+    for nombre, latencias in (("Escritura inmediata", inmediatas), ("Escritura diferida", diferidas)):
+        media = sum(latencias) / len(latencias)
+        print(f"   {nombre}: media {media * 1000:,.2f} ms, máxima {max(latencias) * 1000:,.1f} ms")
+    print(f"   Escritura final de pendientes: {segundos_flush * 1000:,.1f} ms")
+
+
+REPETICIONES_INSTANTANEA = 3
+
+
+def _guardar_en_el_lugar(dao: RegistroDAO, datos):
+    """Escritura anterior de la instantánea: reescribe el CSV directamente, sin temporal"""
+    with open(dao._archivo_datos, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(datos[0].keys()))
+        writer.writeheader()
+        for elemento in datos:
+            writer.writerow(dao._convertir_para_csv(elemento))
+    return True
+
+
+def benchmark_escritura_instantanea(filas: int):
+    """Muestra cuánto cuesta cada garantía al reescribir la instantánea CSV"""
+    print(f"📄 Generando registros.csv con {filas:,} filas...")
+    generar_registros_csv('registros.csv', filas)
+    dao = RegistroDAO()
+    datos = dao._copiar_datos()
+    
+    variantes = (
+        ("En el lugar (anterior)", None, False, 0),
+        ("Temporal + renombre", dao._guardar_datos, False, 0),
+        ("+ fsync", dao._guardar_datos, True, 0),
+        ("+ fsync + respaldo", dao._guardar_datos, True, 1),
+    )
+    configuracion = BaseDAO.sincronizar_disco, BaseDAO.copias_respaldo
+    resultados = []
+    try:
+        for nombre, guardar, sincronizar, copias in variantes:
+            BaseDAO.sincronizar_disco, BaseDAO.copias_respaldo = sincronizar, copias
+            segundos = []
+            for _ in range(REPETICIONES_INSTANTANEA):
+                if guardar is None:
+                    _, tiempo = _medir(_guardar_en_el_lugar, dao, datos)
+                else:
+                    _, tiempo = _medir(guardar, datos)
+                segundos.append(tiempo)
+            resultados.append((nombre, sum(segundos) / len(segundos)))
+    finally:
+        BaseDAO.sincronizar_disco, BaseDAO.copias_respaldo = configuracion
+    
+    _reiniciar_almacenamiento(dao)
+    if len(dao.obtener_todos()) != filas:
+        print("⚠️ La instantánea guardada no tiene todas las filas")
+    
+    referencia = resultados[0][1]
+    for nombre, segundos in resultados:
+        print(f"   {nombre:<24} {segundos * 1000:,.1f} ms ({segundos / referencia:.2f}x)")
+
+
+def _abrir_registros(binario: bool) -> RegistroDAO:
+    """Abre la colección de registros desde cero con el formato indicado"""
+    formato_binario = RegistroDAO.formato_binario
+    try:
+        RegistroDAO.formato_binario = binario
+        dao = RegistroDAO()
+        _reiniciar_almacenamiento(dao)
+        dao.datos  # Carga la instantánea y arma los índices
+        return dao
+    finally:
+        RegistroDAO.formato_binario = formato_binario
+
+
+def benchmark_carga_binaria(filas: int):
+    """Compara abrir los registros desde registros.csv y desde registros.bin"""
+    print(f"📄 Generando registros.csv con {filas:,} filas...")
+    generar_registros_csv('registros.csv', filas)
+    _, segundos_conversion = _medir(RegistroDAO().convertir_instantanea, 'registros.csv', 'registros.bin')
+    
+    desde_csv, segundos_csv = _medir(_abrir_registros, False)
+    todos_csv = desde_csv.obtener_todos()
+    desde_binario, segundos_binario = _medir(_abrir_registros, True)
+    if todos_csv != desde_binario.obtener_todos():
+        print("⚠️ Los dos formatos cargaron registros distintos")
+    
+    print(f"   Tamaño: CSV {os.path.getsize('registros.csv') / 1e6:,.1f} MB, "
+          f"binario {os.path.getsize('registros.bin') / 1e6:,.1f} MB")
+    print(f"   Conversión a binario:  {segundos_conversion:.2f} s")
+    print(f"   Abrir registros.csv:   {segundos_csv:.2f} s")
+    print(f"   Abrir registros.bin:   {segundos_binario:.2f} s")
+    print(f"   Mejora: {segundos_csv / segundos_binario:.1f}x")
+
+
+def _ultimos_30_dias(dao: RegistroDAO):
+    hoy = date.today()
+    return [[registro.to_dict() for registro in
+             dao.obtener_registros_por_habito_periodo(habito_id, hoy - timedelta(days=29), hoy)]
+            for habito_id in range(1, HABITOS_SIMULADOS + 1)]
+
+
+def _consulta_en_frio(mapeada: bool):
+    """Memoria retenida (bytes) y segundos de la consulta de 30 días empezando sin nada en memoria"""
+    configuracion = RegistroDAO.formato_binario, RegistroDAO.lectura_mapeada
+    try:
+        RegistroDAO.formato_binario, RegistroDAO.lectura_mapeada = True, mapeada
+        dao = RegistroDAO()
+        _reiniciar_almacenamiento(dao)
+        resultado, segundos = _medir(_ultimos_30_dias, dao)
+        # Una segunda consulta ya encuentra la colección cargada o el archivo mapeado
+        _, segundos_siguiente = _medir(_ultimos_30_dias, dao)
+        
+        # La memoria se mide aparte: tracemalloc hace más lentas las asignaciones
+        _reiniciar_almacenamiento(dao)
+        memoria = _bytes_por_elemento(lambda: _ultimos_30_dias(dao), 1)
+        return resultado, memoria, segundos, segundos_siguiente
+    finally:
+        RegistroDAO.formato_binario, RegistroDAO.lectura_mapeada = configuracion
+
+
+def benchmark_lectura_mapeada(filas: int):
+    """Compara consultar 30 días de historial cargando registros.bin y leyéndolo mapeado"""
+    print(f"📄 Generando registros.csv con {filas:,} filas...")
+    generar_registros_csv('registros.csv', filas)
+    RegistroDAO().convertir_instantanea('registros.csv', 'registros.bin')
+    
+    cargando, memoria_carga, segundos_carga, siguiente_carga = _consulta_en_frio(False)
+    mapeando, memoria_mapeo, segundos_mapeo, siguiente_mapeo = _consulta_en_frio(True)
+    if cargando != mapeando:
+        print("⚠️ Las dos lecturas retornaron registros distintos")
+    
+    print(f"   Cargando registros.bin: {memoria_carga / 1e6:,.1f} MB retenidos, "
+          f"primera consulta {segundos_carga * 1000:,.1f} ms, siguientes {siguiente_carga * 1000:,.1f} ms")
+    print(f"   Mapeando registros.bin: {memoria_mapeo / 1e6:,.2f} MB retenidos, "
+          f"primera consulta {segundos_mapeo * 1000:,.1f} ms, siguientes {siguiente_mapeo * 1000:,.1f} ms")
+
+
+def _crear_usuario(usuario: str):
+    """Crea un usuario con tres hábitos diarios y sus últimos 30 días completados"""
+    gestor = GestorSuperHabit(usuario)
+    hoy = date.today()
+    for nombre in ('Leer', 'Correr', 'Meditar'):
+        habito = gestor.crear_habito(nombre, 'diaria', 30)
+        gestor.rellenar_periodo_completado(habito.id, hoy - timedelta(days=29), hoy)
+
+
+def _operacion_usuario(gestor: GestorSuperHabit):
+    gestor.marcar_habito_completado(1)
+    gestor.generar_agenda_diaria()
+
+
+def benchmark_particiones(filas: int):
+    """Compara la latencia por usuario a medida que crece la cantidad de usuarios"""
+    total = min(filas, USUARIOS_MAXIMOS)
+    operaciones = 200
+    print(f"👥 Hasta {total:,} usuarios con 3 hábitos y 30 días de registros; "
+          f"{BaseDAO.particiones.capacidad} quedan residentes")
+    creados = 0
+    usuarios = 10
+    while True:
+        usuarios = min(usuarios, total)
+        while creados < usuarios:
+            _crear_usuario(f'usuario{creados}')
+            creados += 1
+        
+        gestor = GestorSuperHabit('usuario0')
+        _, segundos_mismo = _medir(lambda: [_operacion_usuario(gestor) for _ in range(operaciones)])
+        elegidos = [f'usuario{random.randrange(usuarios)}' for _ in range(operaciones)]
+        _, segundos_azar = _medir(lambda: [_operacion_usuario(GestorSuperHabit(usuario)) for usuario in elegidos])
+        metricas = BaseDAO.particiones.obtener_metricas()
+        print(f"   {usuarios:>6,} usuarios: mismo usuario {segundos_mismo / operaciones * 1000:.2f} ms/op, "
+              f"usuario al azar {segundos_azar / operaciones * 1000:.2f} ms/op "
+              f"({metricas['residentes']} residentes, {metricas['desalojos']:,} descargas)")
+        if usuarios == total:
+            break
+        usuarios *= 10
+    BaseDAO.flush_todas()
+
+
+def _cliente_http(puerto: int, usuarios: int, solicitudes: int, semilla: int):
+    """Un cliente con conexión persistente que pide agendas y marca hábitos de usuarios al azar"""
+    azar = random.Random(semilla)
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto)
+    try:
+        for _ in range(solicitudes):
+            usuario = f'usuario{azar.randrange(usuarios)}'
+            if azar.random() < 0.8:
+                conexion.request('GET', f'/usuarios/{usuario}/agenda')
+            else:
+                conexion.request('POST', f'/usuarios/{usuario}/habitos/{azar.randint(1, 3)}/completar', body=b'{}',
+                                 headers={'Content-Type': 'application/json'})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            if respuesta.status != 200:
+                print(f"⚠️ Respuesta {respuesta.status} para {usuario}")
+    finally:
+        conexion.close()
+
+
+def benchmark_servicio_http(filas: int):
+    """Mide throughput y latencias del servicio HTTP con clientes concurrentes"""
+    usuarios = min(filas, USUARIOS_SERVICIO)
+    clientes, solicitudes, trabajadores = 16, 200, 8
+    print(f"👥 Creando {usuarios:,} usuarios con 3 hábitos y 30 días de registros...")
+    for numero in range(usuarios):
+        _crear_usuario(f'usuario{numero}')
+    
+    servidor = servicio_http.crear_servidor(0, trabajadores)
+    hilo_servidor = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo_servidor.start()
+    try:
+        puerto = servidor.server_address[1]
+        hilos = [threading.Thread(target=_cliente_http, args=(puerto, usuarios, solicitudes, numero))
+                 for numero in range(clientes)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        segundos = time.perf_counter() - inicio
+        metricas = servidor.servicio.metricas.resumen()
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+    
+    total = clientes * solicitudes
+    print(f"   {clientes} clientes, {trabajadores} trabajadores: {total:,} solicitudes en {segundos:.2f} s "
+          f"({total / segundos:,.0f} por segundo, {metricas['rechazadas']} rechazadas)")
+    for ruta, datos in metricas['rutas'].items():
+        print(f"   {ruta:<10} media {datos['latencia_media_ms']:.2f} ms, p95 {datos['latencia_p95_ms']:.2f} ms, "
+              f"máxima {datos['latencia_maxima_ms']:.2f} ms ({datos['solicitudes']:,} solicitudes)")
+
+
+async def _atender_en_loop(operar, usuarios: int, operaciones: int, clientes: int):
+    """Segundos totales y mayor demora del loop (ms) con varios clientes operando sobre usuarios al azar"""
+    azar = random.Random(0)
+    demora_maxima = 0.0
+    atendiendo = True
+    
+    async def latido():
+        nonlocal demora_maxima
+        while atendiendo:
+            inicio = time.perf_counter()
+            await asyncio.sleep(0.001)
+            demora_maxima = max(demora_maxima, time.perf_counter() - inicio - 0.001)
+    
+    async def cliente():
+        for _ in range(operaciones // clientes):
+            await operar(f'usuario{azar.randrange(usuarios)}')
+    
+    tarea = asyncio.create_task(latido())
+    await asyncio.sleep(0)
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(clientes)))
+    segundos = time.perf_counter() - inicio
+    atendiendo = False
+    await tarea
+    return segundos, demora_maxima * 1000
+
+
+def benchmark_gestor_asincrono(filas: int):
+    """Compara la demora del event loop llamando al gestor sincrónico y a la fachada asíncrona"""
+    usuarios = min(filas, USUARIOS_SERVICIO)
+    operaciones, clientes = 2000, 16
+    print(f"👥 Creando {usuarios:,} usuarios con 3 hábitos y 30 días de registros...")
+    for numero in range(usuarios):
+        _crear_usuario(f'usuario{numero}')
+    
+    sincronicos = {}
+    
+    async def operar_sincronico(usuario: str):
+        gestor = sincronicos.get(usuario) or sincronicos.setdefault(usuario, GestorSuperHabit(usuario))
+        gestor.marcar_habito_completado(1)
+        gestor.generar_agenda_diaria()
+    
+    asincronicos = {}
+    
+    async def operar_asincronico(usuario: str):
+        gestor = asincronicos.get(usuario) or asincronicos.setdefault(usuario, GestorSuperHabitAsincrono(usuario))
+        await gestor.marcar_habito_completado(1)
+        await gestor.generar_agenda_diaria()
+    
+    resultados = []
+    for nombre, operar in (('GestorSuperHabit', operar_sincronico), ('GestorSuperHabitAsincrono', operar_asincronico)):
+        BaseDAO.particiones.desalojar_todos()  # Cada variante empieza sin usuarios en memoria
+        segundos, demora = asyncio.run(_atender_en_loop(operar, usuarios, operaciones, clientes))
+        resultados.append((nombre, segundos, demora))
+    BaseDAO.flush_todas()
+    
+    print(f"   {operaciones:,} operaciones (marcar + agenda) de {clientes} clientes sobre {usuarios:,} usuarios, "
+          f"{BaseDAO.particiones.capacidad} residentes:")
+    for nombre, segundos, demora in resultados:
+        print(f"   {nombre:<26} {operaciones / segundos:,.0f} op/s, demora máxima del loop {demora:.1f} ms")
+
+
+HILOS_CONCURRENCIA = 16
+OPERACIONES_POR_HILO = 500
+
+
+def _resumen_agregado(agregado, inicio: int, fin: int) -> tuple:
+    """Totales de un agregado y sus días entre dos ordinales (el origen de los mapas depende de su historia)"""
+    return (agregado.total_registros, agregado.dias_completados, agregado.racha_maxima,
+            agregado.mapa_registros.ventana(inicio, fin), agregado.mapa_completados.ventana(inicio, fin))
+
+
+def _problemas_registros(dao: RegistroDAO, marcados: set) -> list:
+    """Diferencias entre los registros guardados y los (hábito, día) marcados, y entre ellos y sus índices"""
+    registros = dao.obtener_registros_por_periodo(date.min, date.max)
+    problemas = []
+    if len({registro.id for registro in registros}) != len(registros):
+        problemas.append('IDs de registros repetidos')
+    if any(getattr(dao.obtener_registro(registro.id), 'id', None) != registro.id for registro in registros):
+        problemas.append('índice de registros por ID desactualizado')
+    dias = [(registro.habito_id, registro.fecha.toordinal()) for registro in registros]
+    if len(set(dias)) != len(dias):
+        problemas.append('más de un registro para el mismo hábito y día')
+    if set(dias) != {(habito_id, dia.toordinal()) for habito_id, dia in marcados}:
+        problemas.append(f'{len(set(dias))} días con registro, {len(marcados)} marcados')
+    if not dao.en_memoria():
+        return problemas  # Con SQLite no hay índices en memoria
+    
+    lineas, agregados = RegistroDAO._indices_desde_columnas(dao.datos)
+    if {habito_id: (list(o), list(i)) for habito_id, (o, i) in lineas.items()} != \
+            {habito_id: (list(o), list(i)) for habito_id, (o, i) in dao._linea_tiempo.items()}:
+        problemas.append('líneas de tiempo desactualizadas')
+    ordinales = [ordinal for _, ordinal in dias]
+    inicio, fin = min(ordinales, default=0), max(ordinales, default=0)
+    if {habito_id: _resumen_agregado(agregado, inicio, fin) for habito_id, agregado in agregados.items()} != \
+            {habito_id: _resumen_agregado(agregado, inicio, fin) for habito_id, agregado in dao._agregados.items()}:
+        problemas.append('agregados desactualizados')
+    return problemas
+
+
+def _problemas_usuario(usuario: str, habitos: int, marcados: set) -> list:
+    gestor = GestorSuperHabit(usuario)
+    ids = [habito.id for habito in gestor.habito_dao.obtener_todos_habitos()]
+    problemas = []
+    if len(ids) != habitos:
+        problemas.append(f'{len(ids)} hábitos de {habitos} creados')
+    if len(set(ids)) != len(ids):
+        problemas.append('IDs de hábitos repetidos')
+    if any(getattr(gestor.habito_dao.obtener_habito(habito_id), 'id', None) != habito_id for habito_id in ids):
+        problemas.append('índice de hábitos por ID desactualizado')
+    return [f'{usuario}: {problema}' for problema in problemas + _problemas_registros(gestor.registro_dao, marcados)]
+
+
+def _ronda_concurrencia(usuarios: list, operaciones: int) -> list:
+    """Usa los usuarios desde muchos hilos a la vez y retorna los problemas encontrados, antes y después de recargar"""
+    inicio = date.today() - timedelta(days=59)
+    for usuario in usuarios:
+        gestor = GestorSuperHabit(usuario)
+        for nombre in ('Leer', 'Correr', 'Meditar'):
+            gestor.crear_habito(nombre, 'diaria', 30)
+    
+    habitos = {usuario: 3 for usuario in usuarios}
+    marcados = {usuario: set() for usuario in usuarios}
+    errores = []
+    cerrojo = threading.Lock()
+    
+    def trabajar(numero: int):
+        azar = random.Random(numero)
+        # Cada hilo con sus propios gestores: varios DAO por colección a la vez
+        gestores = {usuario: GestorSuperHabit(usuario) for usuario in usuarios}
+        # Los hábitos que crea cada hilo solo los marca y elimina él, así se sabe qué registros deben quedar
+        propios = {usuario: [] for usuario in usuarios}
+        try:
+            for _ in range(operaciones):
+                usuario = azar.choice(usuarios)
+                gestor = gestores[usuario]
+                eleccion = azar.random()
+                if eleccion < 0.05:
+                    propios[usuario].append(gestor.crear_habito(f'Hábito {numero}', 'diaria', 10).id)
+                    with cerrojo:
+                        habitos[usuario] += 1
+                elif eleccion < 0.5:
+                    # Pocos (hábito, día) posibles: muchos hilos marcan el mismo a la vez
+                    marca = (azar.choice([1, 2, 3] + propios[usuario]), inicio + timedelta(days=azar.randrange(60)))
+                    gestor.registro_dao.marcar_habito_completado(*marca)
+                    with cerrojo:
+                        marcados[usuario].add(marca)
+                elif eleccion < 0.6:
+                    # Desmarcar deja el registro (no completado): no cambia los días con registro
+                    gestor.registro_dao.desmarcar_habito_completado(azar.randint(1, 3),
+                                                                    inicio + timedelta(days=azar.randrange(60)))
+                elif eleccion < 0.62:
+                    # Eliminar mueve a su lugar el último registro, que puede ser de otro hilo
+                    with cerrojo:
+                        marcas = sorted(marca for marca in marcados[usuario] if marca[0] in propios[usuario])
+                    if marcas:
+                        marca = azar.choice(marcas)
+                        gestor.registro_dao.eliminar(gestor.registro_dao.obtener_registro_por_habito_fecha(*marca).id)
+                        with cerrojo:
+                            marcados[usuario].discard(marca)
+                elif eleccion < 0.65:
+                    if propios[usuario]:
+                        habito_id = propios[usuario].pop(azar.randrange(len(propios[usuario])))
+                        gestor.registro_dao.eliminar_registros_por_habito(habito_id)
+                        gestor.habito_dao.eliminar_habito(habito_id)
+                        with cerrojo:
+                            habitos[usuario] -= 1
+                            marcados[usuario] = {marca for marca in marcados[usuario] if marca[0] != habito_id}
+                else:
+                    gestor.generar_agenda_diaria()
+                    gestor.obtener_progreso_habito(azar.randint(1, 3))
+        except Exception as e:
+            errores.append(f'hilo {numero}: {type(e).__name__}: {e}')
+    
+    # Menos residentes que usuarios, para que el pool descargue mientras se usan
+    capacidad = BaseDAO.particiones.capacidad
+    BaseDAO.particiones.capacidad = 2
+    desalojos = BaseDAO.particiones.obtener_metricas()['desalojos']
+    hilos = [threading.Thread(target=trabajar, args=(numero,)) for numero in range(HILOS_CONCURRENCIA)]
+    try:
+        comienzo = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        segundos = time.perf_counter() - comienzo
+    finally:
+        BaseDAO.particiones.capacidad = capacidad
+    
+    total = HILOS_CONCURRENCIA * operaciones
+    print(f"   {HILOS_CONCURRENCIA} hilos × {operaciones:,} operaciones sobre {len(usuarios)} usuarios "
+          f"(2 residentes): {total / segundos:,.0f} op/s, "
+          f"{BaseDAO.particiones.obtener_metricas()['desalojos'] - desalojos:,} descargas")
+    
+    problemas = errores + [problema for usuario in usuarios
+                           for problema in _problemas_usuario(usuario, habitos[usuario], marcados[usuario])]
+    BaseDAO.flush_todas()
+    BaseDAO.particiones.desalojar_todos()
+    problemas += [f'{problema} (tras recargar)' for usuario in usuarios
+                  for problema in _problemas_usuario(usuario, habitos[usuario], marcados[usuario])]
+    
+    if not problemas:
+        print(f"   ✅ {sum(habitos.values())} hábitos y {sum(len(m) for m in marcados.values())} registros sin IDs "
+              f"ni días repetidos, cambios perdidos o índices desactualizados (también tras recargar del disco)")
+    return problemas
+
+
+def benchmark_concurrencia(filas: int):
+    """Usa los mismos usuarios desde muchos hilos y verifica que no se pierdan cambios ni se repitan IDs
+
+    Corre una vez escribiendo cada cambio y otra con escritura diferida; si
+    encuentra problemas los muestra y termina con código de salida 1.
+    """
+    operaciones = min(filas, OPERACIONES_POR_HILO)
+    problemas = []
+    for nombre, diferida in (('inmediata', False), ('diferida', True)):
+        print(f"🧵 Escritura {nombre}")
+        escritura_diferida = BaseDAO.escritura_diferida
+        BaseDAO.escritura_diferida = diferida
+        try:
+            problemas += [f'escritura {nombre}: {problema}' for problema in
+                          _ronda_concurrencia([f'{nombre}{numero}' for numero in range(4)], operaciones)]
+        finally:
+            BaseDAO.flush_todas()
+            BaseDAO.escritura_diferida = escritura_diferida
+    
+    for problema in problemas:
+        print(f"   ⚠️ {problema}")
+    if problemas:
+        sys.exit(1)
+
+
+def benchmark_primer_id(filas: int):
+    """Compara calcular el próximo ID de los registros con max() y leerlo de registros.secuencia"""
+    print(f"📄 Generando registros.bin con {filas:,} filas...")
+    generar_registros_csv('registros.csv', filas)
+    RegistroDAO().convertir_instantanea('registros.csv', 'registros.bin')
+    dao = _abrir_registros(True)
+    
+    siguiente_maximo, segundos_maximo = _medir(dao._obtener_siguiente_id, dao.datos)
+    dao._guardar_secuencia(siguiente_maximo)
+    secuencia, segundos_secuencia = _medir(dao._leer_secuencia, dao.datos)
+    if secuencia.siguiente != siguiente_maximo:
+        print("⚠️ La secuencia guardada no coincide con el máximo de los IDs")
+    
+    print(f"   Máximo de los IDs:   {segundos_maximo * 1000:,.2f} ms")
+    print(f"   registros.secuencia: {segundos_secuencia * 1000:,.2f} ms")
+    print(f"   Mejora: {segundos_maximo / segundos_secuencia:,.0f}x")
+
+
+ESCENARIOS = {
+    'carga_csv': benchmark_carga_csv,
+    'memoria_registros': benchmark_memoria_registros,
+    'rachas': benchmark_rachas,
+    'resumen': benchmark_resumen,
+    'marcado_masivo': benchmark_marcado_masivo,
+    'latencia_escritura': benchmark_latencia_escritura,
+    'escritura_instantanea': benchmark_escritura_instantanea,
+    'carga_binaria': benchmark_carga_binaria,
+    'lectura_mapeada': benchmark_lectura_mapeada,
+    'particiones': benchmark_particiones,
+    'servicio_http': benchmark_servicio_http,
+    'gestor_asincrono': benchmark_gestor_asincrono,
+    'concurrencia': benchmark_concurrencia,
+    'primer_id': benchmark_primer_id,
+}
+
+
+def main():
+    escenario = sys.argv[1] if len(sys.argv) > 1 else 'carga_csv'
+    filas = int(sys.argv[2]) if len(sys.argv) > 2 else FILAS_POR_DEFECTO
+
+    if escenario not in ESCENARIOS:
+        print(f"⚠️ Escenario desconocido: {escenario}. Opciones: {', '.join(ESCENARIOS)}")
+        return
+
+    directorio_original = os.getcwd()
+    directorio = tempfile.mkdtemp(prefix='superhabit_bench_')
+    try:
+        os.chdir(directorio)
+        ESCENARIOS[escenario](filas)
+    finally:
+        # Lo pendiente de la escritura diferida va al directorio temporal, no al de trabajo
+        BaseDAO.flush_todas()
+        os.chdir(directorio_original)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
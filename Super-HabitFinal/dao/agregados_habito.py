@@ -0,0 +1,81 @@
+from typing import Any, Dict, Iterable
+
+from dao.mapa_cumplimiento import MapaCumplimiento
+
+
+class AgregadoHabito:
+    """Totales de un hábito que se mantienen al día con cada cambio de sus registros
+
+    Guarda la cantidad de registros, los días con algún registro y los días
+    completados (como mapas de bits), y deja ya calculados los días completados
+    y la racha máxima, de modo que los resúmenes solo leen estos valores.
+    """
+
+    __slots__ = ('total_registros', 'mapa_registros', 'mapa_completados', 'dias_completados', 'racha_maxima')
+
+    def __init__(self):
+        self.total_registros = 0
+        self.mapa_registros = MapaCumplimiento()
+        self.mapa_completados = MapaCumplimiento()
+        self.dias_completados = 0
+        self.racha_maxima = 0
+
+    @classmethod
+    def desde_ordinales(cls, ordinales_registros: Iterable[int],
+                        ordinales_completados: Iterable[int]) -> 'AgregadoHabito':
+        """Arma el agregado de una vez a partir de las fechas de todos los registros y de los completados"""
+        agregado = cls()
+        ordinales_registros = list(ordinales_registros)
+        agregado.total_registros = len(ordinales_registros)
+        agregado.mapa_registros = MapaCumplimiento.desde_ordinales(ordinales_registros)
+        agregado.mapa_completados = MapaCumplimiento.desde_ordinales(ordinales_completados)
+        agregado.dias_completados = agregado.mapa_completados.contar()
+        agregado.racha_maxima = agregado.mapa_completados.racha_maxima()
+        return agregado
+
+    @classmethod
+    def desde_dict(cls, datos: Dict[str, Any]) -> 'AgregadoHabito':
+        """Reconstruye un agregado guardado con a_dict()"""
+        agregado = cls()
+        agregado.total_registros = datos['total_registros']
+        agregado.mapa_registros = MapaCumplimiento.desde_lista(datos['registros'])
+        agregado.mapa_completados = MapaCumplimiento.desde_lista(datos['completados'])
+        agregado.dias_completados = datos['dias_completados']
+        agregado.racha_maxima = datos['racha_maxima']
+        return agregado
+
+    def a_dict(self) -> Dict[str, Any]:
+        return {
+            'total_registros': self.total_registros,
+            'dias_completados': self.dias_completados,
+            'racha_maxima': self.racha_maxima,
+            'registros': self.mapa_registros.a_lista(),
+            'completados': self.mapa_completados.a_lista(),
+        }
+
+    def agregar_registro(self, ordinal: int, completado: bool):
+        """Suma un registro del día dado"""
+        self.total_registros += 1
+        self.mapa_registros.marcar(ordinal)
+        if completado and not self.mapa_completados.contiene(ordinal):
+            self.mapa_completados.marcar(ordinal)
+            self.dias_completados += 1
+            racha = self.mapa_completados.racha_hasta(ordinal) + self.mapa_completados.racha_desde(ordinal) - 1
+            self.racha_maxima = max(self.racha_maxima, racha)
+
+    def quitar_registro(self, ordinal: int, completado: bool, queda_registro: bool, queda_completado: bool):
+        """Resta un registro del día dado
+
+        queda_registro y queda_completado indican si otro registro del mismo
+        día sigue existiendo (y completado), en cuyo caso el día se conserva.
+        """
+        self.total_registros -= 1
+        if not queda_registro:
+            self.mapa_registros.desmarcar(ordinal)
+        if completado and not queda_completado and self.mapa_completados.contiene(ordinal):
+            racha = self.mapa_completados.racha_hasta(ordinal) + self.mapa_completados.racha_desde(ordinal) - 1
+            self.mapa_completados.desmarcar(ordinal)
+            self.dias_completados -= 1
+            if racha >= self.racha_maxima:
+                # Se cortó la racha más larga: la nueva máxima puede ser otra
+                self.racha_maxima = self.mapa_completados.racha_maxima()
@@ -0,0 +1,214 @@
+from typing import List, Dict, Any, Optional, Sequence
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# Columnas y tipos SQL de cada colección
+ESQUEMAS = {
+    'habitos': [
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('nombre', 'TEXT NOT NULL'),
+        ('frecuencia', 'TEXT NOT NULL'),
+        ('duracion', 'INTEGER NOT NULL'),
+        ('horario_sugerido', 'TEXT'),
+        ('fecha_creacion', 'TEXT'),
+        ('activo', 'INTEGER NOT NULL DEFAULT 1'),
+    ],
+    'registros': [
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('habito_id', 'INTEGER NOT NULL'),
+        ('fecha', 'TEXT NOT NULL'),
+        ('completado', 'INTEGER NOT NULL DEFAULT 0'),
+        ('fecha_completado', 'TEXT'),
+        ('nota', 'TEXT'),
+    ],
+}
+
+INDICES = {
+    'habitos': [
+        'CREATE INDEX IF NOT EXISTS idx_habitos_activo_frecuencia ON habitos(activo, frecuencia)',
+    ],
+    'registros': [
+        'CREATE INDEX IF NOT EXISTS idx_registros_habito_fecha ON registros(habito_id, fecha)',
+        'CREATE INDEX IF NOT EXISTS idx_registros_fecha ON registros(fecha)',
+    ],
+}
+
+COLUMNAS_BOOLEANAS = ('activo', 'completado')
+
+
+class BackendSQLite:
+    """Almacenamiento de una colección en una base de datos SQLite"""
+
+    # Conexiones compartidas por archivo de base de datos
+    _conexiones = {}
+    # Conexiones con un lote abierto: sus escrituras se confirman al cerrar el lote
+    _conexiones_en_lote = set()
+    # Las colecciones de un archivo comparten la conexión (y sus transacciones):
+    # las escrituras y los lotes de cada archivo se hacen de a un hilo por vez
+    _cerrojos = {}
+
+    def __init__(self, archivo: str, nombre_coleccion: str):
+        if nombre_coleccion not in ESQUEMAS:
+            raise ValueError(f"No hay esquema SQLite para la colección '{nombre_coleccion}'")
+
+        self.nombre_coleccion = nombre_coleccion
+        self.columnas = [nombre for nombre, _ in ESQUEMAS[nombre_coleccion]]
+        self.archivo = archivo
+        self._cerrojo = BackendSQLite._cerrojo_archivo(archivo)
+        self._crear_tabla()
+
+    @property
+    def conexion(self) -> sqlite3.Connection:
+        """Conexión compartida del archivo (se vuelve a abrir si se cerró con cerrar_conexion)"""
+        return self._obtener_conexion(self.archivo)
+
+    @classmethod
+    def _cerrojo_archivo(cls, archivo: str) -> threading.RLock:
+        cerrojo = cls._cerrojos.get(archivo)
+        if cerrojo is None:
+            cerrojo = cls._cerrojos.setdefault(archivo, threading.RLock())
+        return cerrojo
+
+    @classmethod
+    def _obtener_conexion(cls, archivo: str) -> sqlite3.Connection:
+        """Abre (una sola vez por archivo) la conexión en modo WAL"""
+        conexion = cls._conexiones.get(archivo)
+        if conexion is not None:
+            return conexion
+        with cls._cerrojo_archivo(archivo):
+            if archivo not in cls._conexiones:
+                conexion = sqlite3.connect(archivo, check_same_thread=False)
+                conexion.row_factory = sqlite3.Row
+                conexion.execute('PRAGMA journal_mode=WAL')
+                conexion.execute('PRAGMA synchronous=NORMAL')
+                cls._conexiones[archivo] = conexion
+            return cls._conexiones[archivo]
+
+    @classmethod
+    def cerrar_conexion(cls, archivo: str) -> bool:
+        """Cierra la conexión de un archivo; retorna False si tiene un lote abierto (no se cierra)
+
+        Quien la llama debe asegurar que ningún otro hilo esté consultando la
+        base (BaseDAO._descargar lo hace con el cerrojo de cada colección).
+        """
+        with cls._cerrojo_archivo(archivo):
+            conexion = cls._conexiones.get(archivo)
+            if conexion is None:
+                return True
+            if conexion in cls._conexiones_en_lote:
+                return False
+            del cls._conexiones[archivo]
+            conexion.close()
+            return True
+
+    @contextmanager
+    def lote(self):
+        """Agrupa las escrituras del bloque en una sola transacción (se deshace entera si falla)"""
+        with self._cerrojo:
+            if self.conexion in BackendSQLite._conexiones_en_lote:
+                yield
+                return
+
+            BackendSQLite._conexiones_en_lote.add(self.conexion)
+            try:
+                with self.conexion:
+                    yield
+            finally:
+                BackendSQLite._conexiones_en_lote.discard(self.conexion)
+
+    @contextmanager
+    def _escritura(self):
+        """Confirma la escritura al terminar, salvo dentro de un lote"""
+        with self._cerrojo:
+            if self.conexion in BackendSQLite._conexiones_en_lote:
+                yield
+            else:
+                with self.conexion:
+                    yield
+
+    def _crear_tabla(self):
+        """Crea la tabla y sus índices si aún no existen"""
+        definicion = ', '.join(f'{nombre} {tipo}' for nombre, tipo in ESQUEMAS[self.nombre_coleccion])
+        with self._cerrojo, self.conexion:
+            self.conexion.execute(f'CREATE TABLE IF NOT EXISTS {self.nombre_coleccion} ({definicion})')
+            for sentencia in INDICES.get(self.nombre_coleccion, []):
+                self.conexion.execute(sentencia)
+
+    def _a_fila(self, elemento: Dict[str, Any]) -> List[Any]:
+        """Convierte un elemento en los valores de sus columnas (sin el ID)"""
+        valores = []
+        for columna in self.columnas[1:]:
+            valor = elemento.get(columna)
+            if isinstance(valor, bool):
+                valor = int(valor)
+            elif isinstance(valor, datetime):
+                # 'fecha' se guarda sin hora, igual que en el CSV
+                valor = valor.date().isoformat() if columna == 'fecha' else valor.isoformat()
+            valores.append(valor)
+        return valores
+
+    def _a_elemento(self, fila: sqlite3.Row) -> Dict[str, Any]:
+        """Convierte una fila en un elemento con los mismos tipos que el cargador CSV"""
+        elemento = dict(fila)
+        for columna in COLUMNAS_BOOLEANAS:
+            if columna in elemento:
+                elemento[columna] = bool(elemento[columna])
+        if elemento.get('fecha'):
+            elemento['fecha'] = datetime.fromisoformat(elemento['fecha'] + 'T00:00:00')
+        if elemento.get('fecha_creacion'):
+            elemento['fecha_creacion'] = datetime.fromisoformat(elemento['fecha_creacion'])
+        return elemento
+
+    def consultar(self, condicion: str = '', parametros: Sequence[Any] = (),
+                  orden: str = 'id') -> List[Dict[str, Any]]:
+        """Obtiene los elementos que cumplen una condición SQL"""
+        sql = f'SELECT * FROM {self.nombre_coleccion}'
+        if condicion:
+            sql += f' WHERE {condicion}'
+        sql += f' ORDER BY {orden}'
+        return [self._a_elemento(fila) for fila in self.conexion.execute(sql, tuple(parametros))]
+
+    def contar(self, condicion: str = '', parametros: Sequence[Any] = ()) -> int:
+        """Cuenta los elementos que cumplen una condición SQL"""
+        sql = f'SELECT COUNT(*) FROM {self.nombre_coleccion}'
+        if condicion:
+            sql += f' WHERE {condicion}'
+        return self.conexion.execute(sql, tuple(parametros)).fetchone()[0]
+
+    def obtener_por_id(self, id_elemento: int) -> Optional[Dict[str, Any]]:
+        """Obtiene un elemento por su ID"""
+        fila = self.conexion.execute(
+            f'SELECT * FROM {self.nombre_coleccion} WHERE id = ?', (id_elemento,)
+        ).fetchone()
+        return self._a_elemento(fila) if fila else None
+
+    def insertar(self, elemento: Dict[str, Any]) -> int:
+        """Inserta un elemento y retorna el ID asignado"""
+        columnas = ', '.join(self.columnas[1:])
+        marcadores = ', '.join('?' for _ in self.columnas[1:])
+        with self._escritura():
+            cursor = self.conexion.execute(
+                f'INSERT INTO {self.nombre_coleccion} ({columnas}) VALUES ({marcadores})',
+                self._a_fila(elemento)
+            )
+        return cursor.lastrowid
+
+    def actualizar(self, id_elemento: int, elemento: Dict[str, Any]) -> bool:
+        """Actualiza un elemento existente"""
+        asignaciones = ', '.join(f'{columna} = ?' for columna in self.columnas[1:])
+        with self._escritura():
+            cursor = self.conexion.execute(
+                f'UPDATE {self.nombre_coleccion} SET {asignaciones} WHERE id = ?',
+                self._a_fila(elemento) + [id_elemento]
+            )
+        return cursor.rowcount > 0
+
+    def eliminar(self, condicion: str, parametros: Sequence[Any] = ()) -> int:
+        """Elimina los elementos que cumplen una condición y retorna cuántos fueron"""
+        with self._escritura():
+            cursor = self.conexion.execute(
+                f'DELETE FROM {self.nombre_coleccion} WHERE {condicion}', tuple(parametros)
+            )
+        return cursor.rowcount
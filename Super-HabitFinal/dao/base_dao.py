@@ -1,134 +1,834 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Iterable, Iterator, Tuple
+import atexit
 import csv
+import io
+import json
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
+from dao.backend_sqlite import BackendSQLite
+from dao.cerrojos import CerrojoColeccion, escrituras_tomadas, lectura
+from dao.eventos import BusEventos, EventoCambio
+from dao.fila_compacta import tipo_fila
+from dao.particiones import PoolParticiones, directorio_usuario
+from dao.secuencia_ids import SecuenciaIds
+
+
+def _a_texto(valor: str) -> Optional[str]:
+    return valor if valor else None
+
+
+def _a_entero(valor: str) -> Optional[int]:
+    return int(valor) if valor else None
+
+
+def _a_booleano(valor: str) -> Optional[bool]:
+    return valor.lower() == 'true' if valor else None
+
+
+def _a_fecha_hora(valor: str) -> Any:
+    if not valor:
+        return None
+    try:
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        return valor
+
+
+def _crear_conversor_fecha() -> Callable[[str], Any]:
+    """Conversor de 'fecha' que reutiliza el datetime de cada día ya visto"""
+    vistas = {}
+    
+    def _a_fecha(valor: str) -> Any:
+        if not valor:
+            return None
+        fecha = vistas.get(valor)
+        if fecha is None:
+            # Fechas simples (solo fecha) o con hora; los datetime son inmutables
+            try:
+                fecha = datetime.fromisoformat(valor)
+            except ValueError:
+                return valor
+            vistas[valor] = fecha
+        return fecha
+    
+    return _a_fecha
+
+
+def _sincronizar_directorio(archivo: str):
+    """Sincroniza con el disco el directorio de un archivo, para que su renombre sobreviva a un corte"""
+    try:
+        descriptor = os.open(os.path.dirname(os.path.abspath(archivo)), os.O_RDONLY)
+    except OSError:
+        return  # En Windows no se pueden abrir directorios; el renombre ya es atómico
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+def _conversor_columna(campo: str) -> Callable[[str], Any]:
+    """Conversor de strings de CSV al tipo apropiado para una columna"""
+    if campo == 'id' or campo.endswith('_id') or campo == 'duracion':
+        return _a_entero
+    if campo in ('activo', 'completado'):
+        return _a_booleano
+    if campo in ('fecha_creacion', 'fecha_registro'):
+        return _a_fecha_hora
+    if campo == 'fecha':
+        return _crear_conversor_fecha()
+    return _a_texto
 
 class BaseDAO:
     """Clase base para el manejo de datos usando almacenamiento en memoria"""
     
-    # Almacenamiento compartido en memoria para todas las instancias
+    # Almacenamiento compartido en memoria para todas las instancias; cada
+    # colección se carga del disco la primera vez que se accede a ella. El
+    # estado de cada colección se guarda bajo su clave: el nombre de la
+    # colección o, si es de un usuario, 'usuario/colección'
     _almacenamiento_global = {}
-    _datos_cargados = False
+    _metricas_carga = {}
+    
+    # Índice compartido por colección: id -> posición en la lista de datos
+    _indices_id = {}
+    
+    # Diario de cambios: cada mutación agrega una línea al archivo .diario y el
+    # CSV completo solo se reescribe al compactar (cada umbral_compactacion cambios)
+    usar_diario = True
+    umbral_compactacion = 500
+    _entradas_diario = {}
     
-    def __init__(self, nombre_coleccion: str):
+    # Instantáneas CSV: se escriben en un temporal que se sincroniza con el disco
+    # (fsync) y después reemplaza al CSV de una vez; la instantánea anterior se
+    # conserva como {archivo}.1 (y las más viejas como .2, .3...) hasta
+    # copias_respaldo generaciones, para cargarla si la actual no se puede leer
+    sincronizar_disco = True
+    copias_respaldo = 1
+    
+    # Colecciones con un lote abierto (ver lote()): clave -> cambios pendientes
+    _lotes = {}
+    
+    # Escritura diferida: los cambios quedan pendientes en memoria y se escriben
+    # juntos cada cambios_por_escritura cambios, a los milisegundos_por_escritura
+    # del primero, con flush() / flush_todas() y al terminar el programa. Se
+    # puede activar también para un solo DAO (dao.escritura_diferida = True)
+    escritura_diferida = os.environ.get('SUPERHABIT_ESCRITURA_DIFERIDA', '0') == '1'
+    cambios_por_escritura = 100
+    milisegundos_por_escritura = 1000
+    _pendientes = {}  # clave -> (DAO que escribe la colección, cambios pendientes)
+    _temporizador = None
+    
+    # Modelo de concurrencia: los DAO se pueden usar desde varios hilos.
+    # - Cada colección (cada clave) tiene un CerrojoColeccion, compartido por
+    #   todos sus DAO (ver dao/cerrojos.py): las consultas lo toman para leer y
+    #   las mutaciones, los lotes y la preparación de lo que hay que escribir,
+    #   para escribir. Lo que lee y después escribe (marcar un hábito, por
+    #   ejemplo) se hace entero con el de escritura, así no se pierden cambios
+    #   ni se duplican registros. Los IDs se generan con ese cerrojo tomado, de
+    #   la secuencia compartida por la colección (_secuencias).
+    # - La carga del disco la hace un solo hilo, con el cerrojo de carga de la
+    #   colección, aunque la pidan varios lectores a la vez.
+    # - _cerrojo_pendientes protege lo compartido de la escritura diferida
+    #   (_pendientes y el temporizador) y _cerrojo_archivos los archivos. Se
+    #   toman en ese orden y siempre después del de la colección, nunca antes.
+    #   Lo que hay que escribir se arma y se encola en _trabajos (en el orden de
+    #   los cambios de cada colección) con el cerrojo de la colección tomado,
+    #   pero se escribe con el de archivos recién cuando el hilo suelta su
+    #   último cerrojo de escritura (ver _escribir_encolados): los lectores y
+    #   escritores de la colección no esperan al diario ni a las instantáneas.
+    #   Quien lee archivos sin tener la colección en memoria (al cargarla, por
+    #   ejemplo) escribe antes lo encolado y espera lo que otro hilo esté
+    #   escribiendo de esa colección (ver _esperar_escrituras), para no leer
+    #   datos viejos.
+    # - Cada método es atómico sobre su colección; lo que combina varias
+    #   colecciones (como eliminar un hábito y sus registros) no lo es. Los
+    #   avisos de cambios pueden llegar con el cerrojo de la colección tomado,
+    #   así que los suscriptores no deben esperar a otro hilo que use el DAO.
+    _cerrojos = {}  # clave -> CerrojoColeccion
+    _secuencias = {}  # clave -> SecuenciaIds de la colección cargada
+    _desordenadas = set()  # claves que ya no están en orden de ID (ver _quitar_posicion)
+    _cerrojo_pendientes = threading.RLock()
+    _cerrojo_archivos = threading.RLock()
+    _trabajos = deque()
+    _por_escribir = {}  # clave -> trabajos encolados o escribiéndose
+    _cerrojo_por_escribir = threading.Lock()  # Solo para _por_escribir, sin tomar otros
+    
+    # Backend de persistencia: 'csv' (archivos en el directorio actual, datos en
+    # memoria) o 'sqlite' (consultas directas a la base, sin cargar nada al inicio)
+    backend = os.environ.get('SUPERHABIT_BACKEND', 'csv')
+    archivo_sqlite = os.environ.get('SUPERHABIT_SQLITE', 'superhabit.db')
+    
+    # Particiones por usuario: los DAO creados con un usuario guardan sus
+    # archivos (o su base SQLite) en directorio_usuarios/<usuario>/. Solo los
+    # usuarios_residentes usados más recientemente quedan abiertos; al pasar
+    # ese límite se descarga el usado hace más tiempo (ver dao/particiones.py)
+    directorio_usuarios = os.environ.get('SUPERHABIT_USUARIOS', 'usuarios')
+    usuarios_residentes = int(os.environ.get('SUPERHABIT_USUARIOS_RESIDENTES', '64'))
+    particiones = PoolParticiones(usuarios_residentes)
+    
+    # Avisos de cambios (crear, actualizar, eliminar) para quien necesite
+    # mantener algo al día, como cachés o agregados; ver dao/eventos.py
+    eventos = BusEventos()
+    
+    # Campos de la colección; si se definen, cada elemento se guarda en memoria
+    # como una FilaCompacta (con __slots__) en lugar de un dict
+    campos: Tuple[str, ...] = ()
+    
+    def __init__(self, nombre_coleccion: str, usuario: Optional[str] = None):
         self.nombre_coleccion = nombre_coleccion
-        self._archivo_datos = f'{nombre_coleccion}.csv'
-        
-        # Solo cargar datos una vez al inicio
-        if not BaseDAO._datos_cargados:
-            self._cargar_todos_los_datos()
-            BaseDAO._datos_cargados = True
-        
-        if nombre_coleccion not in BaseDAO._almacenamiento_global:
-            BaseDAO._almacenamiento_global[nombre_coleccion] = []
-        self.datos = BaseDAO._almacenamiento_global[nombre_coleccion]
-        self._siguiente_id = self._obtener_siguiente_id()
-    
-    def _cargar_todos_los_datos(self):
-        """Carga todos los archivos de datos disponibles"""
-        archivos_datos = {
-            'habitos.csv': 'habitos',
-            'registros.csv': 'registros'
-        }
+        self.usuario = usuario
+        self._clave = nombre_coleccion
+        self._directorio = ''
+        if usuario is not None:
+            self._clave = f'{usuario}/{nombre_coleccion}'
+            self._directorio = directorio_usuario(BaseDAO.directorio_usuarios, usuario)
+            os.makedirs(self._directorio, exist_ok=True)
+        self._tipo_fila = tipo_fila(nombre_coleccion, self.campos) if self.campos else None
+        self._archivo_datos = self._ruta(f'{nombre_coleccion}.csv')
+        self._archivo_diario = self._ruta(f'{nombre_coleccion}.diario')
+        self._archivo_secuencia = self._ruta(f'{nombre_coleccion}.secuencia')
         
-        for archivo, nombre_coleccion in archivos_datos.items():
-            if os.path.exists(archivo):
+        self._backend_sqlite = None
+        if BaseDAO.backend == 'sqlite':
+            archivo_sqlite = BaseDAO.archivo_sqlite
+            if usuario is not None:
+                archivo_sqlite = self._ruta(os.path.basename(archivo_sqlite))
+            self._backend_sqlite = BackendSQLite(archivo_sqlite, nombre_coleccion)
+        
+        self._cerrojo = BaseDAO._cerrojos.get(self._clave)
+        if self._cerrojo is None:
+            self._cerrojo = BaseDAO._cerrojos.setdefault(self._clave,
+                                                         CerrojoColeccion(BaseDAO._escribir_encolados))
+    
+    def _ruta(self, nombre_archivo: str) -> str:
+        """Ruta de un archivo de la colección (en el directorio del usuario, si tiene)"""
+        return os.path.join(self._directorio, nombre_archivo)
+    
+    @property
+    def _sqlite(self) -> Optional[BackendSQLite]:
+        """Backend SQLite de la colección, o None si los datos están en memoria"""
+        if self._backend_sqlite is not None:
+            self._usar_particion()
+        return self._backend_sqlite
+    
+    def _usar_particion(self):
+        """Avisa al pool de particiones que se usan los datos de este usuario"""
+        if self.usuario is not None:
+            BaseDAO.particiones.usar(self)
+    
+    def _asegurar_cargada(self):
+        """Carga la colección del disco si todavía no está en memoria"""
+        self._usar_particion()
+        cerrojo = self._cerrojo
+        # La colección se instala antes de terminar de cargarse (ver
+        # RegistroDAO._aplicar_diario): mientras otro hilo la carga, se espera
+        if self._clave in BaseDAO._almacenamiento_global and cerrojo.cargando is None:
+            return
+        with cerrojo.carga:
+            if self._clave not in BaseDAO._almacenamiento_global:
+                self._esperar_escrituras()  # Lo que quedó por escribir al descargarla
+                cerrojo.cargando = threading.get_ident()
                 try:
-                    elementos = self._cargar_csv(archivo)
-                    if nombre_coleccion not in BaseDAO._almacenamiento_global:
-                        BaseDAO._almacenamiento_global[nombre_coleccion] = []
-                    BaseDAO._almacenamiento_global[nombre_coleccion] = elementos
-                except Exception:
-                    # Si hay error al cargar este archivo, continuar con el siguiente
-                    continue
-    
-    def _obtener_siguiente_id(self) -> int:
-        """Obtiene el siguiente ID disponible"""
-        if not self.datos:
-            return 1
-        return max(item.get('id', 0) for item in self.datos) + 1
+                    self._cargar_coleccion()
+                finally:
+                    cerrojo.cargando = None
     
-    def _generar_id(self) -> int:
-        """Genera un nuevo ID único"""
-        nuevo_id = self._siguiente_id
-        self._siguiente_id += 1
-        return nuevo_id
-    
-    def _cargar_csv(self, archivo: str) -> List[Dict[str, Any]]:
-        """Carga datos desde un archivo CSV"""
-        elementos = []
+    def en_memoria(self) -> bool:
+        """Indica si la colección ya está cargada, así que operar sobre ella no lee del disco"""
+        return self._backend_sqlite is None and self._clave in BaseDAO._almacenamiento_global
+    
+    def _descargar(self) -> bool:
+        """Escribe lo pendiente y saca de memoria la colección (la llama el pool de particiones)
+
+        Una colección con un lote abierto no se descarga: sus cambios todavía
+        no están en el diario. Retorna si se descargó.
+        """
+        with self._cerrojo.escritura():
+            if self._clave in BaseDAO._lotes:
+                return False
+            self.flush()
+            for estado in (BaseDAO._almacenamiento_global, BaseDAO._indices_id, BaseDAO._entradas_diario,
+                           BaseDAO._metricas_carga, BaseDAO._secuencias):
+                estado.pop(self._clave, None)
+            BaseDAO._desordenadas.discard(self._clave)
+            if self._backend_sqlite is not None:
+                BackendSQLite.cerrar_conexion(self._backend_sqlite.archivo)
+        return True
+    
+    @property
+    def datos(self) -> List[Dict[str, Any]]:
+        """Lista compartida de la colección, cargada del disco en el primer acceso"""
+        self._asegurar_cargada()
+        return BaseDAO._almacenamiento_global[self._clave]
+    
+    @property
+    def _indice_id(self) -> Dict[int, int]:
+        """Índice id -> posición de la colección, cargada del disco en el primer acceso"""
+        self._asegurar_cargada()
+        return BaseDAO._indices_id[self._clave]
+    
+    @property
+    def _secuencia(self) -> SecuenciaIds:
+        """Secuencia de IDs de la colección, cargada del disco en el primer acceso"""
+        self._asegurar_cargada()
+        return BaseDAO._secuencias[self._clave]
+    
+    @classmethod
+    def obtener_metricas_carga(cls) -> Dict[str, Dict[str, float]]:
+        """Retorna, por colección cargada, cuántos elementos se leyeron y en cuántos segundos"""
+        return {nombre: metricas.copy() for nombre, metricas in cls._metricas_carga.items()}
+    
+    def _cargar_coleccion(self):
+        """Carga la instantánea CSV y el diario de esta colección y construye sus índices"""
+        inicio = time.perf_counter()
+        elementos = self._leer_instantanea()
+        # El diario adelanta la secuencia con los IDs que agrega (ver _leer_diario)
+        BaseDAO._secuencias[self._clave] = self._leer_secuencia(elementos)
         try:
-            with open(archivo, 'r', newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    # Convertir tipos de datos apropiados
-                    elemento = self._convertir_tipos_csv(row)
+            elementos = self._aplicar_diario(self._archivo_diario, self._clave, elementos)
+        except Exception as e:
+            # El diario ilegible se aparta (no se pierde en la próxima compactación)
+            # y la colección queda como en la instantánea
+            danado = self._archivo_diario + '.danado'
+            print(f"⚠️ Error al aplicar {self._archivo_diario}: {e}; se guardó como {danado}")
+            try:
+                os.replace(self._archivo_diario, danado)
+            except OSError:
+                pass
+            BaseDAO._entradas_diario[self._clave] = 0
+            elementos = self._leer_instantanea()
+        
+        # Un _aplicar_diario que reaplica los cambios sobre los índices ya dejó
+        # la colección instalada con ellos al día
+        if BaseDAO._almacenamiento_global.get(self._clave) is not elementos:
+            BaseDAO._almacenamiento_global[self._clave] = elementos
+            self._reconstruir_indices()
+        BaseDAO._metricas_carga[self._clave] = {
+            'elementos': len(elementos),
+            'segundos': time.perf_counter() - inicio
+        }
+    
+    def _archivo_respaldo(self, generacion: int) -> str:
+        """Ruta de una copia de respaldo de la instantánea (1 es la más reciente)"""
+        return f'{self._archivo_datos}.{generacion}'
+    
+    def _archivos_instantanea(self) -> List[str]:
+        """Archivos de donde cargar la colección, en orden de preferencia"""
+        archivos = [self._archivo_datos]
+        archivos += [self._archivo_respaldo(generacion) for generacion in range(1, BaseDAO.copias_respaldo + 1)]
+        return archivos
+    
+    def _leer_instantanea(self) -> List[Any]:
+        """Carga la instantánea o, si falta o está dañada, la copia de respaldo más reciente que se pueda leer
+        
+        Si ninguna se puede leer, se apartan como {archivo}.danado antes de
+        empezar vacía: la próxima compactación no las pisa ni las rota.
+        """
+        ilegibles = []
+        for archivo in self._archivos_instantanea():
+            if not os.path.exists(archivo):
+                continue
+            try:
+                return self._cargar_instantanea(archivo)
+            except Exception as e:
+                print(f"⚠️ Error al cargar {archivo}: {e}")
+                ilegibles.append(archivo)
+        
+        for archivo in ilegibles:
+            danado = archivo + '.danado'
+            print(f"⚠️ No se pudo leer ninguna copia: {archivo} se guardó como {danado}")
+            try:
+                os.replace(archivo, danado)
+            except OSError:
+                pass
+        return self._crear_contenedor()
+    
+    def _cargar_instantanea(self, archivo: str) -> List[Any]:
+        """Carga un archivo de instantánea (CSV; las subclases pueden aceptar otros formatos)"""
+        return self._cargar_csv(archivo)
+    
+    def _leer_diario(self, archivo_diario: str, clave: str) -> Iterator[Dict[str, Any]]:
+        """Recorre las entradas válidas del diario y descarta la cola dañada por una escritura interrumpida"""
+        BaseDAO._entradas_diario[clave] = 0
+        if not os.path.exists(archivo_diario):
+            return
+        
+        secuencia = BaseDAO._secuencias.get(clave)
+        entradas = 0
+        bytes_validos = 0
+        with open(archivo_diario, 'rb') as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea.decode('utf-8'))
+                except ValueError:
+                    break  # Línea incompleta por una escritura interrumpida
+                if secuencia is not None:
+                    id_entrada = entrada['id'] if entrada['op'] == 'eliminar' else _a_entero(entrada['datos']['id'])
+                    if id_entrada is not None:
+                        secuencia.observar(id_entrada)
+                yield entrada
+                entradas += 1
+                bytes_validos += len(linea)
+        
+        # Descartar la cola dañada para que las siguientes entradas queden legibles
+        if bytes_validos < os.path.getsize(archivo_diario):
+            os.truncate(archivo_diario, bytes_validos)
+        
+        BaseDAO._entradas_diario[clave] = entradas
+    
+    def _aplicar_diario(self, archivo_diario: str, clave: str,
+                        elementos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Reaplica sobre la instantánea los cambios pendientes del diario"""
+        if not os.path.exists(archivo_diario):
+            BaseDAO._entradas_diario[clave] = 0
+            return elementos
+        
+        # Reaplicar por ID hace que repetir una entrada ya compactada no tenga efecto
+        posiciones = {id_elemento: posicion for posicion, id_elemento in enumerate(self._ids_desde(elementos))}
+        eliminadas = set()
+        for entrada in self._leer_diario(archivo_diario, clave):
+            if entrada['op'] == 'eliminar':
+                posicion = posiciones.pop(entrada['id'], None)
+                if posicion is not None:
+                    eliminadas.add(posicion)
+            else:
+                elemento = self._a_fila(self._convertir_tipos_csv(entrada['datos']))
+                posicion = posiciones.get(elemento['id'])
+                if posicion is None:
+                    posiciones[elemento['id']] = len(elementos)
                     elementos.append(elemento)
-        except Exception:
-            pass  # Si no se puede leer, retornar lista vacía
+                else:
+                    elementos[posicion] = elemento
+        
+        if eliminadas:
+            elementos = self._crear_contenedor(
+                elemento for posicion, elemento in enumerate(elementos) if posicion not in eliminadas
+            )
         return elementos
     
+    def _crear_contenedor(self, elementos: Iterable[Any] = ()) -> List[Any]:
+        """Crea la secuencia que guarda la colección en memoria (las subclases pueden cambiarla)"""
+        return list(elementos)
+    
+    def _ids_desde(self, elementos: List[Any], posicion: int = 0) -> Iterable[int]:
+        """IDs de los elementos a partir de una posición, en orden"""
+        return (elementos[i].get('id') for i in range(posicion, len(elementos)))
+    
+    def _reconstruir_indices(self):
+        """Recalcula los índices tras cargar o modificar masivamente los datos"""
+        datos = self.datos
+        BaseDAO._indices_id[self._clave] = dict(zip(self._ids_desde(datos), range(len(datos))))
+    
+    def _reaplicar_entrada(self, entrada: Dict[str, Any]):
+        """Aplica una entrada del diario a la colección ya instalada, manteniendo sus índices al día"""
+        datos = self.datos
+        indice = self._indice_id
+        if entrada['op'] == 'eliminar':
+            posicion = indice.pop(entrada['id'], None)
+            if posicion is None:
+                return
+            self._desindexar(self._quitar_posicion(posicion))
+            return
+        
+        fila = self._a_fila(self._convertir_tipos_csv(entrada['datos']))
+        posicion = indice.get(fila['id'])
+        if posicion is None:
+            datos.append(fila)
+            indice[fila['id']] = len(datos) - 1
+        else:
+            self._desindexar(datos[posicion])
+            datos[posicion] = fila
+        self._indexar(fila)
+    
+    def _quitar_posicion(self, posicion: int) -> Any:
+        """Quita el elemento de una posición (ya sacado del índice por ID) y lo retorna
+
+        El último elemento pasa a ocupar su lugar, así que solo se corrige la
+        posición de ese en el índice en lugar de correr todos los posteriores.
+        La colección queda fuera del orden por ID hasta la próxima instantánea
+        (ver _ordenar_por_id).
+        """
+        datos = self.datos
+        item = datos[posicion]
+        ultimo = datos.pop()
+        if posicion < len(datos):
+            datos[posicion] = ultimo
+            self._indice_id[ultimo['id']] = posicion
+            BaseDAO._desordenadas.add(self._clave)
+        return item
+    
+    def _ordenar_por_id(self):
+        """Devuelve la colección al orden por ID, con su índice, si eliminar la desordenó"""
+        if self._clave not in BaseDAO._desordenadas:
+            return
+        datos = self.datos
+        datos.sort(key=lambda elemento: elemento['id'] or 0)
+        BaseDAO._indices_id[self._clave] = dict(zip(self._ids_desde(datos), range(len(datos))))
+        BaseDAO._desordenadas.discard(self._clave)
+    
+    def _indexar(self, elemento: Dict[str, Any]):
+        """Agrega un elemento a los índices secundarios (las subclases lo redefinen)"""
+        pass
+    
+    def _desindexar(self, elemento: Dict[str, Any]):
+        """Quita un elemento de los índices secundarios (las subclases lo redefinen)"""
+        pass
+    
+    def _obtener_siguiente_id(self, elementos: List[Any]) -> int:
+        """Siguiente ID según los elementos (para datos guardados antes de existir la secuencia)"""
+        return max(self._ids_desde(elementos), default=0) + 1
+    
+    def _leer_secuencia(self, elementos: List[Any]) -> SecuenciaIds:
+        """Secuencia guardada junto a la instantánea o, si no hay, calculada una vez a partir de los IDs"""
+        try:
+            with open(self._archivo_secuencia, 'r', encoding='utf-8') as f:
+                return SecuenciaIds(int(f.read()))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Error al leer {self._archivo_secuencia}: {e}")
+        # La próxima instantánea la guarda
+        return SecuenciaIds(self._obtener_siguiente_id(elementos))
+    
+    def _guardar_secuencia(self, siguiente_id: int):
+        """Escribe la secuencia en un temporal que reemplaza al archivo (los errores se propagan)"""
+        temporal = self._archivo_secuencia + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(str(siguiente_id))
+            if BaseDAO.sincronizar_disco:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporal, self._archivo_secuencia)
+    
+    def _generar_id(self) -> int:
+        """Genera un nuevo ID único (con el cerrojo de la colección tomado para escribir)"""
+        return self._secuencia.generar()
+    
+    def _cargar_csv(self, archivo: str, elementos: Optional[List[Any]] = None) -> List[Any]:
+        """Carga datos desde un archivo CSV (agregándolos al contenedor recibido, si hay)
+
+        Los errores de lectura se propagan: un CSV dañado no debe cargarse como
+        una colección vacía o a medias.
+        """
+        if elementos is None:
+            elementos = self._crear_contenedor()
+        for elemento in self._leer_csv(archivo):
+            elementos.append(elemento)
+        return elementos
+    
+    def _leer_csv(self, archivo: str) -> Iterator[Any]:
+        """Recorre un CSV fila por fila, entregando cada elemento ya convertido a su forma en memoria"""
+        with open(archivo, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            campos = next(reader, None)
+            if not campos:
+                return
+            
+            # La tabla de conversores se arma una sola vez a partir del encabezado
+            conversores = self._compilar_conversores(campos)
+            leer_fila = self._tipo_fila.crear_lector(campos, conversores) if self._tipo_fila else None
+            columnas = list(zip(campos, conversores))
+            total_campos = len(campos)
+            for fila in reader:
+                if len(fila) < total_campos:
+                    fila += [''] * (total_campos - len(fila))
+                if leer_fila is not None:
+                    yield leer_fila(fila)
+                else:
+                    yield self._a_fila({campo: convertir(valor) for (campo, convertir), valor in zip(columnas, fila)})
+    
+    def _a_fila(self, elemento: Dict[str, Any]) -> Any:
+        """Forma en que se guarda un elemento en memoria (fila compacta o dict)"""
+        if self._tipo_fila is None:
+            return elemento
+        return self._tipo_fila(elemento)
+    
+    def _compilar_conversores(self, campos: List[str]) -> List[Callable[[str], Any]]:
+        """Elige la función de conversión de cada columna según su nombre"""
+        return [_conversor_columna(campo) for campo in campos]
+    
     def _convertir_tipos_csv(self, row: Dict[str, str]) -> Dict[str, Any]:
         """Convierte strings de CSV a tipos de datos apropiados"""
-        elemento = {}
-        for key, value in row.items():
-            if not value:  # Valor vacío
-                elemento[key] = None
-            elif key == 'id' or key.endswith('_id'):
-                elemento[key] = int(value)
-            elif key in ['duracion']:
-                elemento[key] = int(value)
-            elif key in ['activo', 'completado']:
-                elemento[key] = value.lower() == 'true'
-            elif key in ['fecha_creacion', 'fecha_registro'] and value:
-                try:
-                    # Si ya es datetime, mantenerlo
-                    if isinstance(value, datetime):
-                        elemento[key] = value
-                    else:
-                        elemento[key] = datetime.fromisoformat(value)
-                except:
-                    elemento[key] = value
-            elif key == 'fecha' and value:
-                try:
-                    # Para fechas simples (solo fecha, no datetime)
-                    from datetime import datetime as dt
-                    if isinstance(value, str):
-                        if 'T' in value:
-                            elemento[key] = dt.fromisoformat(value)
-                        else:
-                            elemento[key] = dt.fromisoformat(value + 'T00:00:00')
-                    else:
-                        elemento[key] = value
-                except:
-                    elemento[key] = value
-            else:
-                elemento[key] = value
-        return elemento
+        return {key: _conversor_columna(key)(value) for key, value in row.items()}
     
-    def _guardar_datos(self):
-        """Guarda los datos actuales en un archivo CSV"""
-        try:
-            if not self.datos:
-                # Si no hay datos, crear/sobrescribir archivo vacío
-                if os.path.exists(self._archivo_datos):
-                    os.remove(self._archivo_datos)
+    @contextmanager
+    def lote(self):
+        """Agrupa las mutaciones hechas dentro del bloque para persistirlas de una sola vez
+
+        Con el diario, todos los cambios se escriben juntos al salir del bloque
+        (una sola escritura en lugar de una por cambio); con SQLite el bloque es
+        una única transacción. Los lotes anidados se suman al exterior. El
+        bloque entero tiene el cerrojo de la colección tomado para escribir.
+        """
+        with self._cerrojo.escritura():
+            if self._sqlite is not None:
+                with self._sqlite.lote():
+                    yield
                 return
             
-            # Obtener campos del primer elemento
-            campos = list(self.datos[0].keys())
+            if self._clave in BaseDAO._lotes:
+                yield
+                return
             
-            with open(self._archivo_datos, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=campos)
+            BaseDAO._lotes[self._clave] = []
+            try:
+                yield
+            finally:
+                # Lo aplicado en memoria se persiste aunque el bloque termine con error
+                self._persistir(BaseDAO._lotes.pop(self._clave))
+    
+    def _registrar_cambio(self, operacion: str, elemento: Dict[str, Any]) -> bool:
+        """Persiste una mutación: una línea en el diario o la reescritura del CSV"""
+        pendientes = BaseDAO._lotes.get(self._clave)
+        if pendientes is not None:
+            pendientes.append((operacion, elemento))
+            return True
+        return self._persistir([(operacion, elemento)])
+    
+    def _persistir(self, cambios: List[Tuple[str, Dict[str, Any]]]) -> bool:
+        """Escribe los cambios ya o, con escritura diferida, los deja pendientes"""
+        if not self.escritura_diferida:
+            return self._escribir(cambios)
+        
+        with BaseDAO._cerrojo_pendientes:
+            pendientes = BaseDAO._pendientes.setdefault(self._clave, (self, []))[1]
+            pendientes.extend(cambios)
+            if len(pendientes) >= BaseDAO.cambios_por_escritura:
+                BaseDAO._programar_flush(0)
+            else:
+                BaseDAO._programar_flush(BaseDAO.milisegundos_por_escritura / 1000)
+        return True
+    
+    @staticmethod
+    def _programar_flush(segundos: float):
+        """Programa en otro hilo la escritura de los pendientes (con el cerrojo de pendientes tomado)"""
+        if BaseDAO._temporizador is not None:
+            if BaseDAO._temporizador.interval <= segundos:
+                return  # Ya hay una escritura programada para antes
+            BaseDAO._temporizador.cancel()
+        temporizador = threading.Timer(segundos, BaseDAO.flush_todas)
+        temporizador.daemon = True
+        BaseDAO._temporizador = temporizador
+        temporizador.start()
+    
+    def flush(self) -> bool:
+        """Escribe ya los cambios pendientes de esta colección"""
+        escritos = self._escribir()
+        # Esperar también a la escritura que otro hilo pueda tener en curso
+        with BaseDAO._cerrojo_archivos:
+            return escritos
+    
+    @classmethod
+    def flush_todas(cls) -> bool:
+        """Escribe ya los cambios pendientes de todas las colecciones"""
+        with BaseDAO._cerrojo_pendientes:
+            if BaseDAO._temporizador is not None:
+                BaseDAO._temporizador.cancel()
+                BaseDAO._temporizador = None
+            daos = [dao for dao, _ in BaseDAO._pendientes.values()]
+        
+        escritos = True
+        for dao in daos:
+            escritos = dao.flush() and escritos
+        with BaseDAO._cerrojo_archivos:
+            return escritos
+    
+    def _escribir(self, cambios: Optional[List[Tuple[str, Dict[str, Any]]]] = None, compactar: bool = False) -> bool:
+        """Persiste los cambios recibidos, precedidos por los pendientes de la colección
+        
+        Lo que hay que escribir se arma con el cerrojo de la colección tomado
+        para escribir (es rápido) y se encola; los archivos se escriben al
+        soltar el hilo su último cerrojo de escritura, solo con el cerrojo de
+        archivos. Retorna si se escribió; si el hilo sigue con un cerrojo de
+        escritura tomado (una mutación dentro de otra, un lote), queda
+        encolado y retorna True.
+        """
+        with self._cerrojo.escritura():
+            with BaseDAO._cerrojo_pendientes:
+                _, pendientes = BaseDAO._pendientes.pop(self._clave, (None, []))
+            cambios = pendientes + list(cambios or ())
+            if not cambios and not compactar:
+                return True
+            trabajo = self._preparar_escritura(cambios, compactar)
+            trabajo['cambios'] = cambios
+            with BaseDAO._cerrojo_por_escribir:
+                BaseDAO._por_escribir[self._clave] = BaseDAO._por_escribir.get(self._clave, 0) + 1
+            BaseDAO._trabajos.append((self, trabajo))
+        
+        if 'escrito' not in trabajo and not escrituras_tomadas():
+            BaseDAO._procesar_trabajos()  # Lo tomó otro hilo: esperar a que termine
+        return trabajo.get('escrito', True)
+    
+    @staticmethod
+    def _escribir_encolados():
+        """Escribe lo encolado, si hay algo (CerrojoColeccion la llama al soltar el hilo su último cerrojo de escritura)"""
+        if BaseDAO._trabajos:
+            BaseDAO._procesar_trabajos()
+    
+    def _esperar_escrituras(self):
+        """Escribe lo encolado de la colección y espera lo que otro hilo ya esté escribiendo (antes de leer sus archivos)"""
+        if BaseDAO._por_escribir.get(self._clave):
+            BaseDAO._procesar_trabajos()
+    
+    @staticmethod
+    def _procesar_trabajos():
+        """Escribe en orden los trabajos encolados, incluidos los de otros hilos"""
+        fallidos = []
+        with BaseDAO._cerrojo_archivos:
+            while BaseDAO._trabajos:
+                dao, trabajo = BaseDAO._trabajos.popleft()
+                try:
+                    trabajo['escrito'] = dao._ejecutar_escritura(trabajo)
+                finally:
+                    with BaseDAO._cerrojo_por_escribir:
+                        if BaseDAO._por_escribir[dao._clave] == 1:
+                            del BaseDAO._por_escribir[dao._clave]
+                        else:
+                            BaseDAO._por_escribir[dao._clave] -= 1
+                if not trabajo['escrito'] and dao.escritura_diferida and trabajo['cambios']:
+                    fallidos.append((dao, trabajo['cambios']))
+        
+        # Conservarlos (antes que los llegados después) para el próximo intento
+        with BaseDAO._cerrojo_pendientes:
+            for dao, cambios in reversed(fallidos):
+                BaseDAO._pendientes.setdefault(dao._clave, (dao, []))[1][:0] = cambios
+    
+    def _linea_diario(self, operacion: str, elemento: Dict[str, Any]) -> str:
+        """Entrada del diario (una línea JSON) para una mutación"""
+        if operacion == 'eliminar':
+            entrada = {'op': operacion, 'id': elemento['id']}
+        else:
+            entrada = {'op': operacion, 'datos': self._convertir_para_csv(elemento)}
+        return json.dumps(entrada, ensure_ascii=False) + '\n'
+    
+    def _preparar_escritura(self, cambios: List[Tuple[str, Dict[str, Any]]], compactar: bool) -> Dict[str, Any]:
+        """Arma, con el cerrojo de la colección tomado, las líneas del diario o la instantánea a escribir"""
+        trabajo = {'lineas': [], 'instantanea': None}
+        if BaseDAO.usar_diario:
+            trabajo['lineas'] = [self._linea_diario(operacion, elemento) for operacion, elemento in cambios]
+        
+        entradas = BaseDAO._entradas_diario.get(self._clave, 0) + len(cambios)
+        if compactar or not BaseDAO.usar_diario or entradas >= BaseDAO.umbral_compactacion:
+            # La instantánea ya incluye lo que haya en un lote abierto; repetirlo
+            # después en el diario nuevo podría revivir elementos ya eliminados
+            lote = BaseDAO._lotes.get(self._clave)
+            if lote:
+                if BaseDAO.usar_diario:
+                    trabajo['lineas'] += [self._linea_diario(operacion, elemento) for operacion, elemento in lote]
+                lote.clear()
+            # Se reordena solo acá, no en cada listado: la instantánea queda por ID
+            self._ordenar_por_id()
+            trabajo['instantanea'] = self._copiar_datos()
+            trabajo['siguiente_id'] = self._secuencia.siguiente
+            entradas = 0
+        BaseDAO._entradas_diario[self._clave] = entradas
+        return trabajo
+    
+    def _ejecutar_escritura(self, trabajo: Dict[str, Any]) -> bool:
+        """Escribe lo armado por _preparar_escritura (con el cerrojo de archivos tomado)"""
+        if trabajo['instantanea'] is not None:
+            if self._guardar_datos(trabajo['instantanea'], trabajo['siguiente_id']):
+                if os.path.exists(self._archivo_diario):
+                    os.remove(self._archivo_diario)
+                trabajo['instantanea_escrita'] = True
+                return True
+            if not trabajo['lineas']:
+                return False
+            # Si la instantánea no se pudo escribir, los cambios quedan en el diario
+            BaseDAO._entradas_diario[self._clave] = (
+                BaseDAO._entradas_diario.get(self._clave, 0) + len(trabajo['lineas']))
+        
+        if trabajo['lineas']:
+            try:
+                with open(self._archivo_diario, 'a', encoding='utf-8') as f:
+                    f.write(''.join(trabajo['lineas']))
+            except Exception as e:
+                print(f"⚠️ Error al guardar datos: {e}")
+                return False
+        return True
+    
+    def _compactar(self) -> bool:
+        """Reescribe la instantánea CSV (con los cambios pendientes) y vacía el diario de cambios"""
+        return self._escribir(compactar=True)
+    
+    def _copiar_datos(self) -> List[Any]:
+        """Copia de la colección para escribirla sin su cerrojo (las filas se reemplazan, no se modifican)"""
+        return list(self.datos)
+    
+    def _guardar_datos(self, datos: Optional[List[Any]] = None, siguiente_id: Optional[int] = None) -> bool:
+        """Guarda los datos actuales (o la copia recibida) como instantánea, con su secuencia de IDs
+
+        Se escribe un temporal, se sincroniza con el disco y recién entonces
+        reemplaza a la instantánea, así que una interrupción deja la anterior
+        o la nueva, nunca una a medio escribir. La secuencia se guarda antes:
+        si la instantánea no llega a escribirse, queda adelantada, nunca atrás.
+        """
+        if datos is None:
+            datos = self.datos
+        if siguiente_id is None:
+            siguiente_id = self._secuencia.siguiente
+        try:
+            self._guardar_secuencia(siguiente_id)
+            self._guardar_instantanea(self._archivo_datos, datos, rotar_respaldos=True)
+        except Exception as e:
+            print(f"⚠️ Error al guardar datos: {e}")
+            return False
+        return True
+    
+    def _guardar_instantanea(self, archivo: str, datos: List[Any], rotar_respaldos: bool = False):
+        """Escribe una instantánea en un temporal y la pone en lugar del archivo (los errores se propagan)"""
+        temporal = archivo + '.tmp'
+        with open(temporal, 'wb') as f:
+            self._escribir_instantanea(f, archivo, datos)
+            if BaseDAO.sincronizar_disco:
+                f.flush()
+                os.fsync(f.fileno())
+        
+        if rotar_respaldos:
+            self._rotar_respaldos()
+        os.replace(temporal, archivo)
+        if BaseDAO.sincronizar_disco:
+            _sincronizar_directorio(archivo)
+    
+    def _escribir_instantanea(self, f, archivo: str, datos: List[Any]):
+        """Escribe los datos como CSV en un archivo abierto en modo binario (las subclases pueden cambiar el formato)"""
+        # Sin datos queda solo el encabezado: el CSV nunca se borra
+        campos = self._campos_instantanea(datos)
+        texto = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        try:
+            if campos:
+                writer = csv.DictWriter(texto, fieldnames=campos)
                 writer.writeheader()
                 
-                for elemento in self.datos:
+                for elemento in datos:
                     # Convertir datetime a string para CSV
                     elemento_csv = self._convertir_para_csv(elemento)
                     writer.writerow(elemento_csv)
-                    
-        except Exception as e:
-            print(f"⚠️ Error al guardar datos: {e}")
+            texto.flush()
+        finally:
+            texto.detach()
+    
+    def _campos_instantanea(self, datos: List[Any]) -> List[str]:
+        """Encabezado del CSV: los campos y, al final, las columnas de más que tenga algún elemento"""
+        campos = dict.fromkeys(self.campos)
+        for elemento in datos:
+            campos.update(dict.fromkeys(elemento.keys()))
+        return list(campos)
+    
+    def _rotar_respaldos(self):
+        """Corre una generación las copias de respaldo y pasa la instantánea actual a {archivo}.1"""
+        if BaseDAO.copias_respaldo <= 0 or not os.path.exists(self._archivo_datos):
+            return
+        for generacion in range(BaseDAO.copias_respaldo - 1, 0, -1):
+            if os.path.exists(self._archivo_respaldo(generacion)):
+                os.replace(self._archivo_respaldo(generacion), self._archivo_respaldo(generacion + 1))
+        # Hasta que el temporal tome su lugar no hay CSV; al cargar se usa esta copia
+        os.replace(self._archivo_datos, self._archivo_respaldo(1))
     
     def _convertir_para_csv(self, elemento: Dict[str, Any]) -> Dict[str, str]:
         """Convierte tipos de datos a strings para CSV"""
@@ -149,40 +849,116 @@ class BaseDAO:
                 elemento_csv[key] = str(value)
         return elemento_csv
     
+    @lectura
     def obtener_todos(self) -> List[Dict[str, Any]]:
         """Obtiene todos los elementos"""
-        return self.datos.copy()
+        if self._sqlite is not None:
+            return self._sqlite.consultar()
+        datos = self.datos.copy()
+        if self._clave in BaseDAO._desordenadas:
+            # Eliminar movió elementos desde la última instantánea: se entregan
+            # por ID, como en SQLite
+            datos.sort(key=lambda elemento: elemento['id'] or 0)
+        return datos
     
+    @lectura
     def obtener_por_id(self, id_elemento: int) -> Optional[Dict[str, Any]]:
         """Obtiene un elemento por su ID"""
-        for item in self.datos:
-            if item.get('id') == id_elemento:
-                return item.copy()
-        return None
+        if self._sqlite is not None:
+            return self._sqlite.obtener_por_id(id_elemento)
+        
+        posicion = self._indice_id.get(id_elemento)
+        if posicion is None:
+            return None
+        return self.datos[posicion].copy()
+    
+    def _publicar(self, suscriptores, operacion: str, id_elemento: int,
+                  anterior: Optional[Dict[str, Any]], nuevo: Optional[Dict[str, Any]]):
+        """Avisa un cambio a los suscriptores de la colección"""
+        BaseDAO.eventos.publicar(suscriptores, EventoCambio(self.nombre_coleccion, operacion,
+                                                            id_elemento, anterior, nuevo, self.usuario))
     
     def crear(self, elemento: Dict[str, Any]) -> Dict[str, Any]:
         """Crea un nuevo elemento"""
-        elemento['id'] = self._generar_id()
-        self.datos.append(elemento)
-        self._guardar_datos()
+        suscriptores = BaseDAO.eventos.suscriptores(self.nombre_coleccion)
+        if self._sqlite is not None:
+            with self._cerrojo.escritura():
+                elemento['id'] = self._sqlite.insertar(elemento)
+        else:
+            with self._cerrojo.escritura():
+                elemento['id'] = self._generar_id()
+                fila = self._a_fila(elemento)
+                datos = self.datos
+                datos.append(fila)
+                self._indice_id[elemento['id']] = len(datos) - 1
+                self._indexar(fila)
+                self._registrar_cambio('insertar', fila)
+        
+        if suscriptores:
+            self._publicar(suscriptores, EventoCambio.CREAR, elemento['id'], None, elemento.copy())
         return elemento.copy()
     
     def actualizar(self, id_elemento: int, elemento: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Actualiza un elemento existente"""
-        for i, item in enumerate(self.datos):
-            if item.get('id') == id_elemento:
+        suscriptores = BaseDAO.eventos.suscriptores(self.nombre_coleccion)
+        anterior = None
+        if self._sqlite is not None:
+            with self._cerrojo.escritura():
+                if suscriptores:
+                    anterior = self._sqlite.obtener_por_id(id_elemento)
                 elemento['id'] = id_elemento
-                self.datos[i] = elemento
-                self._guardar_datos()
-                return elemento.copy()
-        return None
+                if not self._sqlite.actualizar(id_elemento, elemento):
+                    return None
+        else:
+            with self._cerrojo.escritura():
+                posicion = self._indice_id.get(id_elemento)
+                if posicion is None:
+                    return None
+                
+                elemento['id'] = id_elemento
+                fila_anterior = self.datos[posicion]
+                if self._tipo_fila is not None:
+                    # Las columnas que el modelo no conoce se conservan al actualizar
+                    for campo, valor in fila_anterior.extras().items():
+                        elemento.setdefault(campo, valor)
+                fila = self._a_fila(elemento)
+                if suscriptores:
+                    anterior = fila_anterior.copy()
+                self._desindexar(fila_anterior)
+                self.datos[posicion] = fila
+                self._indexar(fila)
+                self._registrar_cambio('actualizar', fila)
+        
+        if suscriptores:
+            self._publicar(suscriptores, EventoCambio.ACTUALIZAR, id_elemento, anterior, elemento.copy())
+        return elemento.copy()
     
     def eliminar(self, id_elemento: int) -> bool:
         """Elimina un elemento por su ID"""
-        for i, item in enumerate(self.datos):
-            if item.get('id') == id_elemento:
-                del self.datos[i]
-                self._guardar_datos()
-                return True
-        return False
+        suscriptores = BaseDAO.eventos.suscriptores(self.nombre_coleccion)
+        anterior = None
+        if self._sqlite is not None:
+            with self._cerrojo.escritura():
+                if suscriptores:
+                    anterior = self._sqlite.obtener_por_id(id_elemento)
+                if self._sqlite.eliminar('id = ?', (id_elemento,)) == 0:
+                    return False
+        else:
+            with self._cerrojo.escritura():
+                posicion = self._indice_id.pop(id_elemento, None)
+                if posicion is None:
+                    return False
+                
+                item = self._quitar_posicion(posicion)
+                self._desindexar(item)
+                self._registrar_cambio('eliminar', item)
+                if suscriptores:
+                    anterior = item.copy()
+        
+        if suscriptores:
+            self._publicar(suscriptores, EventoCambio.ELIMINAR, id_elemento, anterior, None)
+        return True
+
 
+# Lo que la escritura diferida tenga pendiente se guarda al terminar el programa
+atexit.register(BaseDAO.flush_todas)
@@ -0,0 +1,172 @@
+import functools
+import threading
+from typing import Any, Callable, Optional
+
+# Cantidad de colecciones que cada hilo tiene tomadas para escribir
+_escrituras_del_hilo = threading.local()
+
+
+def escrituras_tomadas() -> int:
+    """Cantidad de colecciones que el hilo actual tiene tomadas para escribir"""
+    return getattr(_escrituras_del_hilo, 'cantidad', 0)
+
+
+class _Lectura:
+    """Bloque with que toma el cerrojo de una colección para leer"""
+    __slots__ = ('_cerrojo',)
+
+    def __init__(self, cerrojo: 'CerrojoColeccion'):
+        self._cerrojo = cerrojo
+
+    def __enter__(self):
+        self._cerrojo.adquirir_lectura()
+
+    def __exit__(self, *excepcion):
+        self._cerrojo.liberar_lectura()
+
+
+class _Escritura:
+    """Bloque with que toma el cerrojo de una colección para escribir"""
+    __slots__ = ('_cerrojo',)
+
+    def __init__(self, cerrojo: 'CerrojoColeccion'):
+        self._cerrojo = cerrojo
+
+    def __enter__(self):
+        self._cerrojo.adquirir_escritura()
+
+    def __exit__(self, *excepcion):
+        self._cerrojo.liberar_escritura()
+
+
+class CerrojoColeccion:
+    """Cerrojo de lectores y escritor de una colección, compartido por todos sus DAO
+
+    Muchos hilos pueden leer a la vez, o uno solo escribir. Es reentrante:
+    quien escribe puede volver a tomarlo para leer o escribir y quien lee
+    puede volver a leer. Pasar de lectura a escritura en el mismo hilo es un
+    error (dos lectores que lo intentaran se esperarían para siempre). Con un
+    escritor esperando no entran lectores nuevos, para que una corriente de
+    lecturas no lo deje sin turno.
+
+    Aparte, carga es el cerrojo con el que se carga la colección del disco
+    una sola vez aunque la pidan varios lectores a la vez; cargando es el
+    hilo que la está cargando (ver BaseDAO._asegurar_cargada).
+
+    al_liberar se llama cuando un hilo suelta el último cerrojo de escritura
+    que tenía, de esta colección o de cualquier otra, ya sin ninguno tomado
+    (BaseDAO escribe ahí en disco lo que encoló).
+    """
+
+    def __init__(self, al_liberar: Optional[Callable[[], None]] = None):
+        self._mutex = threading.Lock()
+        self._condicion = threading.Condition(self._mutex)
+        self._lectores = 0  # Hilos leyendo (sin contar al escritor)
+        self._escritores_esperando = 0
+        self._escritor: Optional[int] = None
+        self._escrituras = 0  # Veces que el escritor tomó el cerrojo
+        self._hilo = threading.local()  # Lecturas anidadas de cada hilo
+        self._lectura = _Lectura(self)
+        self._escritura = _Escritura(self)
+        self.carga = threading.RLock()
+        self.cargando: Optional[int] = None
+        self._al_liberar = al_liberar
+
+    def lectura(self) -> _Lectura:
+        """Bloque with de lectura"""
+        return self._lectura
+
+    def escritura(self) -> _Escritura:
+        """Bloque with de escritura"""
+        return self._escritura
+
+    def escribiendo(self) -> bool:
+        """Indica si el hilo actual tiene el cerrojo tomado para escribir"""
+        return self._escritor == threading.get_ident()
+
+    def adquirir_lectura(self):
+        hilo = self._hilo
+        lecturas = getattr(hilo, 'lecturas', 0)
+        if lecturas or self._escritor == threading.get_ident():
+            hilo.lecturas = lecturas + 1
+            return
+        # El mutex es el de la condición: tomarlo directo es más rápido
+        with self._mutex:
+            while self._escritor is not None or self._escritores_esperando:
+                self._condicion.wait()
+            self._lectores += 1
+        hilo.lecturas = 1
+
+    def liberar_lectura(self):
+        hilo = self._hilo
+        lecturas = hilo.lecturas - 1
+        hilo.lecturas = lecturas
+        if lecturas or self._escritor == threading.get_ident():
+            return
+        with self._mutex:
+            self._lectores -= 1
+            if not self._lectores and self._escritores_esperando:
+                self._condicion.notify_all()
+
+    def adquirir_escritura(self, bloquear: bool = True) -> bool:
+        """Toma el cerrojo para escribir; sin bloquear, retorna False si no está libre"""
+        hilo = threading.get_ident()
+        if self._escritor == hilo:
+            self._escrituras += 1
+            return True
+        if getattr(self._hilo, 'lecturas', 0):
+            if not bloquear:
+                return False
+            raise RuntimeError("No se puede tomar para escribir un cerrojo que el mismo hilo tiene para leer")
+        with self._mutex:
+            if not bloquear:
+                if self._escritor is not None or self._lectores:
+                    return False
+            else:
+                self._escritores_esperando += 1
+                try:
+                    while self._escritor is not None or self._lectores:
+                        self._condicion.wait()
+                finally:
+                    self._escritores_esperando -= 1
+            self._escritor = hilo
+            self._escrituras = 1
+        _escrituras_del_hilo.cantidad = getattr(_escrituras_del_hilo, 'cantidad', 0) + 1
+        return True
+
+    def liberar_escritura(self):
+        self._escrituras -= 1
+        if self._escrituras:
+            return
+        with self._mutex:
+            self._escritor = None
+            self._condicion.notify_all()
+        _escrituras_del_hilo.cantidad -= 1
+        if not _escrituras_del_hilo.cantidad and self._al_liberar is not None:
+            self._al_liberar()
+
+
+def lectura(metodo: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorador para métodos de un DAO que corren con el cerrojo de su colección tomado para leer"""
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        cerrojo = self._cerrojo
+        cerrojo.adquirir_lectura()
+        try:
+            return metodo(self, *args, **kwargs)
+        finally:
+            cerrojo.liberar_lectura()
+    return envoltura
+
+
+def escritura(metodo: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorador para métodos de un DAO que corren con el cerrojo de su colección tomado para escribir"""
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        cerrojo = self._cerrojo
+        cerrojo.adquirir_escritura()
+        try:
+            return metodo(self, *args, **kwargs)
+        finally:
+            cerrojo.liberar_escritura()
+    return envoltura
@@ -0,0 +1,317 @@
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Type
+
+from dao.fila_compacta import FilaCompacta
+
+# Valor de las columnas numéricas cuando el registro no tiene ese dato
+SIN_VALOR = -1
+
+_UN_MICROSEGUNDO = timedelta(microseconds=1)
+
+
+def _a_ordinal(fecha: Any) -> int:
+    """Día (ordinal) de una fecha en cualquiera de los formatos de los registros"""
+    if isinstance(fecha, date):  # También cubre datetime
+        return fecha.toordinal()
+    if isinstance(fecha, str):
+        return datetime.fromisoformat(fecha).toordinal()
+    raise ValueError(f"Fecha no reconocida: {fecha!r}")
+
+
+def _a_microsegundos(fecha_hora: Any) -> int:
+    """Microsegundos desde 0001-01-01 de un datetime o de su texto ISO"""
+    if isinstance(fecha_hora, str):
+        fecha_hora = datetime.fromisoformat(fecha_hora)
+    return (fecha_hora - datetime.min) // _UN_MICROSEGUNDO
+
+
+class ColumnasRegistros:
+    """Colección de registros de cumplimiento guardada por columnas
+
+    En lugar de una fila por registro, cada campo vive en su propio array:
+    ids, hábitos y fechas (como ordinal de día) en array('i'), completado como
+    un bit por registro y fecha_completado en microsegundos. Las notas van en
+    una tabla aparte por ID porque casi ningún registro tiene. Hacia afuera se
+    comporta como la lista de filas de BaseDAO (len, [], append, pop...) y solo
+    arma una fila cuando alguien la pide. pop no conserva el orden: mueve el
+    último registro al lugar del quitado, sin correr las columnas. Como las
+    columnas son de 32 bits, los IDs no pasan de SecuenciaIds.ID_MAXIMO.
+    """
+
+    def __init__(self, tipo_fila: Type[FilaCompacta], elementos: Iterable[Any] = ()):
+        self._tipo_fila = tipo_fila
+        self.ids = array('i')
+        self.habito_ids = array('i')
+        self.ordinales = array('i')
+        self._bits_completado = bytearray()
+        self._fechas_completado = array('q')
+        self._notas: Dict[int, str] = {}
+        # Valores que no encajan en su columna (p. ej. una fecha ilegible) y
+        # columnas que no son campos de la fila, por ID
+        self._extras: Dict[int, Dict[str, Any]] = {}
+        # Un datetime por día ya entregado, compartido por todas las filas de ese día
+        self._dias: Dict[int, datetime] = {}
+        # Líneas de tiempo y agregados por hábito leídos junto con una instantánea
+        # binaria; solo valen mientras la colección no se modifique
+        self.lineas_tiempo_guardadas: Optional[Dict[int, Tuple[array, array]]] = None
+        self.agregados_guardados: Optional[Dict[str, Dict[str, Any]]] = None
+        self.extend(elementos)
+
+    @classmethod
+    def desde_columnas(cls, tipo_fila: Type[FilaCompacta], ids: array, habito_ids: array, ordinales: array,
+                       fechas_completado: array, bits_completado: bytearray, notas: Dict[int, str],
+                       extras: Dict[int, Dict[str, Any]]) -> 'ColumnasRegistros':
+        """Arma la colección directamente con columnas ya leídas (las usa tal cual, sin copiarlas)"""
+        columnas = cls(tipo_fila)
+        columnas.ids = ids
+        columnas.habito_ids = habito_ids
+        columnas.ordinales = ordinales
+        columnas._fechas_completado = fechas_completado
+        columnas._bits_completado = bits_completado
+        columnas._notas = notas
+        columnas._extras = extras
+        return columnas
+
+    def columnas(self) -> Dict[str, Any]:
+        """Columnas y tablas laterales tal como están guardadas, para escribirlas en otro formato"""
+        return {
+            'ids': self.ids,
+            'habito_ids': self.habito_ids,
+            'ordinales': self.ordinales,
+            'fechas_completado': self._fechas_completado,
+            'bits_completado': self._bits_completado,
+            'notas': self._notas,
+            'extras': self._extras,
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[FilaCompacta]:
+        for posicion in range(len(self.ids)):
+            yield self[posicion]
+
+    def __getitem__(self, posicion: int) -> FilaCompacta:
+        posicion = self._normalizar_posicion(posicion)
+        registro_id = self.ids[posicion]
+        habito_id = self.habito_ids[posicion]
+        ordinal = self.ordinales[posicion]
+        microsegundos = self._fechas_completado[posicion]
+
+        datos = {
+            'id': None if registro_id == SIN_VALOR else registro_id,
+            'habito_id': None if habito_id == SIN_VALOR else habito_id,
+            'fecha': None if ordinal == SIN_VALOR else self._dia(ordinal),
+            'completado': self.completado_en(posicion),
+            'fecha_completado': (None if microsegundos == SIN_VALOR
+                                 else (datetime.min + microsegundos * _UN_MICROSEGUNDO).isoformat()),
+            'nota': self._notas.get(registro_id),
+        }
+        datos.update(self._extras.get(registro_id, {}))
+        return self._tipo_fila(datos)
+
+    def __setitem__(self, posicion: int, elemento: Any):
+        posicion = self._normalizar_posicion(posicion)
+        self._olvidar_id(self.ids[posicion])
+        self._escribir(posicion, elemento)
+
+    def _normalizar_posicion(self, posicion: int) -> int:
+        if posicion < 0:
+            posicion += len(self.ids)
+        if not 0 <= posicion < len(self.ids):
+            raise IndexError('índice de registro fuera de rango')
+        return posicion
+
+    def _dia(self, ordinal: int) -> datetime:
+        dia = self._dias.get(ordinal)
+        if dia is None:
+            dia = self._dias[ordinal] = datetime.fromordinal(ordinal)
+        return dia
+
+    def completado_en(self, posicion: int) -> bool:
+        """Indica si el registro en esa posición está completado"""
+        return bool(self._bits_completado[posicion >> 3] >> (posicion & 7) & 1)
+
+    def _asignar_completado(self, posicion: int, completado: bool):
+        mascara = 1 << (posicion & 7)
+        if completado:
+            self._bits_completado[posicion >> 3] |= mascara
+        else:
+            self._bits_completado[posicion >> 3] &= ~mascara & 0xFF
+
+    def _escribir(self, posicion: int, elemento: Any):
+        """Reparte los campos de un elemento en las columnas de una posición"""
+        registro_id = elemento.get('id')
+        habito_id = elemento.get('habito_id')
+        self.ids[posicion] = SIN_VALOR if registro_id is None else registro_id
+        self.habito_ids[posicion] = SIN_VALOR if habito_id is None else habito_id
+        self._asignar_completado(posicion, bool(elemento.get('completado')))
+
+        extras = {}
+        fecha = elemento.get('fecha')
+        try:
+            self.ordinales[posicion] = SIN_VALOR if fecha is None else _a_ordinal(fecha)
+        except (TypeError, ValueError):
+            self.ordinales[posicion] = SIN_VALOR
+            extras['fecha'] = fecha
+
+        fecha_completado = elemento.get('fecha_completado')
+        try:
+            self._fechas_completado[posicion] = (SIN_VALOR if fecha_completado is None
+                                                 else _a_microsegundos(fecha_completado))
+        except (TypeError, ValueError):
+            self._fechas_completado[posicion] = SIN_VALOR
+            extras['fecha_completado'] = fecha_completado
+
+        if elemento.get('nota'):
+            self._notas[registro_id] = elemento.get('nota')
+        for campo, valor in elemento.items():
+            if campo not in self._tipo_fila.conjunto_campos and valor is not None:
+                extras[campo] = valor
+        if extras:
+            self._extras[registro_id] = extras
+
+    def _olvidar_id(self, registro_id: int):
+        """Quita de las tablas laterales los datos de un ID"""
+        self._notas.pop(registro_id, None)
+        self._extras.pop(registro_id, None)
+
+    def append(self, elemento: Any):
+        posicion = len(self.ids)
+        for columna in (self.ids, self.habito_ids, self.ordinales, self._fechas_completado):
+            columna.append(SIN_VALOR)
+        if posicion >> 3 >= len(self._bits_completado):
+            self._bits_completado.append(0)
+        self._escribir(posicion, elemento)
+
+    def extend(self, elementos: Iterable[Any]):
+        for elemento in elementos:
+            self.append(elemento)
+
+    def extender_desde_csv(self, columnas: List[str], filas: Iterable[List[str]]):
+        """Agrega filas de texto de un CSV directamente a las columnas, sin armar filas
+
+        Las columnas deben ser exactamente los campos de la fila de registros.
+        """
+        i_id, i_habito, i_fecha, i_completado, i_fecha_completado, i_nota = (
+            columnas.index(campo) for campo in self._tipo_fila.campos
+        )
+        total_campos = len(columnas)
+        ordinales_por_texto: Dict[str, int] = {}
+        bits = self._bits_completado
+        
+        for fila in filas:
+            if len(fila) < total_campos:
+                fila += [''] * (total_campos - len(fila))
+            
+            # Convertir toda la fila antes de tocar las columnas, para no
+            # dejarlas desalineadas si un valor no se puede leer
+            texto = fila[i_id]
+            registro_id = int(texto) if texto else SIN_VALOR
+            texto = fila[i_habito]
+            habito_id = int(texto) if texto else SIN_VALOR
+            
+            extras = {}
+            texto = fila[i_fecha]
+            ordinal = ordinales_por_texto.get(texto)
+            if ordinal is None:
+                ordinal = SIN_VALOR
+                if texto:
+                    try:
+                        ordinal = ordinales_por_texto[texto] = datetime.fromisoformat(texto).toordinal()
+                    except ValueError:
+                        extras['fecha'] = texto
+            
+            texto = fila[i_fecha_completado]
+            microsegundos = SIN_VALOR
+            if texto:
+                try:
+                    microsegundos = _a_microsegundos(texto)
+                except (TypeError, ValueError):
+                    extras['fecha_completado'] = texto
+            
+            posicion = len(self.ids)
+            self.ids.append(registro_id)
+            self.habito_ids.append(habito_id)
+            self.ordinales.append(ordinal)
+            self._fechas_completado.append(microsegundos)
+            if not posicion & 7:
+                bits.append(0)
+            if fila[i_completado].lower() == 'true':
+                bits[-1] |= 1 << (posicion & 7)
+            if fila[i_nota]:
+                self._notas[registro_id] = fila[i_nota]
+            if extras:
+                self._extras[registro_id] = extras
+
+    def pop(self, posicion: int = -1) -> FilaCompacta:
+        """Quita un registro y lo retorna; a diferencia de list.pop, el último pasa a ocupar su lugar"""
+        posicion = self._normalizar_posicion(posicion)
+        fila = self[posicion]
+        self._olvidar_id(self.ids[posicion])
+        columnas = (self.ids, self.habito_ids, self.ordinales, self._fechas_completado)
+        ultima = len(self.ids) - 1
+        if posicion != ultima:
+            for columna in columnas:
+                columna[posicion] = columna[ultima]
+            self._asignar_completado(posicion, self.completado_en(ultima))
+        for columna in columnas:
+            columna.pop()
+
+        self._asignar_completado(ultima, False)
+        if not ultima & 7:
+            self._bits_completado.pop()  # El último byte de bits quedó sin registros
+        return fila
+
+    def eliminar_posiciones(self, posiciones: Set[int]):
+        """Quita varias posiciones de una vez, conservando el orden del resto"""
+        conservar = [posicion for posicion in range(len(self.ids)) if posicion not in posiciones]
+        completados = [self.completado_en(posicion) for posicion in conservar]
+        for posicion in posiciones:
+            self._olvidar_id(self.ids[posicion])
+
+        for nombre in ('ids', 'habito_ids', 'ordinales', '_fechas_completado'):
+            columna = getattr(self, nombre)
+            setattr(self, nombre, array(columna.typecode, (columna[posicion] for posicion in conservar)))
+
+        self._bits_completado = bytearray((len(conservar) + 7) // 8)
+        for posicion, completado in enumerate(completados):
+            if completado:
+                self._asignar_completado(posicion, True)
+
+    def ordenar_por_id(self):
+        """Reordena todas las columnas por ID (pop deja el último en el lugar del quitado)"""
+        orden = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        completados = [self.completado_en(posicion) for posicion in orden]
+        for nombre in ('ids', 'habito_ids', 'ordinales', '_fechas_completado'):
+            columna = getattr(self, nombre)
+            setattr(self, nombre, array(columna.typecode, (columna[posicion] for posicion in orden)))
+
+        self._bits_completado = bytearray(len(self._bits_completado))
+        for posicion, completado in enumerate(completados):
+            if completado:
+                self._asignar_completado(posicion, True)
+
+    def columnas_extra(self) -> List[str]:
+        """Columnas que no son campos de la fila, en el orden en que aparecen"""
+        campos = {}
+        for extras in self._extras.values():
+            campos.update(dict.fromkeys(campo for campo in extras if campo not in self._tipo_fila.conjunto_campos))
+        return list(campos)
+
+    def clear(self):
+        self.eliminar_posiciones(set(range(len(self.ids))))
+
+    def copy(self) -> List[FilaCompacta]:
+        return list(self)
+
+    def clonar(self) -> 'ColumnasRegistros':
+        """Copia independiente de la colección, copiando las columnas enteras sin armar filas"""
+        copia = ColumnasRegistros(self._tipo_fila)
+        for nombre in ('ids', 'habito_ids', 'ordinales', '_fechas_completado'):
+            setattr(copia, nombre, getattr(self, nombre)[:])
+        copia._bits_completado = bytearray(self._bits_completado)
+        copia._notas = dict(self._notas)
+        copia._extras = dict(self._extras)
+        return copia
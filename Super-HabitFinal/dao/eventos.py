@@ -0,0 +1,77 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class EventoCambio:
+    """Cambio de un elemento de una colección, tal como lo publica la capa DAO
+
+    'anterior' es el elemento antes del cambio (None al crear) y 'nuevo' el
+    elemento después (None al eliminar); ambos son dicts. 'usuario' es el
+    dueño de la colección (None si no está particionada por usuario).
+    """
+
+    __slots__ = ('coleccion', 'operacion', 'id', 'anterior', 'nuevo', 'usuario')
+
+    CREAR = 'crear'
+    ACTUALIZAR = 'actualizar'
+    ELIMINAR = 'eliminar'
+
+    def __init__(self, coleccion: str, operacion: str, id_elemento: int,
+                 anterior: Optional[Dict[str, Any]] = None, nuevo: Optional[Dict[str, Any]] = None,
+                 usuario: Optional[str] = None):
+        self.coleccion = coleccion
+        self.operacion = operacion
+        self.id = id_elemento
+        self.anterior = anterior
+        self.nuevo = nuevo
+        self.usuario = usuario
+
+    def __repr__(self) -> str:
+        return f"EventoCambio({self.coleccion!r}, {self.operacion!r}, id={self.id})"
+
+
+Suscriptor = Callable[[EventoCambio], None]
+
+_SIN_SUSCRIPTORES: Tuple[Suscriptor, ...] = ()
+
+
+class BusEventos:
+    """Avisos síncronos de los cambios hechos por la capa DAO
+
+    Quien escribe pregunta primero por los suscriptores de la colección y solo
+    arma el evento si hay alguno, así que sin suscriptores publicar no cuesta
+    más que una búsqueda en un dict.
+    """
+
+    def __init__(self):
+        # Suscriptores por colección; la clave None recibe los de todas
+        self._suscriptores: Dict[Optional[str], List[Suscriptor]] = {}
+        self._por_coleccion: Dict[str, Tuple[Suscriptor, ...]] = {}
+
+    def suscribir(self, suscriptor: Suscriptor, coleccion: Optional[str] = None):
+        """Registra una función que recibe los eventos de una colección (o de todas si es None)"""
+        self._suscriptores.setdefault(coleccion, []).append(suscriptor)
+        self._por_coleccion.clear()
+
+    def desuscribir(self, suscriptor: Suscriptor, coleccion: Optional[str] = None):
+        """Quita una función registrada con suscribir()"""
+        suscriptores = self._suscriptores.get(coleccion, [])
+        if suscriptor in suscriptores:
+            suscriptores.remove(suscriptor)
+        self._por_coleccion.clear()
+
+    def suscriptores(self, coleccion: str) -> Tuple[Suscriptor, ...]:
+        """Suscriptores que deben recibir los eventos de una colección (tupla vacía si no hay)"""
+        suscriptores = self._por_coleccion.get(coleccion)
+        if suscriptores is None:
+            suscriptores = tuple(self._suscriptores.get(coleccion, [])) + tuple(self._suscriptores.get(None, []))
+            self._por_coleccion[coleccion] = suscriptores or _SIN_SUSCRIPTORES
+        return suscriptores
+
+    def publicar(self, suscriptores: Tuple[Suscriptor, ...], evento: EventoCambio):
+        """Entrega un evento a los suscriptores obtenidos con suscriptores()"""
+        for suscriptor in suscriptores:
+            try:
+                suscriptor(evento)
+            except Exception as e:
+                # Un suscriptor con errores no debe impedir la escritura
+                print(f"⚠️ Error al notificar un cambio en '{evento.coleccion}': {e}")
@@ -0,0 +1,120 @@
+from itertools import chain
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Sequence, Tuple, Type
+
+
+class FilaCompacta:
+    """Elemento almacenado en memoria con __slots__ en lugar de un dict por registro
+
+    Se comporta como un diccionario de esas claves (get, [], keys, items,
+    copy), así que el resto de la capa DAO la usa igual que a un dict. Las
+    columnas que no son campos (agregadas al CSV por otra versión o a mano)
+    van a un dict aparte, que solo existe si hay alguna, y se vuelven a
+    escribir al compactar.
+    """
+
+    __slots__ = ()
+    campos: Tuple[str, ...] = ()
+    conjunto_campos: FrozenSet[str] = frozenset()
+
+    def __init__(self, datos: Dict[str, Any]):
+        for campo in self.campos:
+            setattr(self, campo, datos.get(campo))
+        extras = {campo: valor for campo, valor in datos.items()
+                  if campo not in self.conjunto_campos and valor is not None}
+        self._extras = extras or None
+
+    def __getitem__(self, campo: str) -> Any:
+        if campo in self.conjunto_campos:
+            return getattr(self, campo)
+        if self._extras and campo in self._extras:
+            return self._extras[campo]
+        raise KeyError(campo)
+
+    def __setitem__(self, campo: str, valor: Any):
+        if campo in self.conjunto_campos:
+            setattr(self, campo, valor)
+        elif valor is not None:
+            self._extras = dict(self._extras or {}, **{campo: valor})
+        elif self._extras and campo in self._extras:
+            self._extras = {otro: dato for otro, dato in self._extras.items() if otro != campo} or None
+
+    def __contains__(self, campo: str) -> bool:
+        return campo in self.conjunto_campos or bool(self._extras) and campo in self._extras
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def __eq__(self, otro: Any) -> bool:
+        if isinstance(otro, (FilaCompacta, dict)):
+            return self.copy() == dict(otro.items())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.copy()!r})"
+
+    @classmethod
+    def crear_lector(cls, columnas: Sequence[str],
+                     conversores: Sequence[Callable[[str], Any]]) -> Optional[Callable[[List[str]], 'FilaCompacta']]:
+        """Función que arma una fila directamente desde los textos de una fila CSV
+
+        Asigna cada slot con su descriptor, sin pasar por un dict intermedio.
+        Retorna None si alguna columna no es un campo de esta fila.
+        """
+        if not set(columnas) <= set(cls.campos):
+            return None
+
+        faltantes = [getattr(cls, campo).__set__ for campo in cls.campos + ('_extras',) if campo not in columnas]
+        asignaciones = [(getattr(cls, campo).__set__, convertir)
+                        for campo, convertir in zip(columnas, conversores)]
+        nueva = object.__new__
+
+        def leer(valores: List[str]) -> 'FilaCompacta':
+            fila = nueva(cls)
+            for asignar in faltantes:
+                asignar(fila, None)
+            for (asignar, convertir), valor in zip(asignaciones, valores):
+                asignar(fila, convertir(valor))
+            return fila
+
+        return leer
+
+    def get(self, campo: str, defecto: Any = None) -> Any:
+        if campo in self.conjunto_campos:
+            return getattr(self, campo)
+        return self._extras.get(campo, defecto) if self._extras else defecto
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.campos + tuple(self._extras) if self._extras else self.campos
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        campos = ((campo, getattr(self, campo)) for campo in self.campos)
+        return chain(campos, self._extras.items()) if self._extras else campos
+
+    def extras(self) -> Dict[str, Any]:
+        """Columnas que no son campos de la fila"""
+        return dict(self._extras or {})
+
+    def copy(self) -> Dict[str, Any]:
+        """Copia como dict, para entregar fuera de la capa DAO"""
+        copia = {campo: getattr(self, campo) for campo in self.campos}
+        if self._extras:
+            copia.update(self._extras)
+        return copia
+
+
+_tipos_fila = {}
+
+
+def tipo_fila(nombre_coleccion: str, campos: Tuple[str, ...]) -> Type[FilaCompacta]:
+    """Obtiene (creándola una sola vez) la clase de fila compacta de una colección"""
+    clave = (nombre_coleccion, tuple(campos))
+    if clave not in _tipos_fila:
+        _tipos_fila[clave] = type(f'Fila_{nombre_coleccion}', (FilaCompacta,), {
+            '__slots__': tuple(campos) + ('_extras',),
+            'campos': tuple(campos),
+            'conjunto_campos': frozenset(campos),
+        })
+    return _tipos_fila[clave]
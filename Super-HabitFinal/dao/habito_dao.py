@@ -1,13 +1,16 @@
 from typing import List, Optional
 from datetime import datetime
 from dao.base_dao import BaseDAO
+from dao.cerrojos import escritura, lectura
 from models.habito import Habito
 
 class HabitoDAO(BaseDAO):
     """DAO para el manejo de hábitos"""
     
-    def __init__(self):
-        super().__init__('habitos')
+    campos = ('id', 'nombre', 'frecuencia', 'duracion', 'horario_sugerido', 'fecha_creacion', 'activo')
+    
+    def __init__(self, usuario: Optional[str] = None):
+        super().__init__('habitos', usuario)
     
     def crear_habito(self, habito: Habito) -> Habito:
         """Crea un nuevo hábito"""
@@ -27,13 +30,22 @@ class HabitoDAO(BaseDAO):
         """Obtiene todos los hábitos"""
         return [Habito.from_dict(datos) for datos in self.obtener_todos()]
     
+    @lectura
     def obtener_habitos_activos(self) -> List[Habito]:
         """Obtiene todos los hábitos activos"""
+        if self._sqlite is not None:
+            return [Habito.from_dict(datos) for datos in self._sqlite.consultar('activo = 1')]
+        
         habitos = self.obtener_todos_habitos()
         return [h for h in habitos if h.activo]
     
+    @lectura
     def obtener_habitos_por_frecuencia(self, frecuencia: str) -> List[Habito]:
         """Obtiene hábitos por frecuencia (diaria o semanal)"""
+        if self._sqlite is not None:
+            filas = self._sqlite.consultar('activo = 1 AND frecuencia = ?', (frecuencia.lower(),))
+            return [Habito.from_dict(datos) for datos in filas]
+        
         habitos = self.obtener_habitos_activos()
         return [h for h in habitos if h.frecuencia == frecuencia.lower()]
     
@@ -46,6 +58,7 @@ class HabitoDAO(BaseDAO):
         resultado = self.actualizar(habito.id, datos_habito)
         return resultado is not None
     
+    @escritura
     def desactivar_habito(self, habito_id: int) -> bool:
         """Desactiva un hábito (no lo elimina)"""
         habito = self.obtener_habito(habito_id)
@@ -0,0 +1,296 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Type
+
+from dao.columnas_registros import ColumnasRegistros, SIN_VALOR
+from dao.fila_compacta import FilaCompacta
+
+# Instantánea binaria de registros (registros.bin), en little-endian.
+#
+# Encabezado de 40 bytes y después secciones de ancho fijo, cada una alineada
+# a 8 bytes: la fila i de una columna está en inicio + i * ancho, así que toda
+# la colección se lee con un solo read() y cada columna pasa a su array sin
+# convertir texto. Las notas van aparte, como IDs (ordenados) y posiciones de
+# fin en un bloque de texto UTF-8. Se guardan además las líneas de tiempo por
+# hábito (con la posición de cada registro, desde la versión 2) y los agregados
+# para no tener que recalcularlos al cargar.
+MAGICO = b'SHRB'
+VERSION = 2
+EXTENSION = '.bin'
+
+_ENCABEZADO = struct.Struct('<4sHHIIIIIIII')
+_ALINEACION = 8
+_UN_MICROSEGUNDO = timedelta(microseconds=1)
+
+
+def es_binaria(archivo: str) -> bool:
+    """Indica si la ruta corresponde a una instantánea binaria (por su extensión, también en las copias .1, .2...)"""
+    base, extension = os.path.splitext(archivo)
+    if extension[1:].isdigit():
+        archivo = base
+    return archivo.endswith(EXTENSION)
+
+
+def _secciones(version: int, filas: int, notas: int, bytes_notas: int, bytes_extras: int,
+               habitos: int, filas_linea: int, bytes_agregados: int) -> List[Tuple[str, str, int, int]]:
+    """(nombre, typecode o '' para bytes, inicio, cantidad) de cada sección, en orden"""
+    tamanos = [
+        ('ids', 'i', filas),
+        ('habito_ids', 'i', filas),
+        ('ordinales', 'i', filas),
+        ('fechas_completado', 'q', filas),
+        ('bits_completado', '', (filas + 7) // 8),
+        ('nota_ids', 'i', notas),
+        ('nota_fin', 'I', notas),
+        ('notas', '', bytes_notas),
+        ('extras', '', bytes_extras),
+        ('linea_habitos', 'i', habitos),
+        ('linea_fin', 'I', habitos),
+        ('linea_ordinales', 'i', filas_linea),
+        ('linea_ids', 'i', filas_linea),
+        ('agregados', '', bytes_agregados),
+    ]
+    if version >= 2:
+        tamanos.append(('linea_posiciones', 'i', filas_linea))
+    secciones = []
+    posicion = _ENCABEZADO.size
+    for nombre, typecode, cantidad in tamanos:
+        secciones.append((nombre, typecode, posicion, cantidad))
+        posicion += cantidad * (array(typecode).itemsize if typecode else 1)
+        posicion += -posicion % _ALINEACION
+    secciones.append(('fin', '', posicion, 0))
+    return secciones
+
+
+def _a_bytes(columna: Any) -> bytes:
+    """Bytes little-endian de un array (o de un bytearray)"""
+    if isinstance(columna, array) and sys.byteorder == 'big':
+        columna = array(columna.typecode, columna)
+        columna.byteswap()
+    return bytes(columna)
+
+
+def escribir(f: BinaryIO, columnas: ColumnasRegistros,
+             lineas_tiempo: Dict[int, Tuple[array, array]], agregados: Dict[str, Dict[str, Any]]):
+    """Escribe la colección, sus líneas de tiempo y sus agregados en un archivo abierto en modo binario"""
+    datos = columnas.columnas()
+    nota_ids = array('i')
+    nota_fin = array('I')
+    notas = bytearray()
+    for registro_id, nota in sorted(datos['notas'].items()):
+        notas += nota.encode('utf-8')
+        nota_ids.append(registro_id)
+        nota_fin.append(len(notas))
+    extras = json.dumps({str(registro_id): valores for registro_id, valores in datos['extras'].items()},
+                        ensure_ascii=False, default=str).encode('utf-8') if datos['extras'] else b''
+
+    linea_habitos = array('i')
+    linea_fin = array('I')
+    linea_ordinales = array('i')
+    linea_ids = array('i')
+    posicion_por_id = dict(zip(datos['ids'], range(len(columnas))))
+    for habito_id in sorted(lineas_tiempo):
+        ordinales, ids = lineas_tiempo[habito_id]
+        linea_habitos.append(habito_id)
+        linea_ordinales.extend(ordinales)
+        linea_ids.extend(ids)
+        linea_fin.append(len(linea_ids))
+    linea_posiciones = array('i', (posicion_por_id[registro_id] for registro_id in linea_ids))
+    texto_agregados = json.dumps(agregados).encode('utf-8')
+
+    contenido = {
+        'nota_ids': nota_ids, 'nota_fin': nota_fin, 'notas': notas, 'extras': extras,
+        'linea_habitos': linea_habitos, 'linea_fin': linea_fin, 'linea_ordinales': linea_ordinales,
+        'linea_ids': linea_ids, 'agregados': texto_agregados, 'linea_posiciones': linea_posiciones,
+    }
+    contenido.update((nombre, datos[nombre])
+                     for nombre in ('ids', 'habito_ids', 'ordinales', 'fechas_completado', 'bits_completado'))
+
+    filas = len(columnas)
+    f.write(_ENCABEZADO.pack(MAGICO, VERSION, 0, filas, len(nota_ids), len(notas), len(extras),
+                             len(linea_habitos), len(linea_ids), len(texto_agregados), 0))
+    escritos = _ENCABEZADO.size
+    for nombre, _, inicio, _ in _secciones(VERSION, filas, len(nota_ids), len(notas), len(extras),
+                                           len(linea_habitos), len(linea_ids), len(texto_agregados)):
+        f.write(b'\0' * (inicio - escritos))
+        escritos = inicio
+        if nombre != 'fin':
+            bloque = _a_bytes(contenido[nombre])
+            f.write(bloque)
+            escritos += len(bloque)
+
+
+def _leer_array(buffer: memoryview, typecode: str, inicio: int, cantidad: int) -> array:
+    columna = array(typecode)
+    columna.frombytes(buffer[inicio:inicio + cantidad * columna.itemsize])
+    if sys.byteorder == 'big':
+        columna.byteswap()
+    return columna
+
+
+def _leer_secciones(buffer: memoryview, version_minima: int = 1) -> List[Tuple[str, str, int, int]]:
+    """Valida el encabezado y retorna las secciones del contenido (ValueError si no es válido)"""
+    if len(buffer) < _ENCABEZADO.size:
+        raise ValueError("instantánea binaria incompleta")
+    magico, version, _, *tamanos, _ = _ENCABEZADO.unpack_from(buffer)
+    if magico != MAGICO or not version_minima <= version <= VERSION:
+        raise ValueError("no es una instantánea binaria de registros compatible")
+    secciones = _secciones(version, *tamanos)
+    if secciones[-1][2] != len(buffer):
+        raise ValueError("el tamaño de la instantánea binaria no coincide con su encabezado")
+    return secciones[:-1]
+
+
+def _leer_extras(texto: memoryview) -> Dict[int, Dict[str, Any]]:
+    return {int(registro_id): valores for registro_id, valores in json.loads(str(texto, 'utf-8') or '{}').items()}
+
+
+def leer(contenido: bytes, tipo_fila: Type[FilaCompacta]) -> ColumnasRegistros:
+    """Arma la colección desde el contenido completo de una instantánea binaria
+
+    La colección vuelve con sus líneas de tiempo y agregados guardados en
+    lineas_tiempo_guardadas y agregados_guardados. Si el contenido no es una
+    instantánea válida se lanza ValueError.
+    """
+    buffer = memoryview(contenido)
+    leido = {}
+    for nombre, typecode, inicio, cantidad in _leer_secciones(buffer):
+        if typecode:
+            leido[nombre] = _leer_array(buffer, typecode, inicio, cantidad)
+        else:
+            leido[nombre] = buffer[inicio:inicio + cantidad]
+
+    notas = {}
+    bloque_notas = leido['notas']
+    inicio_nota = 0
+    for registro_id, fin_nota in zip(leido['nota_ids'], leido['nota_fin']):
+        notas[registro_id] = str(bloque_notas[inicio_nota:fin_nota], 'utf-8')
+        inicio_nota = fin_nota
+    extras = _leer_extras(leido['extras'])
+
+    columnas = ColumnasRegistros.desde_columnas(
+        tipo_fila, leido['ids'], leido['habito_ids'], leido['ordinales'], leido['fechas_completado'],
+        bytearray(leido['bits_completado']), notas, extras)
+
+    lineas = {}
+    inicio_linea = 0
+    ordinales, ids = leido['linea_ordinales'], leido['linea_ids']
+    for habito_id, fin_linea in zip(leido['linea_habitos'], leido['linea_fin']):
+        lineas[habito_id] = (ordinales[inicio_linea:fin_linea], ids[inicio_linea:fin_linea])
+        inicio_linea = fin_linea
+    columnas.lineas_tiempo_guardadas = lineas
+    columnas.agregados_guardados = json.loads(str(leido['agregados'], 'utf-8'))
+    return columnas
+
+
+class LectorMapeado:
+    """Consultas directas sobre una instantánea binaria mapeada en memoria (mmap)
+
+    Cada sección se ve como un memoryview del archivo, sin copiarla: las
+    búsquedas por hábito y fecha son búsquedas binarias en las líneas de tiempo
+    y solo se arma una fila para los registros que se retornan, así que la
+    memoria usada no crece con el historial. Requiere la versión 2 del formato
+    y una máquina little-endian (ValueError si no).
+    """
+
+    def __init__(self, archivo: str):
+        if sys.byteorder != 'little':
+            raise ValueError("la lectura mapeada requiere una máquina little-endian")
+        with open(archivo, 'rb') as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._vistas: List[memoryview] = []
+        try:
+            buffer = self._ver(memoryview(self._mapa))
+            secciones = {}
+            for nombre, typecode, inicio, cantidad in _leer_secciones(buffer, version_minima=2):
+                vista = self._ver(buffer[inicio:inicio + cantidad * (array(typecode).itemsize if typecode else 1)])
+                secciones[nombre] = self._ver(vista.cast(typecode)) if typecode else vista
+        except Exception:
+            self.cerrar()
+            raise
+
+        self._ids = secciones['ids']
+        self._habito_ids = secciones['habito_ids']
+        self._ordinales = secciones['ordinales']
+        self._fechas_completado = secciones['fechas_completado']
+        self._bits_completado = secciones['bits_completado']
+        self._nota_ids = secciones['nota_ids']
+        self._nota_fin = secciones['nota_fin']
+        self._notas = secciones['notas']
+        self._extras = _leer_extras(secciones['extras'])
+        self._linea_ordinales = secciones['linea_ordinales']
+        self._linea_posiciones = secciones['linea_posiciones']
+        # habito_id -> (inicio, fin) de su tramo en las líneas de tiempo
+        self._tramos: Dict[int, Tuple[int, int]] = {}
+        inicio = 0
+        for habito_id, fin in zip(secciones['linea_habitos'], secciones['linea_fin']):
+            self._tramos[habito_id] = (inicio, fin)
+            inicio = fin
+
+    def _ver(self, vista: memoryview) -> memoryview:
+        """Registra una vista para liberarla antes de cerrar el mapa"""
+        self._vistas.append(vista)
+        return vista
+
+    def cerrar(self):
+        """Libera las vistas y el mapa (el archivo se puede reemplazar después)"""
+        for vista in reversed(self._vistas):
+            vista.release()
+        self._vistas.clear()
+        self._mapa.close()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def habitos(self) -> Iterator[int]:
+        """Hábitos con registros en la instantánea"""
+        return iter(self._tramos)
+
+    def posiciones(self, habito_id: int, ordinal_inicio: int, ordinal_fin: int) -> List[int]:
+        """Posiciones de los registros de un hábito entre dos días (inclusive), ordenadas por fecha"""
+        tramo = self._tramos.get(habito_id)
+        if tramo is None:
+            return []
+        inicio = bisect_left(self._linea_ordinales, ordinal_inicio, *tramo)
+        fin = bisect_right(self._linea_ordinales, ordinal_fin, inicio, tramo[1])
+        return self._linea_posiciones[inicio:fin].tolist()
+
+    def id_en(self, posicion: int) -> int:
+        return self._ids[posicion]
+
+    def ordinal_en(self, posicion: int) -> int:
+        return self._ordinales[posicion]
+
+    def completado_en(self, posicion: int) -> bool:
+        return bool(self._bits_completado[posicion >> 3] >> (posicion & 7) & 1)
+
+    def _nota(self, registro_id: int) -> Optional[str]:
+        indice = bisect_left(self._nota_ids, registro_id)
+        if indice == len(self._nota_ids) or self._nota_ids[indice] != registro_id:
+            return None
+        inicio = self._nota_fin[indice - 1] if indice else 0
+        return str(self._notas[inicio:self._nota_fin[indice]], 'utf-8')
+
+    def fila(self, posicion: int) -> Dict[str, Any]:
+        """Registro en una posición, con los mismos valores que la colección cargada en memoria"""
+        registro_id = self._ids[posicion]
+        habito_id = self._habito_ids[posicion]
+        ordinal = self._ordinales[posicion]
+        microsegundos = self._fechas_completado[posicion]
+        datos = {
+            'id': None if registro_id == SIN_VALOR else registro_id,
+            'habito_id': None if habito_id == SIN_VALOR else habito_id,
+            'fecha': None if ordinal == SIN_VALOR else datetime.fromordinal(ordinal),
+            'completado': self.completado_en(posicion),
+            'fecha_completado': (None if microsegundos == SIN_VALOR
+                                 else (datetime.min + microsegundos * _UN_MICROSEGUNDO).isoformat()),
+            'nota': self._nota(registro_id),
+        }
+        datos.update(self._extras.get(registro_id, {}))
+        return datos
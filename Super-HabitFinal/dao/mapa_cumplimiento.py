@@ -0,0 +1,121 @@
+from typing import Iterable, List, Optional
+
+
+def _contar_bits(valor: int) -> int:
+    """Cantidad de bits encendidos (int.bit_count recién existe desde Python 3.10)"""
+    return bin(valor).count('1')
+
+
+class MapaCumplimiento:
+    """Días completados de un hábito, como un bit por día
+
+    El bit 0 corresponde al día 'origen' (el primero completado que se vio) y
+    cada bit siguiente al día posterior. Contar un período es contar los bits
+    de una máscara, y las rachas se obtienen con operaciones sobre el entero
+    completo, sin recorrer registros uno por uno.
+    """
+
+    __slots__ = ('origen', 'bits')
+
+    def __init__(self):
+        self.origen: Optional[int] = None
+        self.bits = 0
+
+    @classmethod
+    def desde_ordinales(cls, ordinales: Iterable[int]) -> 'MapaCumplimiento':
+        """Arma el mapa de una vez a partir de los ordinales de los días completados"""
+        mapa = cls()
+        ordinales = list(ordinales)
+        if ordinales:
+            mapa.origen = min(ordinales)
+            bytes_dias = bytearray((max(ordinales) - mapa.origen) // 8 + 1)
+            for ordinal in ordinales:
+                desplazamiento = ordinal - mapa.origen
+                bytes_dias[desplazamiento >> 3] |= 1 << (desplazamiento & 7)
+            mapa.bits = int.from_bytes(bytes_dias, 'little')
+        return mapa
+
+    @classmethod
+    def desde_lista(cls, datos: List) -> 'MapaCumplimiento':
+        """Reconstruye un mapa guardado con a_lista()"""
+        mapa = cls()
+        mapa.origen, mapa.bits = datos[0], int(datos[1], 16)
+        return mapa
+
+    def a_lista(self) -> List:
+        """Forma serializable del mapa: [origen, bits en hexadecimal]"""
+        return [self.origen, format(self.bits, 'x')]
+
+    def marcar(self, ordinal: int):
+        """Enciende el bit de un día"""
+        if self.origen is None:
+            self.origen = ordinal
+        elif ordinal < self.origen:
+            self.bits <<= self.origen - ordinal
+            self.origen = ordinal
+        self.bits |= 1 << (ordinal - self.origen)
+
+    def desmarcar(self, ordinal: int):
+        """Apaga el bit de un día"""
+        if self.contiene(ordinal):
+            self.bits ^= 1 << (ordinal - self.origen)
+
+    def contiene(self, ordinal: int) -> bool:
+        """Indica si el día está completado"""
+        if self.origen is None or ordinal < self.origen:
+            return False
+        return bool(self.bits >> (ordinal - self.origen) & 1)
+
+    def contar(self, inicio: Optional[int] = None, fin: Optional[int] = None) -> int:
+        """Cantidad de días completados entre dos ordinales (ambos incluidos)"""
+        if self.origen is None:
+            return _contar_bits(self.bits)
+        bits = self.bits
+        if fin is not None:
+            if fin < self.origen:
+                return 0
+            bits &= (1 << (fin - self.origen + 1)) - 1
+        if inicio is not None and inicio > self.origen:
+            bits >>= inicio - self.origen
+        return _contar_bits(bits)
+
+    def ventana(self, inicio: int, fin: int) -> int:
+        """Bits de los días entre dos ordinales (ambos incluidos), con el bit 0 en 'inicio'"""
+        if self.origen is None or fin < self.origen or fin < inicio:
+            return 0
+        if inicio >= self.origen:
+            bits = self.bits >> (inicio - self.origen)
+        else:
+            bits = self.bits << (self.origen - inicio)
+        return bits & ((1 << (fin - inicio + 1)) - 1)
+
+    def racha_hasta(self, ordinal: int) -> int:
+        """Días consecutivos completados que terminan en el día dado (0 si ese día no lo está)"""
+        if not self.contiene(ordinal):
+            return 0
+        desplazamiento = ordinal - self.origen
+        mascara = (1 << (desplazamiento + 1)) - 1
+        # El bit apagado más alto por debajo del día marca dónde empieza la racha
+        apagados = ~self.bits & mascara
+        return desplazamiento + 1 - apagados.bit_length()
+
+    def racha_desde(self, ordinal: int) -> int:
+        """Días consecutivos completados que empiezan en el día dado (0 si ese día no lo está)"""
+        if not self.contiene(ordinal):
+            return 0
+        bits = self.bits >> (ordinal - self.origen)
+        # bits + 1 apaga los bits bajos encendidos y enciende el primero apagado
+        return (~bits & (bits + 1)).bit_length() - 1
+
+    def racha_maxima(self) -> int:
+        """Racha más larga de días consecutivos completados
+
+        Cada paso de bits & (bits >> 1) acorta todas las rachas en un día, así
+        que la cantidad de pasos hasta llegar a cero es la racha más larga.
+        """
+        bits = self.bits
+        racha = 0
+        while bits:
+            bits &= bits >> 1
+            racha += 1
+        return racha
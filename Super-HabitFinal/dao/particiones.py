@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List
+
+# Los nombres de usuario son nombres de directorio: sin separadores ni '..'
+_NOMBRE_USUARIO = re.compile(r'[A-Za-z0-9_.@-]+')
+
+
+def directorio_usuario(directorio_base: str, usuario: str) -> str:
+    """Directorio con los archivos (la partición) de un usuario"""
+    if not isinstance(usuario, str) or not _NOMBRE_USUARIO.fullmatch(usuario) or usuario in ('.', '..'):
+        raise ValueError(f"Nombre de usuario inválido: {usuario!r}")
+    return os.path.join(directorio_base, usuario)
+
+
+class PoolParticiones:
+    """Usuarios con datos abiertos (colecciones en memoria o conexiones SQLite)
+
+    Cada DAO de un usuario avisa con usar() cada vez que accede a sus datos.
+    Los usuarios se guardan del usado hace más tiempo al más reciente y, al
+    superar la capacidad, el primero se descarga: cada uno de sus DAO escribe
+    lo pendiente y suelta lo que tenga abierto (ver BaseDAO._descargar). Sus
+    datos se vuelven a abrir del disco la próxima vez que se usen. Todas las
+    operaciones son búsquedas en un dict, así que no dependen de cuántos
+    usuarios haya en total.
+
+    La descarga no espera a otros hilos: si alguna colección del usuario está
+    en uso (su cerrojo tomado) o tiene un lote abierto, el usuario vuelve al
+    pool como recién usado, así que la capacidad puede pasarse un momento.
+    """
+
+    def __init__(self, capacidad: int):
+        self.capacidad = max(1, capacidad)
+        # usuario -> {colección: DAO que la abrió}, del usado hace más tiempo al más reciente
+        self._abiertas: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._al_desalojar: List[Callable[[str], None]] = []
+        self._cerrojo = threading.Lock()
+        self.desalojos = 0
+
+    def al_desalojar(self, funcion: Callable[[str], None]):
+        """Registra una función que recibe el usuario descargado (para soltar cachés propias)"""
+        self._al_desalojar.append(funcion)
+
+    def usar(self, dao: Any):
+        """Marca al usuario del DAO como el más reciente, descargando a los que sobren"""
+        with self._cerrojo:
+            daos = self._abiertas.get(dao.usuario)
+            if daos is None:
+                daos = self._abiertas[dao.usuario] = {}
+            else:
+                self._abiertas.move_to_end(dao.usuario)
+            if dao.nombre_coleccion in daos:
+                return
+            daos[dao.nombre_coleccion] = dao
+
+            desalojados = []
+            while len(self._abiertas) > self.capacidad:
+                desalojados.append(self._abiertas.popitem(last=False))
+
+        # La descarga escribe en disco: se hace fuera del cerrojo del pool
+        for usuario, daos_usuario in desalojados:
+            self._descargar(usuario, daos_usuario)
+
+    def desalojar(self, usuario: str) -> bool:
+        """Descarga ya los datos de un usuario; retorna False si no estaba abierto"""
+        with self._cerrojo:
+            daos = self._abiertas.pop(usuario, None)
+        if daos is None:
+            return False
+        self._descargar(usuario, daos)
+        return True
+
+    def desalojar_todos(self):
+        """Descarga los datos de todos los usuarios abiertos"""
+        with self._cerrojo:
+            abiertas = list(self._abiertas.items())
+            self._abiertas.clear()
+        for usuario, daos in abiertas:
+            self._descargar(usuario, daos)
+
+    def _descargar(self, usuario: str, daos: Dict[str, Any]):
+        # Todas las colecciones del usuario o ninguna (comparten la base SQLite)
+        tomadas = []
+        for dao in daos.values():
+            if not dao._cerrojo.adquirir_escritura(bloquear=False):
+                break
+            tomadas.append(dao)
+        ocupadas = {}
+        try:
+            if len(tomadas) == len(daos):
+                for nombre, dao in daos.items():
+                    try:
+                        if not dao._descargar():
+                            ocupadas[nombre] = dao
+                    except Exception as e:
+                        print(f"⚠️ Error al descargar '{dao.nombre_coleccion}' de {usuario}: {e}")
+            else:
+                ocupadas = daos
+        finally:
+            for dao in tomadas:
+                dao._cerrojo.liberar_escritura()
+
+        if ocupadas:
+            self._reponer(usuario, ocupadas)
+            return
+        for funcion in self._al_desalojar:
+            funcion(usuario)
+        with self._cerrojo:
+            self.desalojos += 1
+
+    def _reponer(self, usuario: str, daos: Dict[str, Any]):
+        """Vuelve a poner en el pool a un usuario que no se pudo descargar (estaba en uso)"""
+        with self._cerrojo:
+            abiertas = self._abiertas.setdefault(usuario, {})
+            for nombre, dao in daos.items():
+                abiertas.setdefault(nombre, dao)
+
+    def residentes(self) -> List[str]:
+        """Usuarios abiertos, del usado hace más tiempo al más reciente"""
+        with self._cerrojo:
+            return list(self._abiertas)
+
+    def obtener_metricas(self) -> Dict[str, int]:
+        """Usuarios abiertos, capacidad y cuántas descargas hubo"""
+        with self._cerrojo:
+            return {'residentes': len(self._abiertas), 'capacidad': self.capacidad,
+                    'desalojos': self.desalojos}
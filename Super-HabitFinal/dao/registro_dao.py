@@ -1,13 +1,521 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from array import array
+import csv
+import json
+import os
 from datetime import datetime, date, timedelta
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
 from dao.base_dao import BaseDAO
+from dao.cerrojos import escritura, lectura
+from dao.eventos import EventoCambio
+from dao.columnas_registros import ColumnasRegistros, SIN_VALOR
+from dao.agregados_habito import AgregadoHabito
+from dao import instantanea_binaria
+from dao.registros_mapeados import RegistrosMapeados
 from models.registro_cumplimiento import RegistroCumplimiento
 
 class RegistroDAO(BaseDAO):
     """DAO para el manejo de registros de cumplimiento"""
     
-    def __init__(self):
-        super().__init__('registros')
+    campos = ('id', 'habito_id', 'fecha', 'completado', 'fecha_completado', 'nota')
+    
+    # Instantánea binaria (registros.bin, ver dao/instantanea_binaria.py) en
+    # lugar de registros.csv: se carga con una sola lectura y trae guardados los
+    # índices por hábito. Si todavía no existe se carga registros.csv
+    formato_binario = os.environ.get('SUPERHABIT_REGISTROS_BINARIO', '0') == '1'
+    
+    # Lectura mapeada: mientras la colección no esté cargada, las consultas por
+    # hábito, fecha y período se responden sobre registros.bin mapeado en
+    # memoria (mmap) más los cambios del diario, sin cargar el historial. La
+    # primera escritura carga la colección y libera el mapeo
+    lectura_mapeada = os.environ.get('SUPERHABIT_REGISTROS_MAPEADOS', '0') == '1'
+    _mapeos = {}  # clave -> (huella de los archivos, RegistrosMapeados)
+    
+    # Índices compartidos por colección:
+    # habito_id -> (array de ordinales de fecha ordenados, array de ids en el mismo
+    # orden); también resuelven la búsqueda por (habito_id, fecha)
+    _lineas_tiempo = {}
+    # habito_id -> AgregadoHabito, mantenido al día con cada cambio y guardado
+    # para poder leerlo sin cargar la colección: entero en registros.agregados
+    # con cada instantánea y, entre una y otra, los cambios de cada escritura
+    # del diario en registros.agregados.diario
+    _agregados_habito = {}
+    _agregados_persistidos = {}
+    # Cambios a los agregados aún no escritos: [habito_id, ordinal, completado]
+    # al agregar un registro, con queda_registro y queda_completado al quitarlo
+    _cambios_agregados = {}
+    
+    def __init__(self, usuario: Optional[str] = None):
+        super().__init__('registros', usuario)
+        self._archivo_agregados = self._ruta(f'{self.nombre_coleccion}.agregados')
+        self._archivo_cambios_agregados = self._archivo_agregados + '.diario'
+        self._archivo_csv = self._archivo_datos
+        if RegistroDAO.formato_binario:
+            self._archivo_datos = self._ruta(f'{self.nombre_coleccion}{instantanea_binaria.EXTENSION}')
+    
+    @property
+    def _linea_tiempo(self):
+        """Líneas de tiempo por hábito de la colección cargada"""
+        self._asegurar_cargada()
+        return RegistroDAO._lineas_tiempo[self._clave]
+    
+    @property
+    def _agregados(self) -> Dict[int, AgregadoHabito]:
+        """Agregados por hábito de la colección cargada"""
+        self._asegurar_cargada()
+        return RegistroDAO._agregados_habito[self._clave]
+    
+    @staticmethod
+    def _obtener_fecha_registro(datos) -> date:
+        """Obtiene la fecha (sin hora) de un registro en cualquiera de sus formatos"""
+        if isinstance(datos['fecha'], str):
+            if 'T' in datos['fecha']:
+                return datetime.fromisoformat(datos['fecha']).date()
+            return datetime.fromisoformat(datos['fecha'] + 'T00:00:00').date()
+        elif isinstance(datos['fecha'], datetime):
+            return datos['fecha'].date()
+        return datos['fecha']
+    
+    def _crear_contenedor(self, elementos=()) -> ColumnasRegistros:
+        """Los registros se guardan por columnas en lugar de una fila por registro"""
+        return ColumnasRegistros(self._tipo_fila, elementos)
+    
+    def _ids_desde(self, elementos: ColumnasRegistros, posicion: int = 0):
+        return elementos.ids[posicion:]
+    
+    def _cargar_coleccion(self):
+        """Libera el mapeo antes de cargar: desde acá las consultas se responden desde memoria"""
+        self._cerrar_mapeo()
+        super()._cargar_coleccion()
+        # Lo reaplicado del diario al cargar ya está en los agregados guardados
+        RegistroDAO._cambios_agregados[self._clave] = []
+    
+    def _cerrar_mapeo(self):
+        guardado = RegistroDAO._mapeos.pop(self._clave, None)
+        # Otros lectores pueden estar usando el mapeo: solo se cierra con el
+        # cerrojo de escritura; si no, se suelta y se cierra cuando nadie lo use
+        if guardado is not None and self._cerrojo.escribiendo():
+            guardado[1].cerrar()
+    
+    def _descargar(self) -> bool:
+        """También suelta los índices, los agregados leídos y el mapeo de la colección"""
+        with self._cerrojo.escritura():
+            if not super()._descargar():
+                return False  # Tenía un lote abierto
+            for estado in (RegistroDAO._lineas_tiempo, RegistroDAO._agregados_habito,
+                           RegistroDAO._agregados_persistidos, RegistroDAO._cambios_agregados):
+                estado.pop(self._clave, None)
+            self._cerrar_mapeo()
+        return True
+    
+    def _registros_mapeados(self) -> Optional[RegistrosMapeados]:
+        """Vista mapeada de registros.bin con el diario encima, si hay que leer de ella en lugar de cargar la colección"""
+        if (not RegistroDAO.lectura_mapeada or self._sqlite is not None
+                or self._clave in BaseDAO._almacenamiento_global
+                or not instantanea_binaria.es_binaria(self._archivo_datos)):
+            return None
+        
+        self._usar_particion()
+        self._esperar_escrituras()  # Lo que quedó por escribir al descargar la colección
+        huella = self._huella_datos()
+        guardado = RegistroDAO._mapeos.get(self._clave)
+        if guardado is not None and guardado[0] == huella:
+            return guardado[1]
+        
+        # Un solo hilo mapea los archivos (y lee el diario) por vez
+        with self._cerrojo.carga:
+            guardado = RegistroDAO._mapeos.get(self._clave)
+            if guardado is not None:
+                if guardado[0] == huella:
+                    return guardado[1]
+                self._cerrar_mapeo()  # Los archivos cambiaron desde que se mapearon
+            if huella[0] is None or self._clave in BaseDAO._almacenamiento_global:
+                return None
+            
+            try:
+                lector = instantanea_binaria.LectorMapeado(self._archivo_datos)
+            except (OSError, ValueError):
+                return None  # Instantánea de la versión 1 o ilegible: se carga la colección
+            try:
+                mapeados = RegistrosMapeados(lector, list(self._cambios_diario()))
+            except Exception as e:
+                lector.cerrar()
+                print(f"⚠️ Error al leer {self._archivo_diario}: {e}")
+                return None
+            # Leer el diario pudo descartar una cola dañada: la huella se toma después
+            RegistroDAO._mapeos[self._clave] = (self._huella_datos(), mapeados)
+            return mapeados
+    
+    def _cambios_diario(self):
+        """(id, registro o None si se eliminó, ordinal de la fecha) de cada entrada del diario"""
+        for entrada in self._leer_diario(self._archivo_diario, self._clave):
+            if entrada['op'] == 'eliminar':
+                yield entrada['id'], None, None
+                continue
+            fila = self._convertir_tipos_csv(entrada['datos'])
+            try:
+                ordinal = self._obtener_fecha_registro(fila).toordinal()
+            except Exception:
+                ordinal = None
+            yield fila['id'], fila, ordinal
+    
+    def _archivos_instantanea(self) -> List[str]:
+        """Con el formato binario, registros.csv queda como último recurso (para pasar de un formato al otro)"""
+        archivos = super()._archivos_instantanea()
+        if self._archivo_csv not in archivos:
+            archivos.append(self._archivo_csv)
+        return archivos
+    
+    def _cargar_instantanea(self, archivo: str) -> ColumnasRegistros:
+        """Carga una instantánea CSV o binaria, según la extensión del archivo"""
+        if not instantanea_binaria.es_binaria(archivo):
+            return self._cargar_csv(archivo)
+        with open(archivo, 'rb') as f:
+            return instantanea_binaria.leer(f.read(), self._tipo_fila)
+    
+    def _escribir_instantanea(self, f, archivo: str, datos: ColumnasRegistros):
+        """Escribe la instantánea en binario (con sus índices) si el archivo es .bin, o como CSV"""
+        if not instantanea_binaria.es_binaria(archivo):
+            return super()._escribir_instantanea(f, archivo, datos)
+        lineas, agregados = datos.lineas_tiempo_guardadas, datos.agregados_guardados
+        if lineas is None or agregados is None:
+            lineas, agregados = self._indices_desde_columnas(datos)
+            agregados = {str(habito_id): agregado.a_dict() for habito_id, agregado in agregados.items()}
+        instantanea_binaria.escribir(f, datos, lineas, agregados)
+    
+    def _campos_instantanea(self, datos: ColumnasRegistros) -> List[str]:
+        """Sin armar las filas: las columnas de más están en la tabla lateral de las columnas"""
+        return list(self.campos) + datos.columnas_extra()
+    
+    def convertir_instantanea(self, origen: str, destino: str) -> int:
+        """Copia una instantánea de registros a otro formato (CSV o binario, según la extensión de cada archivo)
+
+        Sirve para importar un registros.csv al formato binario y para exportar
+        el binario a CSV. Solo copia la instantánea, sin los cambios del diario
+        (compactar antes para incluirlos). Retorna la cantidad de registros.
+        """
+        elementos = self._cargar_instantanea(origen)
+        self._guardar_instantanea(destino, elementos)
+        return len(elementos)
+    
+    def _cargar_csv(self, archivo: str, elementos: Optional[ColumnasRegistros] = None) -> ColumnasRegistros:
+        """Carga registros.csv directo a las columnas, sin armar una fila por registro"""
+        if elementos is None:
+            elementos = self._crear_contenedor()
+        with open(archivo, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            campos = next(reader, None)
+            if campos and sorted(campos) == sorted(self.campos):
+                elementos.extender_desde_csv(campos, reader)
+                return elementos
+        
+        # Encabezado distinto del habitual: lector genérico fila por fila
+        return super()._cargar_csv(archivo, elementos)
+    
+    @staticmethod
+    def _indices_desde_columnas(datos: ColumnasRegistros) -> Tuple[Dict[int, Tuple[array, array]],
+                                                                   Dict[int, AgregadoHabito]]:
+        """Calcula las líneas de tiempo y los agregados por hábito recorriendo las columnas"""
+        pares_por_habito = {}
+        completados_por_habito = {}
+        for posicion, (registro_id, habito_id, ordinal) in enumerate(zip(datos.ids, datos.habito_ids, datos.ordinales)):
+            if ordinal == SIN_VALOR:
+                continue  # Los registros con fechas problemáticas no se indexan
+            pares_por_habito.setdefault(habito_id, []).append((ordinal, registro_id))
+            if datos.completado_en(posicion):
+                completados_por_habito.setdefault(habito_id, []).append(ordinal)
+        
+        agregados = {}
+        lineas = {}
+        for habito_id, pares in pares_por_habito.items():
+            pares.sort(key=itemgetter(0))  # Estable: a igual fecha, orden de inserción
+            lineas[habito_id] = (array('i', (ordinal for ordinal, _ in pares)),
+                                 array('i', (registro_id for _, registro_id in pares)))
+            agregados[habito_id] = AgregadoHabito.desde_ordinales(
+                lineas[habito_id][0], completados_por_habito.get(habito_id, ()))
+        return lineas, agregados
+    
+    def _reconstruir_indices(self):
+        """Recalcula también los índices por hábito, o toma los guardados con una instantánea binaria"""
+        super()._reconstruir_indices()
+        datos = self.datos
+        if datos.lineas_tiempo_guardadas is not None and datos.agregados_guardados is not None:
+            lineas = datos.lineas_tiempo_guardadas
+            agregados = {int(habito_id): AgregadoHabito.desde_dict(agregado)
+                         for habito_id, agregado in datos.agregados_guardados.items()}
+            # Desde acá los índices se mantienen en memoria con cada cambio
+            datos.lineas_tiempo_guardadas = datos.agregados_guardados = None
+        else:
+            lineas, agregados = self._indices_desde_columnas(datos)
+        RegistroDAO._lineas_tiempo[self._clave] = lineas
+        RegistroDAO._agregados_habito[self._clave] = agregados
+    
+    def _aplicar_diario(self, archivo_diario: str, clave: str,
+                        elementos: ColumnasRegistros) -> ColumnasRegistros:
+        """Con índices guardados en la instantánea, los instala y reaplica el diario entrada por entrada
+
+        Así la carga no recorre toda la colección: solo los cambios del diario
+        actualizan los índices, igual que al crear, actualizar o eliminar.
+        """
+        if elementos.lineas_tiempo_guardadas is None or not os.path.exists(archivo_diario):
+            return super()._aplicar_diario(archivo_diario, clave, elementos)
+        
+        BaseDAO._almacenamiento_global[clave] = elementos
+        self._reconstruir_indices()
+        for entrada in self._leer_diario(archivo_diario, clave):
+            self._reaplicar_entrada(entrada)
+        return self.datos
+    
+    def _quitar_posicion(self, posicion: int) -> Any:
+        """Las columnas ya mueven el último registro al lugar del quitado, sin armar su fila"""
+        datos = self.datos
+        fila = datos.pop(posicion)
+        if posicion < len(datos):
+            self._indice_id[datos.ids[posicion]] = posicion
+            BaseDAO._desordenadas.add(self._clave)
+        return fila
+    
+    def _ordenar_por_id(self):
+        """Reordena las columnas sin armar filas; las líneas de tiempo guardan IDs y no cambian"""
+        if self._clave not in BaseDAO._desordenadas:
+            return
+        datos = self.datos
+        datos.ordenar_por_id()
+        BaseDAO._indices_id[self._clave] = dict(zip(datos.ids, range(len(datos))))
+        BaseDAO._desordenadas.discard(self._clave)
+    
+    def _indexar(self, elemento):
+        try:
+            ordinal = self._obtener_fecha_registro(elemento).toordinal()
+        except Exception:
+            return  # Los registros con fechas problemáticas no se indexan
+        habito_id = elemento['habito_id']
+        
+        ordinales, ids = self._linea_tiempo.setdefault(habito_id, (array('i'), array('i')))
+        posicion = bisect_right(ordinales, ordinal)
+        ordinales.insert(posicion, ordinal)
+        ids.insert(posicion, elemento['id'])
+        
+        completado = bool(elemento['completado'])
+        self._agregados.setdefault(habito_id, AgregadoHabito()).agregar_registro(ordinal, completado)
+        self._anotar_cambio_agregado([habito_id, ordinal, completado])
+    
+    def _desindexar(self, elemento):
+        try:
+            ordinal = self._obtener_fecha_registro(elemento).toordinal()
+        except Exception:
+            return
+        habito_id = elemento['habito_id']
+        ordinales, ids = self._linea_tiempo.get(habito_id, ((), ()))
+        for posicion in range(bisect_left(ordinales, ordinal), bisect_right(ordinales, ordinal)):
+            if ids[posicion] == elemento['id']:
+                del ordinales[posicion]
+                del ids[posicion]
+                break
+        
+        # El día se conserva en el agregado si le queda otro registro (completado)
+        agregado = self._agregados.get(habito_id)
+        if agregado is not None:
+            datos = self.datos
+            indice_id = self._indice_id
+            mismo_dia = [ids[k] for k in range(bisect_left(ordinales, ordinal), bisect_right(ordinales, ordinal))]
+            cambio = [habito_id, ordinal, bool(elemento['completado']), bool(mismo_dia),
+                      any(datos.completado_en(indice_id[registro_id]) for registro_id in mismo_dia)]
+            agregado.quitar_registro(*cambio[1:])
+            self._anotar_cambio_agregado(cambio)
+        
+        if not ids:
+            self._linea_tiempo.pop(habito_id, None)
+            self._agregados.pop(habito_id, None)
+    
+    def _anotar_cambio_agregado(self, cambio: List[Any]):
+        """Anota un cambio a los agregados para escribirlo con el diario (no los de la carga)"""
+        cambios = RegistroDAO._cambios_agregados.get(self._clave)
+        if cambios is not None:
+            cambios.append(cambio)
+    
+    @staticmethod
+    def _aplicar_cambio_agregado(agregados: Dict[int, AgregadoHabito], cambio: List[Any]):
+        """Repite sobre los agregados un cambio anotado por _indexar o _desindexar"""
+        habito_id, ordinal, completado = cambio[:3]
+        agregado = agregados.setdefault(habito_id, AgregadoHabito())
+        if len(cambio) == 3:
+            agregado.agregar_registro(ordinal, completado)
+            return
+        agregado.quitar_registro(ordinal, completado, *cambio[3:])
+        if not agregado.total_registros:
+            del agregados[habito_id]  # Como _desindexar, al quitar el último registro del hábito
+    
+    def _id_por_habito_fecha(self, habito_id: int, ordinal: int) -> Optional[int]:
+        """ID del registro de un hábito en un día (el primero creado, si hay más de uno)"""
+        linea = self._linea_tiempo.get(habito_id)
+        if linea is None:
+            return None
+        ordinales, ids = linea
+        posicion = bisect_left(ordinales, ordinal)
+        if posicion < len(ordinales) and ordinales[posicion] == ordinal:
+            return ids[posicion]
+        return None
+    
+    def _ids_por_habito_periodo(self, habito_id: int, fecha_inicio: date, fecha_fin: date) -> List[int]:
+        """IDs de los registros de un hábito en el período, ordenados por fecha"""
+        linea = self._linea_tiempo.get(habito_id)
+        if linea is None:
+            return []
+        ordinales, ids = linea
+        inicio = bisect_left(ordinales, fecha_inicio.toordinal())
+        fin = bisect_right(ordinales, fecha_fin.toordinal())
+        return ids[inicio:fin]
+    
+    def _copiar_datos(self) -> ColumnasRegistros:
+        copia = self.datos.clonar()
+        if instantanea_binaria.es_binaria(self._archivo_datos):
+            # La instantánea binaria guarda también los índices, tal como están ahora
+            copia.lineas_tiempo_guardadas = {habito_id: (ordinales[:], ids[:])
+                                             for habito_id, (ordinales, ids) in self._linea_tiempo.items()}
+            copia.agregados_guardados = self._agregados_a_dict()
+        return copia
+    
+    def _preparar_escritura(self, cambios: List[Tuple[str, Dict[str, Any]]], compactar: bool) -> Dict[str, Any]:
+        """Incluye los cambios a los agregados y, con una instantánea, los agregados enteros"""
+        trabajo = super()._preparar_escritura(cambios, compactar)
+        anotados = RegistroDAO._cambios_agregados.get(self._clave, [])
+        trabajo['cambios_agregados'] = anotados[:]
+        anotados.clear()
+        trabajo['agregados'] = self._agregados_a_dict() if trabajo['instantanea'] is not None else None
+        return trabajo
+    
+    def _ejecutar_escritura(self, trabajo: Dict[str, Any]) -> bool:
+        """Escribe los cambios y, si se pudo, los agregados (enteros con la instantánea, si no sus cambios)"""
+        if not super()._ejecutar_escritura(trabajo):
+            return False
+        if trabajo.get('instantanea_escrita'):
+            self._guardar_agregados(trabajo['agregados'])
+        elif trabajo['lineas']:
+            self._anotar_cambios_agregados(trabajo)
+        return True
+    
+    def _huella_datos(self) -> List[Optional[List[int]]]:
+        """Tamaño y fecha de modificación del CSV y del diario, para saber si los agregados siguen vigentes"""
+        huella = []
+        for archivo in (self._archivo_datos, self._archivo_diario):
+            try:
+                estado = os.stat(archivo)
+                huella.append([estado.st_size, estado.st_mtime_ns])
+            except OSError:
+                huella.append(None)
+        return huella
+    
+    def _agregados_a_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Forma serializable de los agregados por hábito"""
+        return {str(habito_id): agregado.a_dict() for habito_id, agregado in self._agregados.items()}
+    
+    def _guardar_agregados(self, habitos: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Guarda los agregados de la instantánea recién escrita, con su huella, y descarta los cambios anotados"""
+        contenido = {
+            'huella': self._huella_datos()[0],
+            'habitos': self._agregados_a_dict() if habitos is None else habitos
+        }
+        temporal = self._archivo_agregados + '.tmp'
+        try:
+            # Primero los cambios: si el resto no llega a escribirse, los
+            # agregados anteriores ya no coinciden con la instantánea
+            if os.path.exists(self._archivo_cambios_agregados):
+                os.remove(self._archivo_cambios_agregados)
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(contenido, f)
+            os.replace(temporal, self._archivo_agregados)
+        except Exception as e:
+            print(f"⚠️ Error al guardar agregados: {e}")
+    
+    def _anotar_cambios_agregados(self, trabajo: Dict[str, Any]):
+        """Agrega a registros.agregados.diario los cambios de una escritura, con el tramo del diario que reflejan
+
+        Es una línea por escritura del diario, sin reescribir los agregados.
+        desde y hasta son el tamaño del diario antes y después de esa
+        escritura; si no encadenan con el diario actual, los agregados no se
+        leen de disco (ver _leer_agregados).
+        """
+        try:
+            hasta = os.path.getsize(self._archivo_diario)
+            desde = hasta - sum(len(linea.encode('utf-8')) for linea in trabajo['lineas'])
+            linea = json.dumps({'desde': desde, 'hasta': hasta, 'cambios': trabajo['cambios_agregados']})
+            with open(self._archivo_cambios_agregados, 'a', encoding='utf-8') as f:
+                f.write(linea + '\n')
+        except Exception as e:
+            print(f"⚠️ Error al guardar agregados: {e}")
+    
+    def _aplicar_cambios_agregados(self, agregados: Dict[int, AgregadoHabito], tamano_diario: int) -> bool:
+        """Repite sobre los agregados de la instantánea los cambios anotados; False si no cubren todo el diario"""
+        aplicado = 0
+        try:
+            f = open(self._archivo_cambios_agregados, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return tamano_diario == 0
+        with f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except ValueError:
+                    break  # Línea incompleta por una escritura interrumpida
+                if entrada['desde'] != aplicado:
+                    return False
+                for cambio in entrada['cambios']:
+                    self._aplicar_cambio_agregado(agregados, cambio)
+                aplicado = entrada['hasta']
+        return aplicado == tamano_diario
+    
+    def _leer_agregados(self) -> Optional[Dict[int, AgregadoHabito]]:
+        """Agregados guardados en disco con los cambios anotados encima, si todavía corresponden a los archivos de datos"""
+        self._usar_particion()
+        self._esperar_escrituras()
+        huella = self._huella_datos()
+        guardados = RegistroDAO._agregados_persistidos.get(self._clave)
+        if guardados is not None and guardados[0] == huella:
+            return guardados[1]
+        
+        try:
+            if not any(os.path.exists(archivo) for archivo in self._archivos_instantanea()):
+                agregados = {}  # Todavía sin instantánea: todo está en el diario
+            else:
+                with open(self._archivo_agregados, 'r', encoding='utf-8') as f:
+                    contenido = json.load(f)
+                if contenido['huella'] != huella[0]:
+                    return None
+                agregados = {int(habito_id): AgregadoHabito.desde_dict(datos)
+                             for habito_id, datos in contenido['habitos'].items()}
+            if not self._aplicar_cambios_agregados(agregados, huella[1][0] if huella[1] else 0):
+                return None
+        except Exception:
+            return None  # Sin archivo de agregados o ilegible: se carga la colección
+        
+        RegistroDAO._agregados_persistidos[self._clave] = (huella, agregados)
+        return agregados
+    
+    def _agregados_para_lectura(self) -> Dict[int, AgregadoHabito]:
+        """Agregados por hábito, sin cargar la colección si los persistidos están vigentes"""
+        if self._clave not in BaseDAO._almacenamiento_global:
+            agregados = self._leer_agregados()
+            if agregados is not None:
+                return agregados
+        return self._agregados
+    
+    def _agregado(self, habito_id: int) -> AgregadoHabito:
+        """Agregado de un hábito"""
+        if self._sqlite is not None:
+            filas = self._sqlite.consultar('habito_id = ?', (habito_id,), orden='fecha, id')
+            return AgregadoHabito.desde_ordinales(
+                [datos['fecha'].toordinal() for datos in filas],
+                [datos['fecha'].toordinal() for datos in filas if datos['completado']])
+        
+        return self._agregados_para_lectura().get(habito_id) or AgregadoHabito()
+    
+    def _materializar(self, ids: List[int]) -> List[RegistroCumplimiento]:
+        """Convierte una lista de IDs en objetos RegistroCumplimiento"""
+        datos = self.datos
+        indice = self._indice_id
+        return [RegistroCumplimiento.from_dict(datos[indice[registro_id]]) for registro_id in ids]
     
     def crear_registro(self, registro: RegistroCumplimiento) -> RegistroCumplimiento:
         """Crea un nuevo registro de cumplimiento"""
@@ -23,68 +531,98 @@ class RegistroDAO(BaseDAO):
             return RegistroCumplimiento.from_dict(datos)
         return None
     
+    @lectura
     def obtener_registro_por_habito_fecha(self, habito_id: int, fecha: date) -> Optional[RegistroCumplimiento]:
         """Obtiene un registro específico por hábito y fecha"""
-        for datos in self.obtener_todos():
-            try:
-                # Manejar diferentes formatos de fecha
-                if isinstance(datos['fecha'], str):
-                    if 'T' in datos['fecha']:
-                        fecha_registro = datetime.fromisoformat(datos['fecha']).date()
-                    else:
-                        fecha_registro = datetime.fromisoformat(datos['fecha'] + 'T00:00:00').date()
-                elif isinstance(datos['fecha'], datetime):
-                    fecha_registro = datos['fecha'].date()
-                else:
-                    fecha_registro = datos['fecha']
-                
-                if (datos['habito_id'] == habito_id and fecha_registro == fecha):
-                    return RegistroCumplimiento.from_dict(datos)
-            except Exception:
-                continue  # Saltar registros con fechas problemáticas
-        return None
+        if self._sqlite is not None:
+            filas = self._sqlite.consultar('habito_id = ? AND fecha = ?', (habito_id, fecha.isoformat()))
+            return RegistroCumplimiento.from_dict(filas[0]) if filas else None
+        
+        mapeados = self._registros_mapeados()
+        if mapeados is not None:
+            datos = mapeados.fila_habito_fecha(habito_id, fecha.toordinal())
+            return RegistroCumplimiento.from_dict(datos) if datos else None
+        
+        registro_id = self._id_por_habito_fecha(habito_id, fecha.toordinal())
+        if registro_id is None:
+            return None
+        return RegistroCumplimiento.from_dict(self.datos[self._indice_id[registro_id]])
     
+    @lectura
     def obtener_registros_por_habito(self, habito_id: int) -> List[RegistroCumplimiento]:
         """Obtiene todos los registros de un hábito"""
-        registros = []
-        for datos in self.obtener_todos():
-            if datos['habito_id'] == habito_id:
-                registros.append(RegistroCumplimiento.from_dict(datos))
-        return sorted(registros, key=lambda r: r.fecha)
+        if self._sqlite is not None:
+            filas = self._sqlite.consultar('habito_id = ?', (habito_id,), orden='fecha, id')
+            return [RegistroCumplimiento.from_dict(datos) for datos in filas]
+        
+        mapeados = self._registros_mapeados()
+        if mapeados is not None:
+            return [RegistroCumplimiento.from_dict(datos)
+                    for datos in mapeados.filas_habito_periodo(habito_id, date.min.toordinal(), date.max.toordinal())]
+        
+        linea = self._linea_tiempo.get(habito_id)
+        if linea is None:
+            return []
+        return self._materializar(linea[1])
     
+    @lectura
+    def obtener_registros_por_habito_periodo(self, habito_id: int, fecha_inicio: date,
+                                             fecha_fin: date) -> List[RegistroCumplimiento]:
+        """Obtiene los registros de un hábito en un período, ordenados por fecha"""
+        if self._sqlite is not None:
+            filas = self._sqlite.consultar('habito_id = ? AND fecha BETWEEN ? AND ?',
+                                           (habito_id, fecha_inicio.isoformat(), fecha_fin.isoformat()),
+                                           orden='fecha, id')
+            return [RegistroCumplimiento.from_dict(datos) for datos in filas]
+        
+        mapeados = self._registros_mapeados()
+        if mapeados is not None:
+            return [RegistroCumplimiento.from_dict(datos)
+                    for datos in mapeados.filas_habito_periodo(habito_id, fecha_inicio.toordinal(),
+                                                               fecha_fin.toordinal())]
+        
+        return self._materializar(self._ids_por_habito_periodo(habito_id, fecha_inicio, fecha_fin))
+    
+    @lectura
     def obtener_registros_por_fecha(self, fecha: date) -> List[RegistroCumplimiento]:
         """Obtiene todos los registros de una fecha específica"""
-        registros = []
-        fecha_str = fecha.isoformat()
-        for datos in self.obtener_todos():
-            if datos['fecha'] == fecha_str:
-                registros.append(RegistroCumplimiento.from_dict(datos))
-        return registros
+        if self._sqlite is not None:
+            filas = self._sqlite.consultar('fecha = ?', (fecha.isoformat(),))
+            return [RegistroCumplimiento.from_dict(datos) for datos in filas]
+        
+        return self.obtener_registros_por_periodo(fecha, fecha)
     
+    @lectura
     def obtener_registros_por_periodo(self, fecha_inicio: date, fecha_fin: date) -> List[RegistroCumplimiento]:
         """Obtiene registros en un período de tiempo"""
-        registros = []
-        for datos in self.obtener_todos():
-            try:
-                # Manejar fecha que puede venir en diferentes formatos
-                if isinstance(datos['fecha'], str):
-                    if 'T' in datos['fecha']:
-                        fecha_registro = datetime.fromisoformat(datos['fecha']).date()
-                    else:
-                        fecha_registro = datetime.fromisoformat(datos['fecha'] + 'T00:00:00').date()
-                elif isinstance(datos['fecha'], datetime):
-                    fecha_registro = datos['fecha'].date()
-                else:
-                    fecha_registro = datos['fecha']
-                
-                if fecha_inicio <= fecha_registro <= fecha_fin:
-                    registros.append(RegistroCumplimiento.from_dict(datos))
-            except Exception:
-                continue  # Saltar registros con fechas problemáticas
+        if self._sqlite is not None:
+            filas = self._sqlite.consultar('fecha BETWEEN ? AND ?',
+                                           (fecha_inicio.isoformat(), fecha_fin.isoformat()),
+                                           orden='fecha, id')
+            return [RegistroCumplimiento.from_dict(datos) for datos in filas]
+        
+        mapeados = self._registros_mapeados()
+        if mapeados is not None:
+            return [RegistroCumplimiento.from_dict(datos)
+                    for datos in mapeados.filas_periodo(fecha_inicio.toordinal(), fecha_fin.toordinal())]
+        
+        ids = []
+        for habito_id in self._linea_tiempo:
+            ids.extend(self._ids_por_habito_periodo(habito_id, fecha_inicio, fecha_fin))
+        
+        # Orden por fecha y, a igual fecha, por ID (como en SQLite)
+        datos = self.datos
+        indice = self._indice_id
+        registros = [RegistroCumplimiento.from_dict(datos[indice[registro_id]]) for registro_id in sorted(ids)]
         return sorted(registros, key=lambda r: r.fecha)
     
+    @lectura
     def obtener_registros_completados_por_habito(self, habito_id: int) -> List[RegistroCumplimiento]:
         """Obtiene todos los registros completados de un hábito"""
+        if self._sqlite is not None:
+            filas = self._sqlite.consultar('habito_id = ? AND completado = 1', (habito_id,), orden='fecha, id')
+            return [RegistroCumplimiento.from_dict(datos) for datos in filas]
+        
         registros = self.obtener_registros_por_habito(habito_id)
         return [r for r in registros if r.completado]
     
@@ -97,6 +635,7 @@ class RegistroDAO(BaseDAO):
         resultado = self.actualizar(registro.id, datos_registro)
         return resultado is not None
     
+    @escritura
     def marcar_habito_completado(self, habito_id: int, fecha: date, nota: Optional[str] = None) -> RegistroCumplimiento:
         """Marca un hábito como completado en una fecha específica"""
         registro = self.obtener_registro_por_habito_fecha(habito_id, fecha)
@@ -113,6 +652,12 @@ class RegistroDAO(BaseDAO):
         
         return registro
     
+    def marcar_habitos_completados(self, marcas: List[Tuple[int, date, Optional[str]]]) -> List[RegistroCumplimiento]:
+        """Marca varios (habito_id, fecha, nota) como completados y persiste todo de una sola vez"""
+        with self.lote():
+            return [self.marcar_habito_completado(habito_id, fecha, nota) for habito_id, fecha, nota in marcas]
+    
+    @escritura
     def desmarcar_habito_completado(self, habito_id: int, fecha: date) -> bool:
         """Desmarca un hábito como completado"""
         registro = self.obtener_registro_por_habito_fecha(habito_id, fecha)
@@ -123,46 +668,149 @@ class RegistroDAO(BaseDAO):
         
         return False
     
+    @lectura
+    def contar_registros_por_habito(self, habito_id: int) -> Tuple[int, int]:
+        """Cuenta los registros de un hábito y sus días completados: (total, completados)"""
+        agregado = self._agregado(habito_id)
+        return agregado.total_registros, agregado.dias_completados
+    
+    @lectura
+    def contar_completados_periodo(self, habito_id: int, fecha_inicio: date, fecha_fin: date) -> int:
+        """Cuenta los días completados de un hábito en un período"""
+        return self._agregado(habito_id).mapa_completados.contar(fecha_inicio.toordinal(), fecha_fin.toordinal())
+    
+    @lectura
+    def obtener_dias_completados_periodo(self, habito_id: int, fecha_inicio: date, fecha_fin: date) -> int:
+        """Días completados de un hábito en un período como bits: el bit i es el día fecha_inicio + i"""
+        return self._agregado(habito_id).mapa_completados.ventana(fecha_inicio.toordinal(), fecha_fin.toordinal())
+    
+    @lectura
+    def contar_registros_fecha(self, fecha: date) -> Tuple[int, int]:
+        """Cuenta los hábitos con registro en una fecha y cuántos de ellos están completados"""
+        if self._sqlite is not None:
+            return (self._sqlite.contar('fecha = ?', (fecha.isoformat(),)),
+                    self._sqlite.contar('fecha = ? AND completado = 1', (fecha.isoformat(),)))
+        
+        agregados = self._agregados_para_lectura()
+        ordinal = fecha.toordinal()
+        total = sum(1 for agregado in agregados.values() if agregado.mapa_registros.contiene(ordinal))
+        completados = sum(1 for agregado in agregados.values() if agregado.mapa_completados.contiene(ordinal))
+        return total, completados
+    
+    @lectura
     def calcular_racha_actual(self, habito_id: int) -> int:
         """Calcula la racha actual de días consecutivos completados"""
-        registros = self.obtener_registros_completados_por_habito(habito_id)
-        if not registros:
-            return 0
-        
-        # Ordenar por fecha descendente
-        registros.sort(key=lambda r: r.fecha, reverse=True)
+        return self._agregado(habito_id).mapa_completados.racha_hasta(date.today().toordinal())
+    
+    @lectura
+    def calcular_racha_maxima(self, habito_id: int) -> int:
+        """Calcula la racha máxima de días consecutivos completados"""
+        return self._agregado(habito_id).racha_maxima
+    
+    @lectura
+    def obtener_agregados(self, habito_id: int) -> Dict[str, int]:
+        """Totales de un hábito ya calculados: registros, días completados, rachas y completados de la semana y del mes"""
+        agregado = self._agregado(habito_id)
+        hoy = date.today()
+        inicio_semana = hoy.toordinal() - hoy.weekday()
+        inicio_mes = hoy.replace(day=1)
+        fin_mes = (inicio_mes + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        return {
+            'total_dias': agregado.total_registros,
+            'dias_completados': agregado.dias_completados,
+            'racha_actual': agregado.mapa_completados.racha_hasta(hoy.toordinal()),
+            'racha_maxima': agregado.racha_maxima,
+            'completados_semana': agregado.mapa_completados.contar(inicio_semana, inicio_semana + 6),
+            'completados_mes': agregado.mapa_completados.contar(inicio_mes.toordinal(), fin_mes.toordinal()),
+        }
+    
+    @lectura
+    def obtener_estado_agenda(self, habito_ids: List[int], fecha: date) -> Dict[int, Dict[str, int]]:
+        """Estado de varios hábitos para la agenda de una fecha, calculado de una sola vez
+
+        Por hábito retorna 'completado' (si su registro de esa fecha está
+        completado), 'completados_semana' (días completados en la semana de la
+        fecha) y 'racha_actual'. Con SQLite se hace una única consulta para todos
+        los hábitos en lugar de varias por hábito.
+        """
+        if not habito_ids:
+            return {}
         
-        racha = 0
-        fecha_actual = date.today()
+        ordinal = fecha.toordinal()
+        inicio_semana = ordinal - fecha.weekday()
+        hoy = date.today().toordinal()
         
-        for registro in registros:
-            fecha_registro = registro.fecha.date()
-            if fecha_registro == fecha_actual:
-                racha += 1
-                fecha_actual -= timedelta(days=1)
+        if self._sqlite is not None:
+            marcadores = ', '.join('?' for _ in habito_ids)
+            filas = self._sqlite.consultar(f'habito_id IN ({marcadores})', habito_ids, orden='fecha, id')
+            completados = {habito_id: [] for habito_id in habito_ids}
+            registros_del_dia = {}
+            for datos in filas:
+                ordinal_registro = datos['fecha'].toordinal()
+                if ordinal_registro == ordinal:
+                    registros_del_dia.setdefault(datos['habito_id'], datos)
+                if datos['completado']:
+                    completados[datos['habito_id']].append(ordinal_registro)
+            agregados = {habito_id: AgregadoHabito.desde_ordinales((), ordinales)
+                         for habito_id, ordinales in completados.items()}
+            completado_dia = {habito_id: bool(datos['completado'])
+                              for habito_id, datos in registros_del_dia.items()}
+        else:
+            # Con la lectura mapeada, el registro del día sale del archivo y los
+            # agregados de registros.agregados, sin cargar la colección
+            agregados = self._agregados_para_lectura()
+            mapeados = self._registros_mapeados()
+            completado_dia = {}
+            if mapeados is not None:
+                for habito_id in habito_ids:
+                    datos = mapeados.fila_habito_fecha(habito_id, ordinal)
+                    if datos is not None:
+                        completado_dia[habito_id] = bool(datos['completado'])
             else:
-                break
+                datos = self.datos
+                indice_id = self._indice_id
+                for habito_id in habito_ids:
+                    registro_id = self._id_por_habito_fecha(habito_id, ordinal)
+                    if registro_id is not None:
+                        completado_dia[habito_id] = datos.completado_en(indice_id[registro_id])
         
-        return racha
+        estados = {}
+        for habito_id in habito_ids:
+            mapa = (agregados.get(habito_id) or AgregadoHabito()).mapa_completados
+            estados[habito_id] = {
+                'completado': completado_dia.get(habito_id, False),
+                'completados_semana': mapa.contar(inicio_semana, inicio_semana + 6),
+                'racha_actual': mapa.racha_hasta(hoy),
+            }
+        return estados
     
+    @escritura
     def eliminar_registros_por_habito(self, habito_id: int) -> int:
         """Elimina todos los registros de un hábito específico"""
-        registros_eliminados = 0
+        suscriptores = BaseDAO.eventos.suscriptores(self.nombre_coleccion)
+        if self._sqlite is not None:
+            anteriores = self._sqlite.consultar('habito_id = ?', (habito_id,)) if suscriptores else []
+            eliminados = self._sqlite.eliminar('habito_id = ?', (habito_id,))
+            for anterior in anteriores:
+                self._publicar(suscriptores, EventoCambio.ELIMINAR, anterior['id'], anterior, None)
+            return eliminados
         
-        # Filtrar y mantener solo los registros que NO pertenecen al hábito eliminado
-        registros_restantes = []
-        for datos in self.obtener_todos():
-            if datos['habito_id'] != habito_id:
-                registros_restantes.append(datos)
-            else:
-                registros_eliminados += 1
+        # Buscar en la columna de hábitos las posiciones a quitar
+        datos = self.datos
+        posiciones = {posicion for posicion, id_habito in enumerate(datos.habito_ids) if id_habito == habito_id}
+        registros_eliminados = len(posiciones)
+        if not posiciones:
+            return 0
+        
+        anteriores = [datos[posicion].copy() for posicion in sorted(posiciones)] if suscriptores else []
+        datos.eliminar_posiciones(posiciones)
+        self._reconstruir_indices()
         
-        # Actualizar la lista de datos
-        self.datos.clear()
-        self.datos.extend(registros_restantes)
+        # Guardar los cambios (una compactación en lugar de una entrada por registro)
+        self._compactar()
         
-        # Guardar los cambios
-        self._guardar_datos()
+        for anterior in anteriores:
+            self._publicar(suscriptores, EventoCambio.ELIMINAR, anterior['id'], anterior, None)
         
         return registros_eliminados
 
@@ -0,0 +1,69 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dao.instantanea_binaria import LectorMapeado
+
+
+class RegistrosMapeados:
+    """Registros de una instantánea binaria mapeada, con los cambios de su diario encima
+
+    Responde las consultas por hábito y por período sin cargar la colección:
+    los registros de la instantánea se leen del archivo mapeado y los que el
+    diario creó, cambió o eliminó se toman de los cambios (que son pocos, el
+    diario se compacta cada BaseDAO.umbral_compactacion entradas). El orden es
+    el de la colección en memoria: por fecha y, a igual fecha, por ID.
+    """
+
+    def __init__(self, lector: LectorMapeado,
+                 cambios: Iterable[Tuple[int, Optional[Dict[str, Any]], Optional[int]]]):
+        """cambios son (id, registro, ordinal de su fecha) en el orden del diario
+
+        El registro es None si se eliminó y el ordinal es None si la fecha no se
+        pudo leer (esos registros no se indexan, igual que en memoria).
+        """
+        self._lector = lector
+        self._cambios: Dict[int, Tuple[Optional[Dict[str, Any]], Optional[int]]] = {}
+        for registro_id, fila, ordinal in cambios:
+            self._cambios[registro_id] = (fila, ordinal)
+
+        self._nuevos: Dict[int, List[Tuple[int, int, None, Dict[str, Any]]]] = {}
+        for registro_id, (fila, ordinal) in self._cambios.items():
+            if fila is None or ordinal is None:
+                continue
+            self._nuevos.setdefault(fila['habito_id'], []).append((ordinal, registro_id, None, fila))
+
+    def cerrar(self):
+        self._lector.cerrar()
+
+    def _encontrados(self, habito_id: int, ordinal_inicio: int,
+                     ordinal_fin: int) -> List[Tuple[int, int, Optional[int], Optional[Dict[str, Any]]]]:
+        """(ordinal, ID, posición en el archivo o registro del diario) de un hábito en el período"""
+        lector = self._lector
+        encontrados = [(lector.ordinal_en(posicion), lector.id_en(posicion), posicion, None)
+                       for posicion in lector.posiciones(habito_id, ordinal_inicio, ordinal_fin)
+                       if lector.id_en(posicion) not in self._cambios]
+        encontrados += [nuevo for nuevo in self._nuevos.get(habito_id, ())
+                        if ordinal_inicio <= nuevo[0] <= ordinal_fin]
+        return encontrados
+
+    def _filas(self, encontrados: List[Tuple[int, int, Optional[int], Optional[Dict[str, Any]]]]
+               ) -> List[Dict[str, Any]]:
+        """Ordena lo encontrado y arma solo esos registros"""
+        encontrados.sort(key=lambda encontrado: encontrado[:2])
+        return [self._lector.fila(posicion) if fila is None else dict(fila)
+                for _, _, posicion, fila in encontrados]
+
+    def filas_habito_periodo(self, habito_id: int, ordinal_inicio: int, ordinal_fin: int) -> List[Dict[str, Any]]:
+        """Registros de un hábito entre dos días (inclusive)"""
+        return self._filas(self._encontrados(habito_id, ordinal_inicio, ordinal_fin))
+
+    def fila_habito_fecha(self, habito_id: int, ordinal: int) -> Optional[Dict[str, Any]]:
+        """Registro de un hábito en un día (el primero, si hay más de uno)"""
+        filas = self.filas_habito_periodo(habito_id, ordinal, ordinal)
+        return filas[0] if filas else None
+
+    def filas_periodo(self, ordinal_inicio: int, ordinal_fin: int) -> List[Dict[str, Any]]:
+        """Registros de todos los hábitos entre dos días (inclusive)"""
+        encontrados = []
+        for habito_id in set(self._lector.habitos()) | set(self._nuevos):
+            encontrados += self._encontrados(habito_id, ordinal_inicio, ordinal_fin)
+        return self._filas(encontrados)
@@ -0,0 +1,33 @@
+class SecuenciaIds:
+    """Próximo ID de una colección, compartido por todos sus DAO
+
+    Se guarda en {colección}.secuencia cada vez que se escribe la instantánea
+    (antes que ella, así nunca queda por detrás de los IDs que contiene) y al
+    cargar se adelanta con los IDs del diario, de modo que abrir la colección
+    no recorre sus IDs buscando el máximo. Los IDs no se reutilizan aunque se
+    elimine el último elemento, igual que con AUTOINCREMENT en SQLite. Se usa
+    con el cerrojo de la colección tomado para escribir.
+
+    Los IDs no pasan de ID_MAXIMO: los de registros y hábitos se guardan en
+    columnas de enteros de 32 bits con signo (ColumnasRegistros, registros.bin).
+    """
+
+    __slots__ = ('siguiente',)
+
+    ID_MAXIMO = 2 ** 31 - 1
+
+    def __init__(self, siguiente: int = 1):
+        self.siguiente = siguiente
+
+    def generar(self) -> int:
+        """Retorna un ID nuevo"""
+        nuevo_id = self.siguiente
+        if nuevo_id > self.ID_MAXIMO:
+            raise OverflowError(f"No quedan IDs en la colección (el máximo es {self.ID_MAXIMO})")
+        self.siguiente += 1
+        return nuevo_id
+
+    def observar(self, id_elemento: int):
+        """Adelanta la secuencia para que no genere un ID ya usado"""
+        if id_elemento >= self.siguiente:
+            self.siguiente = id_elemento + 1
@@ -0,0 +1,158 @@
+import asyncio
+import functools
+from concurrent.futures import Executor
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dao import BaseDAO
+from gestor_superhabit import GestorSuperHabit
+from models import Habito
+
+
+class GestorSuperHabitAsincrono:
+    """Versión asíncrona de GestorSuperHabit, para atender a muchos usuarios desde un solo event loop
+
+    Con los datos del usuario ya en memoria, cada método corre directamente en
+    el loop (son operaciones en memoria) y sus escrituras quedan pendientes
+    para la escritura diferida de los DAO, que las lleva al disco en otro hilo
+    (ver BaseDAO.escritura_diferida). Lo que sí lee o escribe archivos (la
+    primera carga del usuario, el backend SQLite, eliminar un hábito, que
+    compacta los registros, y guardar los cambios pendientes) se ejecuta en el
+    executor, sin frenar al loop. Las operaciones de un mismo gestor se hacen
+    de a una, así que conviene crear un solo gestor asíncrono por usuario.
+    """
+
+    def __init__(self, usuario: Optional[str] = None, ejecutor: Optional[Executor] = None):
+        """Sin ejecutor se usa el executor por defecto del loop"""
+        self.usuario = usuario
+        self.gestor = GestorSuperHabit(usuario)
+        self._ejecutor = ejecutor
+        # Se crea en la primera operación, ya dentro del loop que la corre:
+        # antes de Python 3.10 un asyncio.Lock queda atado al loop de su creación
+        self._cerrojo: Optional[asyncio.Lock] = None
+        self._daos = (self.gestor.habito_dao, self.gestor.registro_dao)
+        for dao in self._daos:
+            dao.escritura_diferida = True
+
+    def en_memoria(self) -> bool:
+        """Indica si los datos del usuario están cargados (sus operaciones corren en el loop)"""
+        return all(dao.en_memoria() for dao in self._daos)
+
+    async def _ejecutar(self, funcion: Callable[..., Any], *argumentos: Any, en_disco: bool = False) -> Any:
+        """Corre una operación del gestor en el loop si es en memoria, o en el executor si toca el disco"""
+        if self._cerrojo is None:
+            self._cerrojo = asyncio.Lock()
+        async with self._cerrojo:
+            if not en_disco and self.en_memoria():
+                # Ceder el turno antes: si no, quien encadene operaciones en
+                # memoria nunca suspendería y el loop no atendería a nadie más
+                await asyncio.sleep(0)
+                return funcion(*argumentos)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._ejecutor, functools.partial(funcion, *argumentos))
+
+    async def cargar(self):
+        """Carga los datos del usuario en el executor, para que las operaciones siguientes corran en memoria"""
+        def _cargar():
+            for dao in self._daos:
+                dao.datos
+        await self._ejecutar(_cargar, en_disco=True)
+
+    # ===== GESTIÓN DE HÁBITOS =====
+
+    async def crear_habito(self, nombre: str, frecuencia: str, duracion: int,
+                           horario_sugerido: Optional[str] = None) -> Habito:
+        """Crea un nuevo hábito"""
+        return await self._ejecutar(self.gestor.crear_habito, nombre, frecuencia, duracion, horario_sugerido)
+
+    async def obtener_habitos_activos(self) -> List[Habito]:
+        """Obtiene todos los hábitos activos"""
+        return await self._ejecutar(self.gestor.obtener_habitos_activos)
+
+    async def obtener_habito(self, habito_id: int) -> Optional[Habito]:
+        """Obtiene un hábito por su ID"""
+        return await self._ejecutar(self.gestor.obtener_habito, habito_id)
+
+    async def actualizar_habito(self, habito_id: int, nombre: Optional[str] = None,
+                                frecuencia: Optional[str] = None, duracion: Optional[int] = None,
+                                horario_sugerido: Optional[str] = None) -> bool:
+        """Actualiza un hábito existente"""
+        return await self._ejecutar(self.gestor.actualizar_habito, habito_id, nombre, frecuencia,
+                                    duracion, horario_sugerido)
+
+    async def desactivar_habito(self, habito_id: int) -> bool:
+        """Desactiva un hábito (no lo elimina)"""
+        return await self._ejecutar(self.gestor.desactivar_habito, habito_id)
+
+    async def eliminar_habito(self, habito_id: int) -> bool:
+        """Elimina un hábito y sus registros (en el executor: reescribe la instantánea de registros)"""
+        return await self._ejecutar(self.gestor.eliminar_habito, habito_id, en_disco=True)
+
+    # ===== GESTIÓN DE CUMPLIMIENTO =====
+
+    async def marcar_habito_completado(self, habito_id: int, fecha: Optional[date] = None,
+                                       nota: Optional[str] = None) -> str:
+        """Marca un hábito como completado y retorna mensaje motivacional"""
+        return await self._ejecutar(self.gestor.marcar_habito_completado, habito_id, fecha, nota)
+
+    async def desmarcar_habito_completado(self, habito_id: int, fecha: Optional[date] = None) -> bool:
+        """Desmarca un hábito como completado"""
+        return await self._ejecutar(self.gestor.desmarcar_habito_completado, habito_id, fecha)
+
+    async def marcar_habitos_completados(self, marcas: List[Tuple[int, date, Optional[str]]]) -> int:
+        """Marca varios (habito_id, fecha, nota) como completados de una vez y retorna cuántos se marcaron"""
+        return await self._ejecutar(self.gestor.marcar_habitos_completados, marcas)
+
+    async def rellenar_periodo_completado(self, habito_id: int, fecha_inicio: date, fecha_fin: date,
+                                          nota: Optional[str] = None) -> int:
+        """Marca como completados todos los días de un período"""
+        return await self._ejecutar(self.gestor.rellenar_periodo_completado, habito_id, fecha_inicio,
+                                    fecha_fin, nota)
+
+    async def obtener_estado_habito_hoy(self, habito_id: int) -> bool:
+        """Verifica si un hábito está completado hoy"""
+        return await self._ejecutar(self.gestor.obtener_estado_habito_hoy, habito_id)
+
+    # ===== GENERACIÓN DE AGENDA Y RECORDATORIOS =====
+
+    async def generar_agenda_diaria(self, fecha: Optional[date] = None) -> Dict[str, Any]:
+        """Genera la agenda diaria con hábitos y su estado"""
+        return await self._ejecutar(self.gestor.generar_agenda_diaria, fecha)
+
+    async def obtener_habitos_pendientes_hoy(self) -> List[Habito]:
+        """Obtiene los hábitos pendientes para hoy"""
+        return await self._ejecutar(self.gestor.obtener_habitos_pendientes_hoy)
+
+    async def generar_recordatorios(self) -> str:
+        """Genera recordatorios y alertas para el usuario"""
+        return await self._ejecutar(self.gestor.generar_recordatorios)
+
+    # ===== REPORTES Y ESTADÍSTICAS =====
+
+    async def obtener_progreso_habito(self, habito_id: int) -> Optional[Dict[str, Any]]:
+        """Obtiene el progreso completo de un hábito"""
+        return await self._ejecutar(self.gestor.obtener_progreso_habito, habito_id)
+
+    async def obtener_resumen_general(self) -> Dict[str, Any]:
+        """Obtiene un resumen general de todos los hábitos"""
+        return await self._ejecutar(self.gestor.obtener_resumen_general)
+
+    async def obtener_historial_habito(self, habito_id: int, dias: int = 30) -> List[Dict[str, Any]]:
+        """Obtiene el historial de cumplimiento de un hábito"""
+        return await self._ejecutar(self.gestor.obtener_historial_habito, habito_id, dias)
+
+    async def obtener_analisis_historial(self, habito_id: int, dias: int = 30) -> Dict[str, Any]:
+        """Tasa de cumplimiento, rachas, tendencia y completados por semana del historial de un hábito"""
+        return await self._ejecutar(self.gestor.obtener_analisis_historial, habito_id, dias)
+
+    # ===== MENSAJES Y MOTIVACIÓN =====
+
+    async def obtener_mensaje_bienvenida(self) -> str:
+        """Obtiene un mensaje de bienvenida personalizado"""
+        return await self._ejecutar(self.gestor.obtener_mensaje_bienvenida)
+
+    # ===== PERSISTENCIA =====
+
+    async def guardar_cambios_pendientes(self) -> bool:
+        """Escribe en disco (en el executor) los cambios que la escritura diferida tenga pendientes"""
+        return await self._ejecutar(BaseDAO.flush_todas, en_disco=True)
@@ -1,17 +1,20 @@
 from datetime import datetime, date, time, timedelta
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from models import Habito, RegistroCumplimiento
 from dao import HabitoDAO, RegistroDAO
-from utils import CalculadoraProgreso, GeneradorMensajes
+from utils import CalculadoraProgreso, GeneradorMensajes, MotorHistorial
 
 class GestorSuperHabit:
     """Clase principal para gestionar la aplicación SuperHábit"""
     
-    def __init__(self):
-        self.habito_dao = HabitoDAO()
-        self.registro_dao = RegistroDAO()
-        self.calculadora_progreso = CalculadoraProgreso()
+    def __init__(self, usuario: Optional[str] = None):
+        """Sin usuario usa los archivos del directorio actual; con usuario, los de su partición"""
+        self.usuario = usuario
+        self.habito_dao = HabitoDAO(usuario)
+        self.registro_dao = RegistroDAO(usuario)
+        self.calculadora_progreso = CalculadoraProgreso(usuario)
         self.generador_mensajes = GeneradorMensajes()
+        self.motor_historial = MotorHistorial()
     
     # ===== GESTIÓN DE HÁBITOS =====
     
@@ -143,6 +146,37 @@ class GestorSuperHabit:
         
         return self.registro_dao.desmarcar_habito_completado(habito_id, fecha)
     
+    def marcar_habitos_completados(self, marcas: List[Tuple[int, date, Optional[str]]]) -> int:
+        """Marca varios (habito_id, fecha, nota) como completados de una vez y retorna cuántos se marcaron
+        
+        Todas las marcas se validan antes de aplicar ninguna, y los cambios se
+        guardan con una sola escritura al final.
+        """
+        marcas_validas = []
+        habitos_existentes = set()
+        for habito_id, fecha, nota in marcas:
+            if habito_id not in habitos_existentes:
+                if not self.habito_dao.obtener_habito(habito_id):
+                    raise ValueError(f"Hábito no encontrado: {habito_id}")
+                habitos_existentes.add(habito_id)
+            if isinstance(fecha, datetime):
+                fecha = fecha.date()
+            elif not isinstance(fecha, date):
+                raise ValueError(f"Fecha inválida: {fecha!r}")
+            marcas_validas.append((habito_id, fecha, nota))
+        
+        return len(self.registro_dao.marcar_habitos_completados(marcas_validas))
+    
+    def rellenar_periodo_completado(self, habito_id: int, fecha_inicio: date, fecha_fin: date,
+                                    nota: Optional[str] = None) -> int:
+        """Marca como completados todos los días de un período (p. ej. días que se olvidó registrar)"""
+        if fecha_inicio > fecha_fin:
+            raise ValueError("La fecha de inicio no puede ser posterior a la fecha de fin")
+        
+        dias = (fecha_fin - fecha_inicio).days + 1
+        return self.marcar_habitos_completados(
+            [(habito_id, fecha_inicio + timedelta(days=dia), nota) for dia in range(dias)])
+    
     def obtener_estado_habito_hoy(self, habito_id: int) -> bool:
         """Verifica si un hábito está completado hoy"""
         registro = self.registro_dao.obtener_registro_por_habito_fecha(habito_id, date.today())
@@ -162,20 +196,22 @@ class GestorSuperHabit:
             'resumen': None
         }
         
+        # Estado de todos los hábitos de una vez, en lugar de varias consultas por hábito
+        estados = self.registro_dao.obtener_estado_agenda([habito.id for habito in habitos_activos], fecha)
+        
         for habito in habitos_activos:
+            estado = estados[habito.id]
+            
             # Verificar si el hábito aplica para esta fecha
-            aplica_hoy = self._habito_aplica_fecha(habito, fecha)
+            aplica_hoy = self._habito_aplica_fecha(habito, fecha, estado['completados_semana'])
             
             if aplica_hoy:
-                registro = self.registro_dao.obtener_registro_por_habito_fecha(habito.id, fecha)
-                completado = registro is not None and registro.completado
-                
                 item_agenda = {
                     'habito': habito,
-                    'completado': completado,
+                    'completado': estado['completado'],
                     'horario_sugerido': habito.horario_sugerido.strftime('%H:%M') if habito.horario_sugerido else None,
                     'duracion': habito.duracion,
-                    'racha_actual': self.calculadora_progreso.calcular_racha_actual(habito)
+                    'racha_actual': estado['racha_actual']
                 }
                 
                 agenda['habitos'].append(item_agenda)
@@ -192,20 +228,20 @@ class GestorSuperHabit:
         
         return agenda
     
-    def _habito_aplica_fecha(self, habito: Habito, fecha: date) -> bool:
+    def _habito_aplica_fecha(self, habito: Habito, fecha: date,
+                             completados_semana: Optional[int] = None) -> bool:
         """Determina si un hábito aplica para una fecha específica"""
         if habito.frecuencia == 'diaria':
             return True
         elif habito.frecuencia == 'semanal':
             # Para hábitos semanales, verificar si ya se completó esta semana
-            inicio_semana = fecha - timedelta(days=fecha.weekday())
-            fin_semana = inicio_semana + timedelta(days=6)
-            
-            registros_semana = self.registro_dao.obtener_registros_por_periodo(inicio_semana, fin_semana)
-            registros_habito = [r for r in registros_semana if r.habito_id == habito.id and r.completado]
+            if completados_semana is None:
+                inicio_semana = fecha - timedelta(days=fecha.weekday())
+                fin_semana = inicio_semana + timedelta(days=6)
+                completados_semana = self.registro_dao.contar_completados_periodo(habito.id, inicio_semana, fin_semana)
             
             # Si ya se completó esta semana, no mostrar hoy
-            return len(registros_habito) == 0
+            return completados_semana == 0
         
         return False
     
@@ -287,31 +323,53 @@ class GestorSuperHabit:
         fecha_fin = date.today()
         fecha_inicio = fecha_fin - timedelta(days=dias)
         
-        registros = self.registro_dao.obtener_registros_por_periodo(fecha_inicio, fecha_fin)
-        registros_habito = [r for r in registros if r.habito_id == habito_id]
+        # Días completados del período como vector denso, sacado del mapa de bits del hábito
+        bits = self.registro_dao.obtener_dias_completados_periodo(habito_id, fecha_inicio, fecha_fin)
+        completados = self.motor_historial.vector_completados(bits, dias + 1)
+        
+        # Primer registro de cada día, en una sola pasada, solo para las notas
+        registros_por_dia = {}
+        for registro in self.registro_dao.obtener_registros_por_habito_periodo(habito_id, fecha_inicio, fecha_fin):
+            registros_por_dia.setdefault(registro.fecha.toordinal(), registro)
         
         # Crear historial día por día
         historial = []
-        fecha_actual = fecha_inicio
-        
-        while fecha_actual <= fecha_fin:
-            registro_dia = next((r for r in registros_habito if r.fecha.date() == fecha_actual), None)
+        for desplazamiento in range(dias + 1):
+            fecha_actual = fecha_inicio + timedelta(days=desplazamiento)
+            registro_dia = registros_por_dia.get(fecha_actual.toordinal())
             
             item = {
                 'fecha': fecha_actual.strftime('%d/%m/%Y'),
-                'completado': registro_dia.completado if registro_dia else False,
+                'dia_semana': fecha_actual.strftime('%a'),
+                'completado': bool(completados[desplazamiento]),
                 'nota': registro_dia.nota if registro_dia else None
             }
             
             historial.append(item)
-            fecha_actual += timedelta(days=1)
         
         return historial
     
+    def obtener_analisis_historial(self, habito_id: int, dias: int = 30) -> Dict[str, any]:
+        """Tasa de cumplimiento, rachas, tendencia y completados por semana del historial de un hábito"""
+        habito = self.habito_dao.obtener_habito(habito_id)
+        if not habito:
+            return {}
+        
+        fecha_fin = date.today()
+        fecha_inicio = fecha_fin - timedelta(days=dias)
+        bits = self.registro_dao.obtener_dias_completados_periodo(habito_id, fecha_inicio, fecha_fin)
+        return self.motor_historial.analizar(bits, dias + 1)
+    
     # ===== MENSAJES Y MOTIVACIÓN =====
     
     def obtener_mensaje_bienvenida(self) -> str:
         """Obtiene un mensaje de bienvenida personalizado"""
         habitos = self.obtener_habitos_activos()
         return self.generador_mensajes.generar_mensaje_diario(habitos)
+    
+    # ===== PERSISTENCIA =====
+    
+    def guardar_cambios_pendientes(self) -> bool:
+        """Escribe en disco los cambios que la escritura diferida tenga pendientes"""
+        return self.registro_dao.flush_todas()
 
@@ -7,8 +7,8 @@ from gestor_superhabit import GestorSuperHabit
 class InterfazUsuario:
     """Interfaz de usuario para la aplicación SuperHábit"""
     
-    def __init__(self):
-        self.gestor = GestorSuperHabit()
+    def __init__(self, usuario: Optional[str] = None):
+        self.gestor = GestorSuperHabit(usuario)
         self.ejecutando = True
     
     def limpiar_pantalla(self):
@@ -679,54 +679,23 @@ class InterfazUsuario:
             self.pausar()
             return
         
-        # Calcular estadísticas detalladas
-        completados = sum(1 for dia in historial if dia['completado'])
-        total = len(historial)
-        porcentaje = (completados / total * 100) if total > 0 else 0
-        
-        # Calcular racha actual y máxima
-        racha_actual = 0
-        racha_maxima = 0
-        racha_temp = 0
-        
-        for dia in reversed(historial):
-            if dia['completado']:
-                racha_temp += 1
-                if racha_actual == 0:  # Solo contar la racha actual desde el final
-                    racha_actual = racha_temp
-            else:
-                if racha_temp > racha_maxima:
-                    racha_maxima = racha_temp
-                racha_temp = 0
-                if racha_actual == 0:  # Si no hay racha actual, seguir buscando
-                    pass
-                else:
-                    break  # Ya encontramos la racha actual
-        
-        if racha_temp > racha_maxima:
-            racha_maxima = racha_temp
+        # Estadísticas del período calculadas de una vez por el motor de historial
+        analisis = self.gestor.obtener_analisis_historial(habito.id, dias)
         
         print(f"\n📊 RESUMEN DEL PERÍODO ({dias} días):")
         print("-" * 50)
-        print(f"📈 Tasa de cumplimiento: {completados}/{total} días ({porcentaje:.1f}%)")
-        self._mostrar_barra_progreso(porcentaje)
-        print(f"🔥 Racha actual: {racha_actual} días")
-        print(f"🏆 Racha máxima: {racha_maxima} días")
+        print(f"📈 Tasa de cumplimiento: {analisis['completados']}/{analisis['total']} días ({analisis['porcentaje']:.1f}%)")
+        self._mostrar_barra_progreso(analisis['porcentaje'])
+        print(f"🔥 Racha actual: {analisis['racha_actual']} días")
+        print(f"🏆 Racha máxima: {analisis['racha_maxima']} días")
         
         # Mostrar análisis de tendencias
-        if len(historial) >= 14:
-            primera_mitad = historial[:len(historial)//2]
-            segunda_mitad = historial[len(historial)//2:]
-            
-            porc_primera = (sum(1 for d in primera_mitad if d['completado']) / len(primera_mitad) * 100)
-            porc_segunda = (sum(1 for d in segunda_mitad if d['completado']) / len(segunda_mitad) * 100)
-            
-            if porc_segunda > porc_primera + 10:
-                print("📈 ¡Tendencia positiva! Has mejorado tu constancia recientemente.")
-            elif porc_primera > porc_segunda + 10:
-                print("📉 Tendencia decreciente. ¡Puedes retomar el ritmo!")
-            else:
-                print("➡️ Tendencia estable en el período.")
+        if analisis['tendencia'] == 'positiva':
+            print("📈 ¡Tendencia positiva! Has mejorado tu constancia recientemente.")
+        elif analisis['tendencia'] == 'decreciente':
+            print("📉 Tendencia decreciente. ¡Puedes retomar el ritmo!")
+        elif analisis['tendencia'] == 'estable':
+            print("➡️ Tendencia estable en el período.")
         
         # Mostrar calendario visual para períodos cortos
         if dias <= 30:
@@ -734,14 +703,12 @@ class InterfazUsuario:
             print("-" * 50)
             
             # Agrupar por semanas
-            import datetime
             for i in range(0, len(historial), 7):
                 semana = historial[i:i+7]
-                print(f"\nSemana {i//7 + 1}:")
+                print(f"\nSemana {i//7 + 1} ({analisis['semanas'][i//7]}/{len(semana)}):")
                 for dia in semana:
                     estado = "✅" if dia['completado'] else "❌"
-                    fecha_obj = datetime.datetime.strptime(dia['fecha'], '%d/%m/%Y')
-                    dia_semana = fecha_obj.strftime('%a')
+                    dia_semana = dia['dia_semana']
                     nota = f" ({dia['nota'][:20]}...)" if dia['nota'] and len(dia['nota']) > 20 else f" ({dia['nota']})" if dia['nota'] else ""
                     print(f"  {dia_semana} {dia['fecha']}: {estado}{nota}")
         else:
@@ -802,5 +769,8 @@ class InterfazUsuario:
         print("\n🚀 Recuerda: Los grandes cambios empiezan con pequeñas acciones diarias.")
         print("🌟 ¡Nos vemos pronto en tu jornada de crecimiento personal!")
         
+        if not self.gestor.guardar_cambios_pendientes():
+            print("\n⚠️ No se pudieron guardar todos los cambios.")
+        
         self.ejecutando = False
 
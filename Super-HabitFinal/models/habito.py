@@ -4,6 +4,8 @@ from typing import Optional
 class Habito:
     """Clase que representa un hábito del usuario"""
     
+    __slots__ = ('id', 'nombre', 'frecuencia', 'duracion', 'horario_sugerido', 'fecha_creacion', 'activo')
+    
     def __init__(self, nombre: str, frecuencia: str, duracion: int, 
                  horario_sugerido: Optional[time] = None, habito_id: Optional[int] = None):
         self.id = habito_id
@@ -4,6 +4,8 @@ from typing import Optional
 class RegistroCumplimiento:
     """Clase que representa el registro de cumplimiento de un hábito"""
     
+    __slots__ = ('id', 'habito_id', 'fecha', 'completado', 'fecha_completado', 'nota')
+    
     def __init__(self, habito_id: int, fecha: datetime, completado: bool = False, 
                  registro_id: Optional[int] = None, nota: Optional[str] = None):
         self.id = registro_id
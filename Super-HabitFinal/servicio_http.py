@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servicio HTTP/JSON local de SuperHábit
+
+Uso:
+    python servicio_http.py [puerto] [trabajadores]
+
+Expone GestorSuperHabit a los clientes (web, móvil) sin la interfaz de
+consola. Cada usuario trabaja sobre su propia partición (ver
+dao/particiones.py), que se crea con su primer hábito; las demás rutas
+responden 404 a un usuario sin partición:
+
+    GET  /usuarios/<usuario>/habitos                    hábitos activos
+    POST /usuarios/<usuario>/habitos                    crear un hábito
+         {"nombre", "frecuencia", "duracion", "horario_sugerido"}
+    GET  /usuarios/<usuario>/agenda[?fecha=AAAA-MM-DD]   agenda del día
+    POST /usuarios/<usuario>/habitos/<id>/completar     marcar como completado
+         {"fecha", "nota"} (opcionales)
+    POST /usuarios/<usuario>/habitos/<id>/desmarcar     desmarcar {"fecha"} (opcional)
+    GET  /usuarios/<usuario>/habitos/<id>/progreso      progreso y estadísticas
+    GET  /usuarios/<usuario>/habitos/<id>/historial[?dias=30]   (de 1 a 3650 días)
+    GET  /usuarios/<usuario>/resumen                    resumen general
+    GET  /metricas                                      solicitudes, latencias y throughput
+
+Las solicitudes se atienden en un pool de hilos de tamaño fijo; si todos
+están ocupados y la cola de espera está llena se responde 503 sin esperar.
+Las solicitudes de un mismo usuario se atienden de a una (las escrituras
+no se mezclan y las lecturas no ven una escritura a medias); las de
+usuarios distintos, en paralelo.
+"""
+
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as hora
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dao import BaseDAO
+from dao.particiones import directorio_usuario
+from gestor_superhabit import GestorSuperHabit
+
+PUERTO_POR_DEFECTO = 8080
+TRABAJADORES_POR_DEFECTO = 8
+DIAS_HISTORIAL_MAXIMOS = 3650
+
+
+class ErrorSolicitud(Exception):
+    """Error que se responde al cliente con su código HTTP"""
+
+    def __init__(self, estado: int, mensaje: str):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def _a_json(valor: Any) -> Any:
+    """Convierte lo que json no sabe serializar (hábitos, fechas, escalares de NumPy)"""
+    if hasattr(valor, 'to_dict'):
+        return valor.to_dict()
+    if isinstance(valor, (date, datetime, hora)):
+        return valor.isoformat()
+    if hasattr(valor, 'item'):
+        return valor.item()
+    if hasattr(valor, 'tolist'):
+        return valor.tolist()
+    raise TypeError(f"{type(valor).__name__} no se puede convertir a JSON")
+
+
+def _leer_fecha(texto: Optional[str]) -> Optional[date]:
+    if texto is None:
+        return None
+    try:
+        return date.fromisoformat(texto)
+    except (TypeError, ValueError):
+        raise ErrorSolicitud(400, f"Fecha inválida: {texto!r} (formato AAAA-MM-DD)")
+
+
+def _leer_entero(texto: Optional[str], por_defecto: int, minimo: int, maximo: int) -> int:
+    if texto is None:
+        return por_defecto
+    try:
+        numero = int(texto)
+    except ValueError:
+        raise ErrorSolicitud(400, f"Número inválido: {texto!r}")
+    if not minimo <= numero <= maximo:
+        raise ErrorSolicitud(400, f"Número fuera de rango: {numero} (de {minimo} a {maximo})")
+    return numero
+
+
+class MetricasServicio:
+    """Solicitudes, errores y latencias por ruta, y throughput desde el arranque"""
+
+    # Latencias guardadas por ruta para calcular percentiles
+    MUESTRAS = 1000
+
+    def __init__(self):
+        self._cerrojo = threading.Lock()
+        self._inicio = time.perf_counter()
+        self._rutas: Dict[str, Dict[str, Any]] = {}
+        self.rechazadas = 0
+        self.en_curso = 0
+
+    def iniciar(self):
+        with self._cerrojo:
+            self.en_curso += 1
+
+    def terminar(self):
+        with self._cerrojo:
+            self.en_curso -= 1
+
+    def rechazar(self):
+        with self._cerrojo:
+            self.rechazadas += 1
+
+    def registrar(self, ruta: str, segundos: float, error: bool):
+        with self._cerrojo:
+            metricas = self._rutas.get(ruta)
+            if metricas is None:
+                metricas = self._rutas[ruta] = {'solicitudes': 0, 'errores': 0, 'segundos': 0.0,
+                                                'maximo': 0.0, 'muestras': deque(maxlen=self.MUESTRAS)}
+            metricas['solicitudes'] += 1
+            metricas['errores'] += error
+            metricas['segundos'] += segundos
+            metricas['maximo'] = max(metricas['maximo'], segundos)
+            metricas['muestras'].append(segundos)
+
+    def resumen(self) -> Dict[str, Any]:
+        with self._cerrojo:
+            segundos_activo = time.perf_counter() - self._inicio
+            rutas = {}
+            for ruta, metricas in self._rutas.items():
+                muestras = sorted(metricas['muestras'])
+                rutas[ruta] = {
+                    'solicitudes': metricas['solicitudes'],
+                    'errores': metricas['errores'],
+                    'latencia_media_ms': metricas['segundos'] / metricas['solicitudes'] * 1000,
+                    'latencia_p95_ms': muestras[min(len(muestras) - 1, int(len(muestras) * 0.95))] * 1000,
+                    'latencia_maxima_ms': metricas['maximo'] * 1000,
+                }
+            solicitudes = sum(metricas['solicitudes'] for metricas in self._rutas.values())
+            return {
+                'segundos_activo': segundos_activo,
+                'solicitudes': solicitudes,
+                'solicitudes_por_segundo': solicitudes / segundos_activo if segundos_activo > 0 else 0,
+                'rechazadas': self.rechazadas,
+                'en_curso': self.en_curso,
+                'rutas': rutas,
+                'particiones': BaseDAO.particiones.obtener_metricas(),
+            }
+
+
+class ServicioSuperHabit:
+    """Rutas del servicio sobre un GestorSuperHabit por usuario
+
+    Los gestores se guardan del usado hace más tiempo al más reciente, hasta
+    tantos como usuarios residentes admite el pool de particiones. Cada
+    usuario cae en una de las franjas de cerrojos (por hash de su nombre), así
+    que sus solicitudes se atienden de a una sin guardar un cerrojo por usuario.
+    """
+
+    FRANJAS = 64
+
+    def __init__(self):
+        self.metricas = MetricasServicio()
+        self._gestores: 'OrderedDict[str, GestorSuperHabit]' = OrderedDict()
+        self._cerrojo_gestores = threading.Lock()
+        self._cerrojos = [threading.Lock() for _ in range(self.FRANJAS)]
+        # (método, patrón, nombre para las métricas, función)
+        self._rutas: List[Tuple[str, re.Pattern, str, Callable]] = [
+            ('GET', re.compile(r'/usuarios/([^/]+)/habitos'), 'habitos', self._habitos),
+            ('POST', re.compile(r'/usuarios/([^/]+)/habitos'), 'crear_habito', self._crear_habito),
+            ('GET', re.compile(r'/usuarios/([^/]+)/agenda'), 'agenda', self._agenda),
+            ('POST', re.compile(r'/usuarios/([^/]+)/habitos/(\d+)/completar'), 'completar', self._completar),
+            ('POST', re.compile(r'/usuarios/([^/]+)/habitos/(\d+)/desmarcar'), 'desmarcar', self._desmarcar),
+            ('GET', re.compile(r'/usuarios/([^/]+)/habitos/(\d+)/progreso'), 'progreso', self._progreso),
+            ('GET', re.compile(r'/usuarios/([^/]+)/habitos/(\d+)/historial'), 'historial', self._historial),
+            ('GET', re.compile(r'/usuarios/([^/]+)/resumen'), 'resumen', self._resumen),
+        ]
+
+    def gestor(self, usuario: str, crear: bool = False) -> GestorSuperHabit:
+        """Gestor del usuario, creado la primera vez y reutilizado mientras siga entre los recientes
+
+        Crear el gestor crea la partición del usuario: sin crear, un usuario
+        que todavía no la tiene se responde con 404 sin dejar un directorio.
+        """
+        with self._cerrojo_gestores:
+            gestor = self._gestores.get(usuario)
+            if gestor is not None:
+                self._gestores.move_to_end(usuario)
+                return gestor
+        try:
+            directorio = directorio_usuario(BaseDAO.directorio_usuarios, usuario)
+        except ValueError as e:
+            raise ErrorSolicitud(400, str(e))
+        if not crear and not os.path.isdir(directorio):
+            raise ErrorSolicitud(404, f"Usuario no encontrado: {usuario}")
+        gestor = GestorSuperHabit(usuario)
+        with self._cerrojo_gestores:
+            gestor = self._gestores.setdefault(usuario, gestor)
+            while len(self._gestores) > BaseDAO.particiones.capacidad:
+                self._gestores.popitem(last=False)
+        return gestor
+
+    def atender(self, metodo: str, url: str, cuerpo: Optional[Dict[str, Any]]) -> Tuple[int, Any]:
+        """Resuelve una solicitud y retorna (código HTTP, respuesta)"""
+        partes = urlsplit(url)
+        consulta = {clave: valores[-1] for clave, valores in parse_qs(partes.query).items()}
+        ruta = partes.path.rstrip('/')
+        if metodo == 'GET' and ruta == '/metricas':
+            return 200, self.metricas.resumen()
+
+        inicio = time.perf_counter()
+        nombre = 'desconocida'
+        estado = 500
+        try:
+            otro_metodo = False
+            for metodo_ruta, patron, nombre_ruta, funcion in self._rutas:
+                coincidencia = patron.fullmatch(ruta)
+                if coincidencia is None:
+                    continue
+                if metodo_ruta != metodo:
+                    otro_metodo = True
+                    continue
+                nombre = nombre_ruta
+                usuario, *argumentos = coincidencia.groups()
+                # Solo crear un hábito abre la partición de un usuario nuevo: sin
+                # hábitos, las demás rutas (también marcar y desmarcar) darían 404
+                gestor = self.gestor(usuario, crear=nombre == 'crear_habito')
+                with self._cerrojos[hash(usuario) % self.FRANJAS]:
+                    estado, respuesta = funcion(gestor, *argumentos, consulta=consulta, cuerpo=cuerpo or {})
+                return estado, respuesta
+            estado = 405 if otro_metodo else 404
+            return estado, {'error': f"No existe la ruta {metodo} {ruta}"}
+        except ErrorSolicitud as e:
+            estado = e.estado
+            return estado, {'error': str(e)}
+        except Exception as e:
+            print(f"⚠️ Error al atender {metodo} {ruta}: {e}")
+            estado = 500
+            return estado, {'error': 'Error interno del servidor'}
+        finally:
+            self.metricas.registrar(nombre, time.perf_counter() - inicio, estado >= 500)
+
+    @staticmethod
+    def _habito_existente(gestor: GestorSuperHabit, habito_id: str) -> int:
+        habito_id = int(habito_id)
+        if gestor.obtener_habito(habito_id) is None:
+            raise ErrorSolicitud(404, f"Hábito no encontrado: {habito_id}")
+        return habito_id
+
+    def _habitos(self, gestor, consulta, cuerpo):
+        return 200, gestor.obtener_habitos_activos()
+
+    def _crear_habito(self, gestor, consulta, cuerpo):
+        try:
+            habito = gestor.crear_habito(str(cuerpo['nombre']), str(cuerpo['frecuencia']),
+                                         int(cuerpo['duracion']), cuerpo.get('horario_sugerido'))
+        except (KeyError, TypeError) as e:
+            raise ErrorSolicitud(400, f"Falta o es inválido el campo {e}")
+        except ValueError as e:
+            # Las validaciones del gestor (nombre vacío, frecuencia, duración, horario)
+            raise ErrorSolicitud(400, str(e))
+        return 201, habito
+
+    def _agenda(self, gestor, consulta, cuerpo):
+        return 200, gestor.generar_agenda_diaria(_leer_fecha(consulta.get('fecha')))
+
+    def _completar(self, gestor, habito_id, consulta, cuerpo):
+        habito_id = self._habito_existente(gestor, habito_id)
+        mensaje = gestor.marcar_habito_completado(habito_id, _leer_fecha(cuerpo.get('fecha')), cuerpo.get('nota'))
+        return 200, {'mensaje': mensaje}
+
+    def _desmarcar(self, gestor, habito_id, consulta, cuerpo):
+        habito_id = self._habito_existente(gestor, habito_id)
+        return 200, {'desmarcado': gestor.desmarcar_habito_completado(habito_id, _leer_fecha(cuerpo.get('fecha')))}
+
+    def _progreso(self, gestor, habito_id, consulta, cuerpo):
+        return 200, gestor.obtener_progreso_habito(self._habito_existente(gestor, habito_id))
+
+    def _historial(self, gestor, habito_id, consulta, cuerpo):
+        habito_id = self._habito_existente(gestor, habito_id)
+        dias = _leer_entero(consulta.get('dias'), 30, 1, DIAS_HISTORIAL_MAXIMOS)
+        return 200, gestor.obtener_historial_habito(habito_id, dias)
+
+    def _resumen(self, gestor, consulta, cuerpo):
+        return 200, gestor.obtener_resumen_general()
+
+
+class ManejadorHTTP(BaseHTTPRequestHandler):
+    """Traduce cada solicitud HTTP a ServicioSuperHabit.atender y responde en JSON"""
+
+    # Conexiones persistentes; una conexión inactiva libera su trabajador a los timeout segundos
+    protocol_version = 'HTTP/1.1'
+    timeout = 5
+    # Encabezados y cuerpo salen en escrituras separadas: sin esto, Nagle más
+    # el ACK retardado del cliente agregan ~40 ms a cada respuesta
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._atender(None)
+
+    def do_POST(self):
+        try:
+            longitud = int(self.headers.get('Content-Length') or 0)
+            cuerpo = json.loads(self.rfile.read(longitud) or b'{}')
+            if not isinstance(cuerpo, dict):
+                raise ValueError('el cuerpo debe ser un objeto JSON')
+        except ValueError as e:
+            self._responder(400, {'error': f"JSON inválido: {e}"})
+            return
+        self._atender(cuerpo)
+
+    def _atender(self, cuerpo: Optional[Dict[str, Any]]):
+        estado, respuesta = self.server.servicio.atender(self.command, self.path, cuerpo)
+        self._responder(estado, respuesta)
+
+    def _responder(self, estado: int, respuesta: Any):
+        contenido = json.dumps(respuesta, default=_a_json, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def log_message(self, formato, *argumentos):
+        pass  # Las métricas reemplazan al registro por solicitud
+
+
+class ServidorHTTP(HTTPServer):
+    """Servidor HTTP que atiende las conexiones en un pool de hilos de tamaño fijo
+
+    Hay lugar para trabajadores conexiones en curso más en_espera encoladas;
+    las que lleguen con todo ocupado se rechazan con 503 en lugar de acumularse.
+    """
+
+    def __init__(self, direccion: Tuple[str, int], servicio: ServicioSuperHabit,
+                 trabajadores: int = TRABAJADORES_POR_DEFECTO, en_espera: Optional[int] = None):
+        super().__init__(direccion, ManejadorHTTP)
+        self.servicio = servicio
+        self._pool = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix='superhabit-http')
+        self._cupos = threading.BoundedSemaphore(trabajadores + (trabajadores * 4 if en_espera is None else en_espera))
+
+    def process_request(self, request: socket.socket, client_address):
+        if not self._cupos.acquire(blocking=False):
+            self.servicio.metricas.rechazar()
+            self._rechazar(request)
+            return
+        self.servicio.metricas.iniciar()
+        self._pool.submit(self._procesar, request, client_address)
+
+    def _procesar(self, request: socket.socket, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.servicio.metricas.terminar()
+            self._cupos.release()
+
+    def _rechazar(self, request: socket.socket):
+        contenido = json.dumps({'error': 'Servidor ocupado, reintenta en unos segundos'}).encode('utf-8')
+        try:
+            request.sendall(b'HTTP/1.1 503 Service Unavailable\r\n'
+                            b'Content-Type: application/json\r\n'
+                            b'Retry-After: 1\r\n'
+                            b'Connection: close\r\n'
+                            + f'Content-Length: {len(contenido)}\r\n\r\n'.encode('ascii') + contenido)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+        BaseDAO.flush_todas()
+
+
+def crear_servidor(puerto: int = PUERTO_POR_DEFECTO, trabajadores: int = TRABAJADORES_POR_DEFECTO,
+                   anfitrion: str = '127.0.0.1') -> ServidorHTTP:
+    """Crea el servidor (sin arrancarlo); con puerto 0 el sistema elige uno libre"""
+    return ServidorHTTP((anfitrion, puerto), ServicioSuperHabit(), trabajadores)
+
+
+def main():
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else PUERTO_POR_DEFECTO
+    trabajadores = int(sys.argv[2]) if len(sys.argv) > 2 else TRABAJADORES_POR_DEFECTO
+
+    servidor = crear_servidor(puerto, trabajadores)
+    print(f"🌐 SuperHábit escuchando en http://127.0.0.1:{servidor.server_address[1]} "
+          f"({trabajadores} trabajadores, datos en {BaseDAO.directorio_usuarios}/)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Deteniendo el servicio...")
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Entorno común de las pruebas de almacenamiento"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dao import BaseDAO, RegistroDAO
+
+# (clase, atributo) de la configuración que las pruebas pueden cambiar
+_CONFIGURACION = [
+    (BaseDAO, 'directorio_usuarios'), (BaseDAO, 'backend'), (BaseDAO, 'usar_diario'),
+    (BaseDAO, 'umbral_compactacion'), (BaseDAO, 'sincronizar_disco'), (BaseDAO, 'copias_respaldo'),
+    (BaseDAO, 'escritura_diferida'), (RegistroDAO, 'formato_binario'), (RegistroDAO, 'lectura_mapeada'),
+]
+
+
+class PruebaAlmacenamiento(unittest.TestCase):
+    """Cada prueba guarda los datos de sus usuarios en un directorio temporal propio
+
+    Los DAO se crean con un usuario (HabitoDAO('ana')), así sus archivos
+    quedan en ese directorio. Al terminar se descargan todos los usuarios y se
+    restaura la configuración de los DAO.
+    """
+
+    def setUp(self):
+        configuracion = [(clase, atributo, getattr(clase, atributo)) for clase, atributo in _CONFIGURACION]
+        self.directorio = tempfile.mkdtemp(prefix='superhabit_pruebas_')
+        BaseDAO.directorio_usuarios = self.directorio
+        BaseDAO.backend = 'csv'
+        BaseDAO.usar_diario = True
+        BaseDAO.sincronizar_disco = False  # Solo hace más lentas las pruebas
+        BaseDAO.escritura_diferida = False
+        RegistroDAO.formato_binario = False
+        RegistroDAO.lectura_mapeada = False
+
+        def restaurar():
+            BaseDAO.flush_todas()
+            BaseDAO.particiones.desalojar_todos()
+            for clase, atributo, valor in configuracion:
+                setattr(clase, atributo, valor)
+            shutil.rmtree(self.directorio, ignore_errors=True)
+        self.addCleanup(restaurar)
+
+    def archivo(self, usuario: str, nombre: str) -> str:
+        """Ruta de un archivo de datos de un usuario"""
+        return os.path.join(self.directorio, usuario, nombre)
+
+    @staticmethod
+    def reabrir(*daos):
+        """Saca de memoria las colecciones de esos DAO, como al cerrar y volver a abrir la aplicación"""
+        for dao in daos:
+            dao._descargar()
@@ -0,0 +1,253 @@
+import random
+import threading
+import unittest
+from datetime import date, timedelta
+
+from entorno import PruebaAlmacenamiento
+
+from dao import BaseDAO, HabitoDAO, RegistroDAO
+from dao.cerrojos import CerrojoColeccion
+from models import Habito
+from utils.calculadora_progreso import CalculadoraProgreso
+
+HILOS = 8
+OPERACIONES_POR_HILO = 120
+INICIO = date(2024, 1, 1)
+
+
+class TestCerrojoColeccion(unittest.TestCase):
+
+    def test_lectores_en_paralelo(self):
+        cerrojo = CerrojoColeccion()
+        # Si los lectores se excluyeran, ninguno llegaría a la barrera con el otro
+        barrera = threading.Barrier(2, timeout=5)
+        errores = []
+
+        def leer():
+            try:
+                with cerrojo.lectura():
+                    barrera.wait()
+            except threading.BrokenBarrierError as e:
+                errores.append(e)
+
+        hilos = [threading.Thread(target=leer) for _ in range(2)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+
+    def test_escritor_excluye_a_los_lectores(self):
+        cerrojo = CerrojoColeccion()
+        leyo = threading.Event()
+
+        def leer():
+            with cerrojo.lectura():
+                leyo.set()
+
+        with cerrojo.escritura():
+            lector = threading.Thread(target=leer)
+            lector.start()
+            self.assertFalse(leyo.wait(0.1))
+            self.assertTrue(cerrojo.adquirir_escritura(bloquear=False))  # Reentrante
+            cerrojo.liberar_escritura()
+        lector.join(5)
+        self.assertTrue(leyo.is_set())
+
+    def test_al_liberar_con_el_ultimo_cerrojo_de_escritura(self):
+        llamadas = []
+        uno, otro = CerrojoColeccion(lambda: llamadas.append(1)), CerrojoColeccion(lambda: llamadas.append(2))
+        with uno.escritura():
+            with otro.escritura():
+                with uno.escritura():
+                    pass
+            self.assertEqual(llamadas, [])
+        self.assertEqual(llamadas, [1])
+
+
+class TestEscrituraFueraDelCerrojo(PruebaAlmacenamiento):
+
+    def test_el_disco_se_escribe_sin_el_cerrojo_de_la_coleccion(self):
+        BaseDAO.umbral_compactacion = 10
+        dao = RegistroDAO('ana')
+        con_cerrojo = []
+        ejecutar = BaseDAO._ejecutar_escritura
+
+        def espia(dao_escritura, trabajo):
+            con_cerrojo.append(dao_escritura._cerrojo.escribiendo())
+            return ejecutar(dao_escritura, trabajo)
+
+        BaseDAO._ejecutar_escritura = espia
+        self.addCleanup(setattr, BaseDAO, '_ejecutar_escritura', ejecutar)
+        for dia in range(25):  # Con dos compactaciones
+            dao.marcar_habito_completado(1, INICIO + timedelta(days=dia))
+        dao.marcar_habitos_completados([(2, INICIO + timedelta(days=dia), None) for dia in range(5)])
+        dao.eliminar_registros_por_habito(2)
+
+        self.assertGreater(len(con_cerrojo), 25)
+        self.assertNotIn(True, con_cerrojo)
+        # Al retornar, lo escrito ya está en disco
+        self.reabrir(dao)
+        self.assertEqual(len(RegistroDAO('ana').obtener_registros_por_periodo(date.min, date.max)), 25)
+
+
+class TestCacheProgreso(PruebaAlmacenamiento):
+
+    def test_contadores_y_resultados_con_varios_hilos(self):
+        CalculadoraProgreso.limpiar_cache()
+        self.addCleanup(CalculadoraProgreso.limpiar_cache)
+        habito = HabitoDAO('ana').crear_habito(Habito('Leer', 'diaria', 10))
+        antes = CalculadoraProgreso.obtener_metricas_cache()
+        consultas, errores = 200, []
+
+        def consultar():
+            calculadora = CalculadoraProgreso('ana')
+            try:
+                for _ in range(consultas):
+                    calculadora.calcular_racha_actual(habito)
+                    calculadora.calcular_estadisticas_generales(habito)
+            except Exception as e:
+                errores.append(e)
+
+        def marcar():
+            registro_dao = RegistroDAO('ana')
+            for dia in range(30):
+                registro_dao.marcar_habito_completado(habito.id, date.today() - timedelta(days=dia))
+
+        hilos = [threading.Thread(target=consultar) for _ in range(HILOS)] + [threading.Thread(target=marcar)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+
+        despues = CalculadoraProgreso.obtener_metricas_cache()
+        self.assertEqual(despues['aciertos'] + despues['fallos'] - antes['aciertos'] - antes['fallos'],
+                         HILOS * consultas * 2)
+        # Lo que quedó guardado es lo mismo que se calcula sin caché
+        calculadora = CalculadoraProgreso('ana')
+        guardado = calculadora.calcular_racha_actual(habito), calculadora.calcular_estadisticas_generales(habito)
+        CalculadoraProgreso.limpiar_cache()
+        self.assertEqual((calculadora.calcular_racha_actual(habito),
+                          calculadora.calcular_estadisticas_generales(habito)), guardado)
+        self.assertEqual(guardado[0], 30)
+
+
+class TestVariosHilos(PruebaAlmacenamiento):
+    """Versión reducida de `benchmark_almacenamiento.py concurrencia`"""
+
+    USUARIOS = ('ana', 'beto')
+
+    def _problemas(self, usuario: str, habitos: int, marcados: set) -> list:
+        habito_dao, registro_dao = HabitoDAO(usuario), RegistroDAO(usuario)
+        problemas = []
+        ids = [habito.id for habito in habito_dao.obtener_todos_habitos()]
+        if len(ids) != habitos or len(set(ids)) != len(ids):
+            problemas.append(f'{usuario}: hábitos {sorted(ids)}, se esperaban {habitos}')
+        if any(getattr(habito_dao.obtener_habito(habito_id), 'id', None) != habito_id for habito_id in ids):
+            problemas.append(f'{usuario}: índice de hábitos desactualizado')
+        registros = registro_dao.obtener_registros_por_periodo(date.min, date.max)
+        if len({registro.id for registro in registros}) != len(registros):
+            problemas.append(f'{usuario}: IDs de registros repetidos')
+        if any(getattr(registro_dao.obtener_registro(registro.id), 'id', None) != registro.id
+               for registro in registros):
+            problemas.append(f'{usuario}: índice de registros desactualizado')
+        dias = sorted((registro.habito_id, registro.fecha.date()) for registro in registros)
+        if dias != sorted(marcados):
+            problemas.append(f'{usuario}: {len(dias)} registros, {len(marcados)} marcados')
+        return problemas
+
+    def _ronda(self):
+        for usuario in self.USUARIOS:
+            for nombre in ('Leer', 'Correr'):
+                HabitoDAO(usuario).crear_habito(Habito(nombre, 'diaria', 10))
+        habitos = {usuario: 2 for usuario in self.USUARIOS}
+        marcados = {usuario: set() for usuario in self.USUARIOS}
+        mayor_id = {usuario: 2 for usuario in self.USUARIOS}
+        cerrojo = threading.Lock()
+        errores = []
+
+        def trabajar(numero: int):
+            azar = random.Random(numero)
+            # DAO propios de cada hilo: varios DAO por colección a la vez
+            daos = {usuario: (HabitoDAO(usuario), RegistroDAO(usuario)) for usuario in self.USUARIOS}
+            # Los hábitos que crea un hilo solo los marca y elimina él
+            propios = {usuario: [] for usuario in self.USUARIOS}
+            try:
+                for _ in range(OPERACIONES_POR_HILO):
+                    usuario = azar.choice(self.USUARIOS)
+                    habito_dao, registro_dao = daos[usuario]
+                    eleccion = azar.random()
+                    if eleccion < 0.1:
+                        habito_id = habito_dao.crear_habito(Habito(f'Hábito {numero}', 'diaria', 5)).id
+                        propios[usuario].append(habito_id)
+                        with cerrojo:
+                            habitos[usuario] += 1
+                            mayor_id[usuario] = max(mayor_id[usuario], habito_id)
+                    elif eleccion < 0.6:
+                        marca = (azar.choice([1, 2] + propios[usuario]), INICIO + timedelta(days=azar.randrange(20)))
+                        registro_dao.marcar_habito_completado(*marca)
+                        with cerrojo:
+                            marcados[usuario].add(marca)
+                    elif eleccion < 0.7:
+                        registro_dao.desmarcar_habito_completado(azar.randint(1, 2),
+                                                                 INICIO + timedelta(days=azar.randrange(20)))
+                    elif eleccion < 0.8:
+                        with cerrojo:
+                            marcas = sorted(marca for marca in marcados[usuario] if marca[0] in propios[usuario])
+                        if marcas:
+                            marca = azar.choice(marcas)
+                            registro_dao.eliminar(registro_dao.obtener_registro_por_habito_fecha(*marca).id)
+                            with cerrojo:
+                                marcados[usuario].discard(marca)
+                    elif eleccion < 0.85:
+                        if propios[usuario]:
+                            habito_id = propios[usuario].pop()
+                            registro_dao.eliminar_registros_por_habito(habito_id)
+                            habito_dao.eliminar_habito(habito_id)
+                            with cerrojo:
+                                habitos[usuario] -= 1
+                                marcados[usuario] = {marca for marca in marcados[usuario] if marca[0] != habito_id}
+                    else:
+                        registro_dao.obtener_registros_por_habito(azar.randint(1, 2))
+                        registro_dao.calcular_racha_maxima(azar.randint(1, 2))
+            except Exception as e:
+                errores.append(f'hilo {numero}: {type(e).__name__}: {e}')
+
+        hilos = [threading.Thread(target=trabajar, args=(numero,)) for numero in range(HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+
+        problemas = [problema for usuario in self.USUARIOS
+                     for problema in self._problemas(usuario, habitos[usuario], marcados[usuario])]
+        BaseDAO.flush_todas()
+        BaseDAO.particiones.desalojar_todos()
+        problemas += [f'{problema} (tras recargar)' for usuario in self.USUARIOS
+                      for problema in self._problemas(usuario, habitos[usuario], marcados[usuario])]
+        self.assertEqual(problemas, [])
+
+        # La secuencia no repite IDs, ni siquiera los de hábitos eliminados
+        for usuario in self.USUARIOS:
+            self.assertGreater(HabitoDAO(usuario).crear_habito(Habito('Nuevo', 'diaria', 5)).id, mayor_id[usuario])
+
+    def _con_pocos_residentes(self):
+        # Un solo usuario residente: el pool descarga mientras los hilos lo usan
+        capacidad = BaseDAO.particiones.capacidad
+        BaseDAO.particiones.capacidad = 1
+        self.addCleanup(setattr, BaseDAO.particiones, 'capacidad', capacidad)
+
+    def test_escritura_inmediata(self):
+        self._con_pocos_residentes()
+        self._ronda()
+
+    def test_escritura_diferida(self):
+        self._con_pocos_residentes()
+        BaseDAO.escritura_diferida = True
+        self._ronda()
+
+
+if __name__ == '__main__':
+    unittest.main()
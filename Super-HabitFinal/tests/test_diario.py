@@ -0,0 +1,124 @@
+import os
+import unittest
+from datetime import date
+
+from entorno import PruebaAlmacenamiento
+
+from dao import BaseDAO, HabitoDAO, RegistroDAO
+from dao.secuencia_ids import SecuenciaIds
+from models import Habito
+
+
+class TestDiario(PruebaAlmacenamiento):
+    """Los cambios van al diario y se reaplican sobre la instantánea al volver a abrir"""
+
+    def _crear(self, dao: HabitoDAO, cantidad: int):
+        return [dao.crear_habito(Habito(f'Hábito {numero}', 'diaria', 10 + numero)) for numero in range(cantidad)]
+
+    @staticmethod
+    def _estado(dao: HabitoDAO):
+        return [habito.to_dict() for habito in dao.obtener_todos_habitos()]
+
+    def test_reaplica_crear_actualizar_eliminar(self):
+        dao = HabitoDAO('ana')
+        habitos = self._crear(dao, 3)
+        habitos[0].nombre = 'Leer'
+        dao.actualizar_habito(habitos[0])
+        dao.eliminar_habito(habitos[1].id)
+        esperado = self._estado(dao)
+        # Todo quedó en el diario, todavía sin instantánea
+        self.assertFalse(os.path.exists(self.archivo('ana', 'habitos.csv')))
+        with open(self.archivo('ana', 'habitos.diario'), encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 5)
+
+        self.reabrir(dao)
+        dao = HabitoDAO('ana')
+        self.assertEqual(self._estado(dao), esperado)
+        self.assertEqual([habito['nombre'] for habito in esperado], ['Leer', 'Hábito 2'])
+        # Los IDs siguen después de los del diario, también el del eliminado
+        self.assertEqual(dao.crear_habito(Habito('Nuevo', 'diaria', 5)).id, 4)
+
+    def test_descarta_la_ultima_linea_incompleta(self):
+        dao = HabitoDAO('ana')
+        self._crear(dao, 2)
+        esperado = self._estado(dao)
+        diario = self.archivo('ana', 'habitos.diario')
+        tamano = os.path.getsize(diario)
+        self.reabrir(dao)
+        # Una escritura interrumpida a mitad de línea
+        with open(diario, 'ab') as f:
+            f.write(b'{"op": "crear", "datos": {"id": "3", "nom')
+
+        dao = HabitoDAO('ana')
+        self.assertEqual(self._estado(dao), esperado)
+        self.assertEqual(os.path.getsize(diario), tamano)
+        # Lo que se escribe después sigue legible
+        self._crear(dao, 1)
+        esperado = self._estado(dao)
+        self.reabrir(dao)
+        self.assertEqual(self._estado(HabitoDAO('ana')), esperado)
+
+    def test_compacta_al_llegar_al_umbral(self):
+        BaseDAO.umbral_compactacion = 5
+        dao = HabitoDAO('ana')
+        diario, instantanea = self.archivo('ana', 'habitos.diario'), self.archivo('ana', 'habitos.csv')
+        self._crear(dao, 4)
+        self.assertTrue(os.path.exists(diario))
+        self.assertFalse(os.path.exists(instantanea))
+
+        self._crear(dao, 1)
+        self.assertFalse(os.path.exists(diario))
+        with open(instantanea, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 6)  # Encabezado y 5 hábitos
+
+        habitos = dao.obtener_todos_habitos()
+        dao.eliminar_habito(habitos[0].id)
+        esperado = self._estado(dao)
+        self.assertTrue(os.path.exists(diario))
+        self.reabrir(dao)
+        self.assertEqual(self._estado(HabitoDAO('ana')), esperado)
+
+    def test_conserva_las_columnas_desconocidas(self):
+        dao = HabitoDAO('ana')
+        self._crear(dao, 2)
+        dao._compactar()
+        self.reabrir(dao)
+        instantanea = self.archivo('ana', 'habitos.csv')
+        with open(instantanea, encoding='utf-8') as f:
+            lineas = f.read().splitlines()
+        # Una columna que este modelo no conoce, solo en el primer hábito
+        lineas = [lineas[0] + ',color', lineas[1] + ',rojo', lineas[2] + ',']
+        with open(instantanea, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lineas) + '\n')
+
+        dao = HabitoDAO('ana')
+        self.assertTrue(dao.desactivar_habito(1))
+        self._crear(dao, 1)
+        dao._compactar()
+        self.reabrir(dao)
+        dao = HabitoDAO('ana')
+        self.assertEqual([dao.obtener_por_id(habito_id).get('color') for habito_id in (1, 2, 3)],
+                         ['rojo', None, None])
+        self.assertFalse(dao.obtener_habito(1).activo)
+
+    def test_no_genera_ids_de_mas_de_32_bits(self):
+        dao = RegistroDAO('ana')
+        dao._secuencia.siguiente = SecuenciaIds.ID_MAXIMO
+        dao.marcar_habito_completado(1, date(2024, 1, 1))
+        # La secuencia lo rechaza antes de que las columnas de 32 bits lleguen a desbordarse
+        with self.assertRaisesRegex(OverflowError, 'No quedan IDs'):
+            dao.marcar_habito_completado(1, date(2024, 1, 2))
+        self.assertEqual([registro.id for registro in dao.obtener_registros_por_habito(1)], [SecuenciaIds.ID_MAXIMO])
+
+    def test_sin_diario_escribe_la_instantanea(self):
+        BaseDAO.usar_diario = False
+        dao = HabitoDAO('ana')
+        self._crear(dao, 2)
+        self.assertFalse(os.path.exists(self.archivo('ana', 'habitos.diario')))
+        esperado = self._estado(dao)
+        self.reabrir(dao)
+        self.assertEqual(self._estado(HabitoDAO('ana')), esperado)
+
+
+if __name__ == '__main__':
+    unittest.main()
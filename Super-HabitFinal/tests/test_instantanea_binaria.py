@@ -0,0 +1,101 @@
+import io
+import os
+import struct
+import unittest
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+from entorno import PruebaAlmacenamiento
+
+from dao import RegistroDAO, instantanea_binaria
+
+INICIO = date(2024, 1, 1)
+
+
+class TestInstantaneaBinaria(PruebaAlmacenamiento):
+    """registros.bin (versión 2): lo que se escribe se lee igual y lo que no corresponde se rechaza"""
+
+    def setUp(self):
+        super().setUp()
+        RegistroDAO.formato_binario = True
+
+    def _llenar(self, dao: RegistroDAO):
+        for dia in range(40):
+            dao.marcar_habito_completado(1, INICIO + timedelta(days=dia), 'con nota ñ' if dia % 7 == 0 else None)
+        for dia in range(0, 40, 3):
+            dao.marcar_habito_completado(2, INICIO + timedelta(days=dia))
+        for dia in range(5, 40, 9):
+            dao.desmarcar_habito_completado(1, INICIO + timedelta(days=dia))
+
+    @staticmethod
+    def _estado(dao: RegistroDAO):
+        registros = [registro.to_dict() for registro in dao.obtener_registros_por_periodo(date.min, date.max)]
+        return registros, [dao.obtener_agregados(habito_id) for habito_id in (1, 2)]
+
+    def test_ida_y_vuelta(self):
+        dao = RegistroDAO('ana')
+        self._llenar(dao)
+        dao._compactar()
+        self.assertTrue(os.path.exists(self.archivo('ana', 'registros.bin')))
+        esperado = self._estado(dao)
+
+        self.reabrir(dao)
+        self.assertEqual(self._estado(RegistroDAO('ana')), esperado)
+
+    def test_escribir_y_leer_columnas(self):
+        dao = RegistroDAO('ana')
+        self._llenar(dao)
+        lineas, agregados = RegistroDAO._indices_desde_columnas(dao.datos)
+        agregados = {str(habito_id): agregado.a_dict() for habito_id, agregado in agregados.items()}
+        archivo = io.BytesIO()
+        instantanea_binaria.escribir(archivo, dao.datos, lineas, agregados)
+
+        leidas = instantanea_binaria.leer(archivo.getvalue(), dao._tipo_fila)
+        self.assertEqual(leidas.columnas(), dao.datos.columnas())
+        self.assertEqual(leidas.lineas_tiempo_guardadas, lineas)
+        self.assertEqual(leidas.agregados_guardados, agregados)
+        self.assertEqual(list(leidas), list(dao.datos))
+
+    def test_convertir_a_csv_y_de_vuelta(self):
+        dao = RegistroDAO('ana')
+        self._llenar(dao)
+        dao._compactar()
+        binario, csv = self.archivo('ana', 'registros.bin'), self.archivo('ana', 'exportados.csv')
+        copia = self.archivo('ana', 'importados.bin')
+        self.assertEqual(dao.convertir_instantanea(binario, csv), len(dao.datos))
+        self.assertEqual(dao.convertir_instantanea(csv, copia), len(dao.datos))
+        self.assertEqual(dao._cargar_instantanea(copia).columnas(), dao._cargar_instantanea(binario).columnas())
+
+    def test_rechaza_otra_version_o_un_archivo_incompleto(self):
+        dao = RegistroDAO('ana')
+        self._llenar(dao)
+        dao._compactar()
+        with open(self.archivo('ana', 'registros.bin'), 'rb') as f:
+            contenido = f.read()
+        instantanea_binaria.leer(contenido, dao._tipo_fila)
+
+        otra_version = contenido[:4] + struct.pack('<H', instantanea_binaria.VERSION + 1) + contenido[6:]
+        otro_magico = b'XXXX' + contenido[4:]
+        for nombre, danado in (('versión', otra_version), ('mágico', otro_magico), ('truncado', contenido[:-8]),
+                               ('sin encabezado', contenido[:10]), ('con bytes de más', contenido + b'\0' * 8)):
+            with self.subTest(nombre):
+                with self.assertRaises(ValueError):
+                    instantanea_binaria.leer(danado, dao._tipo_fila)
+
+    def test_con_la_instantanea_truncada_carga_el_respaldo(self):
+        dao = RegistroDAO('ana')
+        self._llenar(dao)
+        dao._compactar()
+        esperado = self._estado(dao)
+        dao._compactar()  # La anterior queda como registros.bin.1
+        self.reabrir(dao)
+        binario = self.archivo('ana', 'registros.bin')
+        os.truncate(binario, os.path.getsize(binario) // 2)
+
+        with redirect_stdout(io.StringIO()) as salida:
+            self.assertEqual(self._estado(RegistroDAO('ana')), esperado)
+        self.assertIn('registros.bin', salida.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from datetime import date, timedelta
+
+from entorno import PruebaAlmacenamiento
+
+from dao import RegistroDAO
+
+INICIO = date.today() - timedelta(days=59)
+HABITOS = (1, 2, 3)
+PERIODOS = ((INICIO, INICIO + timedelta(days=59)), (INICIO + timedelta(days=10), INICIO + timedelta(days=24)),
+            (INICIO + timedelta(days=58), INICIO + timedelta(days=90)), (date(2000, 1, 1), date(2000, 12, 31)))
+
+
+class TestLecturaMapeada(PruebaAlmacenamiento):
+    """Las consultas sobre registros.bin mapeado (con el diario encima) responden lo mismo que con el CSV cargado"""
+
+    def _cambiar(self, dao: RegistroDAO, etapa: int):
+        """Los mismos cambios para los dos usuarios: la etapa 0 va a la instantánea, la 1 queda en el diario"""
+        for dia in range(etapa * 30, etapa * 30 + 30):
+            fecha = INICIO + timedelta(days=dia)
+            dao.marcar_habito_completado(1, fecha, 'nota' if dia % 10 == 0 else None)
+            if dia % 3:
+                dao.marcar_habito_completado(2, fecha)
+        # Cambios sobre días que ya están en la instantánea
+        dao.desmarcar_habito_completado(1, INICIO + timedelta(days=etapa * 30 + 4))
+        dao.marcar_habito_completado(3, INICIO + timedelta(days=etapa * 30 + 7))
+        registro = dao.obtener_registro_por_habito_fecha(2, INICIO + timedelta(days=etapa * 30 + 1))
+        dao.eliminar(registro.id)
+
+    @staticmethod
+    def _consultas(dao: RegistroDAO) -> dict:
+        def filas(registros):
+            # fecha_completado es la hora en que se marcó, distinta para cada usuario
+            return [{campo: valor for campo, valor in registro.to_dict().items() if campo != 'fecha_completado'}
+                    for registro in registros]
+
+        resultados = {}
+        for habito_id in HABITOS + (9,):
+            resultados[f'registros {habito_id}'] = filas(dao.obtener_registros_por_habito(habito_id))
+            resultados[f'completados {habito_id}'] = filas(dao.obtener_registros_completados_por_habito(habito_id))
+            resultados[f'rachas {habito_id}'] = (dao.calcular_racha_actual(habito_id),
+                                                dao.calcular_racha_maxima(habito_id),
+                                                dao.contar_registros_por_habito(habito_id))
+            for inicio, fin in PERIODOS:
+                resultados[f'período {habito_id} {inicio}'] = (
+                    filas(dao.obtener_registros_por_habito_periodo(habito_id, inicio, fin)),
+                    dao.contar_completados_periodo(habito_id, inicio, fin),
+                    dao.obtener_dias_completados_periodo(habito_id, inicio, fin))
+        for dia in (0, 1, 4, 7, 31, 34, 59):
+            fecha = INICIO + timedelta(days=dia)
+            resultados[f'día {dia}'] = (filas(dao.obtener_registros_por_fecha(fecha)),
+                                        filas(filter(None, [dao.obtener_registro_por_habito_fecha(1, fecha)])),
+                                        dao.contar_registros_fecha(fecha),
+                                        dao.obtener_estado_agenda(list(HABITOS), fecha))
+        for inicio, fin in PERIODOS:
+            resultados[f'período {inicio}'] = filas(dao.obtener_registros_por_periodo(inicio, fin))
+        return resultados
+
+    def test_coincide_con_el_csv(self):
+        csv = RegistroDAO('csv')
+        RegistroDAO.formato_binario = True
+        binario = RegistroDAO('binario')
+        for dao in (csv, binario):
+            self._cambiar(dao, 0)
+            dao._compactar()
+            self._cambiar(dao, 1)
+        self.reabrir(csv, binario)
+
+        RegistroDAO.lectura_mapeada = True
+        binario = RegistroDAO('binario')
+        esperado = self._consultas(RegistroDAO('csv'))
+        self.assertEqual(self._consultas(binario), esperado)
+        self.assertIsNotNone(binario._registros_mapeados())
+        self.assertFalse(binario.en_memoria())
+
+        # Y lo mismo que la colección binaria cargada en memoria, fecha_completado incluida
+        completos = [registro.to_dict() for registro in binario.obtener_registros_por_periodo(date.min, date.max)]
+        self.reabrir(binario)
+        RegistroDAO.lectura_mapeada = False
+        cargado = RegistroDAO('binario')
+        self.assertEqual([registro.to_dict() for registro in cargado.obtener_registros_por_periodo(date.min, date.max)],
+                         completos)
+        self.assertTrue(cargado.en_memoria())
+
+    def test_un_cambio_carga_la_coleccion(self):
+        RegistroDAO.formato_binario = True
+        dao = RegistroDAO('binario')
+        self._cambiar(dao, 0)
+        dao._compactar()
+        self.reabrir(dao)
+
+        RegistroDAO.lectura_mapeada = True
+        dao = RegistroDAO('binario')
+        antes = len(dao.obtener_registros_por_habito(1))
+        self.assertFalse(dao.en_memoria())
+        dao.marcar_habito_completado(1, INICIO + timedelta(days=45))
+        self.assertTrue(dao.en_memoria())
+        self.assertEqual(len(dao.obtener_registros_por_habito(1)), antes + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dao.mapa_cumplimiento import MapaCumplimiento
+from utils import motor_historial
+from utils.motor_historial import MotorHistorial
+
+
+def _periodos():
+    """Períodos de prueba (bits, días): bordes y patrones al azar con una semilla fija"""
+    periodos = [(0, -3), (0b101, -1), (0, 0), (0, 1), (1, 1), (0, 30), ((1 << 30) - 1, 30), (0b1011, 4), (1 << 29, 30), (1, 30)]
+    azar = random.Random(15)
+    for dias in (7, 13, 14, 15, 30, 90, 365, 1000):
+        for densidad in (0.1, 0.5, 0.9):
+            bits = sum(1 << dia for dia in range(dias) if azar.random() < densidad)
+            periodos.append((bits, dias))
+    # Bits fuera del período: se ignoran
+    periodos.append((azar.getrandbits(100), 60))
+    return periodos
+
+
+class TestMotorHistorialPythonPuro(unittest.TestCase):
+    """El camino sin NumPy, contra un recorrido día por día"""
+
+    def test_analizar_coincide_con_recorrido(self):
+        motor = MotorHistorial(usar_numpy=False)
+        for bits, dias in _periodos():
+            with self.subTest(bits=bits, dias=dias):
+                vector = [bool(bits >> dia & 1) for dia in range(dias)]
+                rachas, racha = [], 0
+                for completado in vector:
+                    racha = racha + 1 if completado else 0
+                    rachas.append(racha)
+                resultado = motor.analizar(bits, dias)
+                self.assertEqual(resultado['completados'], sum(vector))
+                self.assertEqual(resultado['racha_maxima'], max(rachas, default=0))
+                self.assertEqual(resultado['semanas'], [sum(vector[i:i + 7]) for i in range(0, dias, 7)])
+                self.assertEqual(motor.vector_completados(bits, dias), vector)
+
+    def test_periodo_negativo_vacio(self):
+        motor = MotorHistorial(usar_numpy=False)
+        self.assertEqual(motor.vector_completados(0b111, -2), [])
+        resultado = motor.analizar(0b111, -2)
+        self.assertEqual((resultado['total'], resultado['completados'], resultado['semanas']), (0, 0, []))
+        # La ventana con la que el gestor saca esos bits, con el fin antes del inicio
+        mapa = MapaCumplimiento()
+        mapa.origen, mapa.bits = 100, 0b111
+        self.assertEqual(mapa.ventana(103, 100), 0)
+
+
+@unittest.skipIf(motor_historial.np is None, "NumPy no está instalado")
+class TestMotorHistorialNumPy(unittest.TestCase):
+    """Con NumPy y sin él los resultados tienen que ser los mismos"""
+
+    def test_vector_completados(self):
+        con_numpy, sin_numpy = MotorHistorial(usar_numpy=True), MotorHistorial(usar_numpy=False)
+        for bits, dias in _periodos():
+            with self.subTest(bits=bits, dias=dias):
+                self.assertEqual(con_numpy.vector_completados(bits, dias).tolist(),
+                                 sin_numpy.vector_completados(bits, dias))
+
+    def test_analizar(self):
+        con_numpy, sin_numpy = MotorHistorial(usar_numpy=True), MotorHistorial(usar_numpy=False)
+        self.assertTrue(con_numpy.usar_numpy)
+        for bits, dias in _periodos():
+            with self.subTest(bits=bits, dias=dias):
+                self.assertEqual(con_numpy.analizar(bits, dias), sin_numpy.analizar(bits, dias))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import unittest
+
+from entorno import PruebaAlmacenamiento
+
+from dao import BaseDAO
+from servicio_http import ServicioSuperHabit
+
+
+class TestServicioHTTP(PruebaAlmacenamiento):
+
+    def setUp(self):
+        super().setUp()
+        self.servicio = ServicioSuperHabit()
+
+    def _usuarios(self):
+        return sorted(os.listdir(BaseDAO.directorio_usuarios))
+
+    def test_solo_crear_un_habito_crea_la_particion(self):
+        for metodo, ruta in (('GET', '/usuarios/ana/habitos'), ('GET', '/usuarios/ana/resumen'),
+                             ('GET', '/usuarios/ana/habitos/1/historial'),
+                             ('POST', '/usuarios/ana/habitos/1/completar')):
+            with self.subTest(ruta):
+                estado, respuesta = self.servicio.atender(metodo, ruta, {})
+                self.assertEqual(estado, 404)
+                self.assertIn('ana', respuesta['error'])
+        self.assertEqual(self._usuarios(), [])
+
+        estado, _ = self.servicio.atender('POST', '/usuarios/ana/habitos',
+                                          {'nombre': 'Leer', 'frecuencia': 'diaria', 'duracion': 20})
+        self.assertEqual(estado, 201)
+        self.assertEqual(self._usuarios(), ['ana'])
+        estado, habitos = self.servicio.atender('GET', '/usuarios/ana/habitos', None)
+        self.assertEqual((estado, [habito.nombre for habito in habitos]), (200, ['Leer']))
+
+    def test_historial_fuera_de_rango(self):
+        self.servicio.atender('POST', '/usuarios/ana/habitos', {'nombre': 'Leer', 'frecuencia': 'diaria',
+                                                                'duracion': 20})
+        for dias, esperado in (('0', 400), ('-3', 400), ('3651', 400), ('x', 400), ('3650', 200), ('1', 200)):
+            with self.subTest(dias):
+                estado, respuesta = self.servicio.atender('GET', f'/usuarios/ana/habitos/1/historial?dias={dias}', None)
+                self.assertEqual(estado, esperado)
+                if estado == 200:
+                    self.assertEqual(len(respuesta), int(dias) + 1)
+                else:
+                    self.assertIn(dias, respuesta['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
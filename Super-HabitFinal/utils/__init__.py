@@ -1,5 +1,6 @@
 from .calculadora_progreso import CalculadoraProgreso
 from .generador_mensajes import GeneradorMensajes
+from .motor_historial import MotorHistorial
 
-__all__ = ['CalculadoraProgreso', 'GeneradorMensajes']
+__all__ = ['CalculadoraProgreso', 'GeneradorMensajes', 'MotorHistorial']
 
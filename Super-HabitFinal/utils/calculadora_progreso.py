@@ -1,30 +1,104 @@
+import threading
 from datetime import date, timedelta, datetime
-from typing import List, Dict, Tuple
+from typing import Any, Callable, Dict, Optional
 from models.habito import Habito
-from models.registro_cumplimiento import RegistroCumplimiento
+from dao.base_dao import BaseDAO
+from dao.eventos import EventoCambio
 from dao.registro_dao import RegistroDAO
 
 class CalculadoraProgreso:
     """Clase para calcular el progreso de hábitos"""
     
-    def __init__(self):
-        self.registro_dao = RegistroDAO()
+    # Resultados ya calculados, compartidos por todas las instancias:
+    # usuario -> habito_id -> {(método, período): resultado}. Los resúmenes de
+    # todos los hábitos se guardan bajo habito_id None. Cada cambio en los
+    # registros de un hábito descarta sus resultados y los de None (ver
+    # _invalidar), y los de un usuario se descartan al descargarlo del pool.
+    # La caché y los contadores se tocan solo con _cerrojo tomado, que nunca
+    # se sostiene mientras se calcula (los avisos de cambios llegan con el
+    # cerrojo de la colección tomado; ver BaseDAO)
+    _cache = {}
+    _aciertos = 0
+    _fallos = 0
+    _cerrojo = threading.Lock()
+    _suscrita = False
+    
+    def __init__(self, usuario: Optional[str] = None):
+        self.usuario = usuario
+        self.registro_dao = RegistroDAO(usuario)
+        if not CalculadoraProgreso._suscrita:
+            BaseDAO.eventos.suscribir(CalculadoraProgreso._invalidar, self.registro_dao.nombre_coleccion)
+            BaseDAO.particiones.al_desalojar(CalculadoraProgreso._olvidar_usuario)
+            CalculadoraProgreso._suscrita = True
+    
+    @classmethod
+    def obtener_metricas_cache(cls) -> Dict[str, int]:
+        """Retorna los aciertos y fallos de la caché y cuántos resultados guarda"""
+        with cls._cerrojo:
+            entradas = sum(len(resultados) for habitos in cls._cache.values() for resultados in habitos.values())
+            return {'aciertos': cls._aciertos, 'fallos': cls._fallos, 'entradas': entradas}
+    
+    @classmethod
+    def limpiar_cache(cls):
+        """Descarta todos los resultados guardados"""
+        with cls._cerrojo:
+            cls._cache.clear()
+    
+    @classmethod
+    def _invalidar(cls, evento: EventoCambio):
+        """Descarta los resultados del hábito cuyo registro cambió"""
+        with cls._cerrojo:
+            cache = cls._cache.get(evento.usuario)
+            if not cache:
+                return
+            for registro in (evento.anterior, evento.nuevo):
+                if registro is not None:
+                    cache.pop(registro.get('habito_id'), None)
+            cache.pop(None, None)
+    
+    @classmethod
+    def _olvidar_usuario(cls, usuario: str):
+        """Descarta los resultados de un usuario que se descargó de memoria"""
+        with cls._cerrojo:
+            cls._cache.pop(usuario, None)
+    
+    def _memorizar(self, habito_id: Optional[int], metodo: str, periodo: Any,
+                   calcular: Callable[[], Any]) -> Any:
+        """Retorna el resultado guardado si los registros del hábito no cambiaron; si no, lo calcula y guarda"""
+        clave = (metodo, periodo)
+        with CalculadoraProgreso._cerrojo:
+            resultados = CalculadoraProgreso._cache.setdefault(self.usuario, {}).setdefault(habito_id, {})
+            guardado = clave in resultados
+            if guardado:
+                CalculadoraProgreso._aciertos += 1
+                resultado = resultados[clave]
+            else:
+                CalculadoraProgreso._fallos += 1
+        if not guardado:
+            resultado = calcular()
+            # Si los registros cambiaron mientras se calculaba, _invalidar ya
+            # sacó este dict de la caché y el resultado no le llega a nadie
+            with CalculadoraProgreso._cerrojo:
+                resultados[clave] = resultado
+        # Copia para que quien la reciba no modifique el resultado guardado
+        return resultado.copy() if isinstance(resultado, dict) else resultado
     
     def calcular_progreso_semanal(self, habito: Habito) -> Dict[str, float]:
         """Calcula el progreso semanal de un hábito"""
         hoy = date.today()
         inicio_semana = hoy - timedelta(days=hoy.weekday())
+        return self._memorizar(habito.id, 'progreso_semanal', (inicio_semana, habito.frecuencia),
+                               lambda: self._calcular_progreso_semanal(habito, inicio_semana))
+    
+    def _calcular_progreso_semanal(self, habito: Habito, inicio_semana: date) -> Dict[str, float]:
         fin_semana = inicio_semana + timedelta(days=6)
         
-        registros = self.registro_dao.obtener_registros_por_periodo(inicio_semana, fin_semana)
-        registros_habito = [r for r in registros if r.habito_id == habito.id and r.completado]
-        
         if habito.frecuencia == 'diaria':
             objetivo = 7  # 7 días a la semana
         else:  # semanal
             objetivo = 1  # 1 vez a la semana
         
-        completados = len(registros_habito)
+        completados = self.registro_dao.contar_completados_periodo(habito.id, inicio_semana, fin_semana)
         porcentaje = (completados / objetivo) * 100 if objetivo > 0 else 0
         
         return {
@@ -36,17 +110,16 @@ class CalculadoraProgreso:
     
     def calcular_progreso_mensual(self, habito: Habito) -> Dict[str, float]:
         """Calcula el progreso mensual de un hábito"""
-        hoy = date.today()
-        inicio_mes = hoy.replace(day=1)
-        
+        inicio_mes = date.today().replace(day=1)
+        return self._memorizar(habito.id, 'progreso_mensual', (inicio_mes, habito.frecuencia),
+                               lambda: self._calcular_progreso_mensual(habito, inicio_mes))
+    
+    def _calcular_progreso_mensual(self, habito: Habito, inicio_mes: date) -> Dict[str, float]:
         # Calcular el último día del mes
-        if hoy.month == 12:
-            fin_mes = hoy.replace(year=hoy.year + 1, month=1, day=1) - timedelta(days=1)
+        if inicio_mes.month == 12:
+            fin_mes = inicio_mes.replace(year=inicio_mes.year + 1, month=1, day=1) - timedelta(days=1)
         else:
-            fin_mes = hoy.replace(month=hoy.month + 1, day=1) - timedelta(days=1)
-        
-        registros = self.registro_dao.obtener_registros_por_periodo(inicio_mes, fin_mes)
-        registros_habito = [r for r in registros if r.habito_id == habito.id and r.completado]
+            fin_mes = inicio_mes.replace(month=inicio_mes.month + 1, day=1) - timedelta(days=1)
         
         dias_mes = (fin_mes - inicio_mes).days + 1
         
@@ -56,7 +129,7 @@ class CalculadoraProgreso:
             # Aproximadamente 4 semanas por mes
             objetivo = dias_mes // 7
         
-        completados = len(registros_habito)
+        completados = self.registro_dao.contar_completados_periodo(habito.id, inicio_mes, fin_mes)
         porcentaje = (completados / objetivo) * 100 if objetivo > 0 else 0
         
         return {
@@ -68,64 +141,39 @@ class CalculadoraProgreso:
     
     def calcular_racha_actual(self, habito: Habito) -> int:
         """Calcula la racha actual de cumplimiento"""
-        return self.registro_dao.calcular_racha_actual(habito.id)
+        return self._memorizar(habito.id, 'racha_actual', date.today(),
+                               lambda: self.registro_dao.calcular_racha_actual(habito.id))
     
     def calcular_estadisticas_generales(self, habito: Habito) -> Dict[str, any]:
         """Calcula estadísticas generales de un hábito"""
-        registros = self.registro_dao.obtener_registros_por_habito(habito.id)
-        registros_completados = [r for r in registros if r.completado]
-        
-        total_dias = len(registros)
-        dias_completados = len(registros_completados)
+        return self._memorizar(habito.id, 'estadisticas_generales', (date.today(), habito.fecha_creacion),
+                               lambda: self._calcular_estadisticas_generales(habito))
+    
+    def _calcular_estadisticas_generales(self, habito: Habito) -> Dict[str, any]:
+        # Totales mantenidos por el DAO con cada registro, sin recorrer el historial
+        agregados = self.registro_dao.obtener_agregados(habito.id)
+        total_dias = agregados['total_dias']
+        dias_completados = agregados['dias_completados']
         
         porcentaje_exito = (dias_completados / total_dias * 100) if total_dias > 0 else 0
-        racha_actual = self.calcular_racha_actual(habito)
-        
-        # Calcular la racha más larga
-        racha_maxima = self._calcular_racha_maxima(registros_completados)
         
         return {
             'total_dias': total_dias,
             'dias_completados': dias_completados,
             'porcentaje_exito': porcentaje_exito,
-            'racha_actual': racha_actual,
-            'racha_maxima': racha_maxima,
+            'racha_actual': agregados['racha_actual'],
+            'racha_maxima': agregados['racha_maxima'],
             'fecha_creacion': habito.fecha_creacion.strftime('%d/%m/%Y')
         }
     
-    def _calcular_racha_maxima(self, registros_completados: List[RegistroCumplimiento]) -> int:
-        """Calcula la racha máxima de días consecutivos"""
-        if not registros_completados:
-            return 0
-        
-        # Ordenar por fecha
-        registros_ordenados = sorted(registros_completados, key=lambda r: r.fecha)
-        
-        racha_maxima = 1
-        racha_actual = 1
-        
-        for i in range(1, len(registros_ordenados)):
-            fecha_anterior = registros_ordenados[i-1].fecha.date()
-            fecha_actual = registros_ordenados[i].fecha.date()
-            
-            # Verificar si son días consecutivos
-            if fecha_actual == fecha_anterior + timedelta(days=1):
-                racha_actual += 1
-                racha_maxima = max(racha_maxima, racha_actual)
-            else:
-                racha_actual = 1
-        
-        return racha_maxima
-    
     def obtener_resumen_diario(self, fecha: date = None) -> Dict[str, any]:
         """Obtiene un resumen del progreso del día"""
         if fecha is None:
             fecha = date.today()
-        
-        registros = self.registro_dao.obtener_registros_por_fecha(fecha)
-        
-        total_habitos = len(registros)
-        completados = len([r for r in registros if r.completado])
+        return self._memorizar(None, 'resumen_diario', fecha, lambda: self._calcular_resumen_diario(fecha))
+    
+    def _calcular_resumen_diario(self, fecha: date) -> Dict[str, any]:
+        total_habitos, completados = self.registro_dao.contar_registros_fecha(fecha)
         pendientes = total_habitos - completados
         
         porcentaje = (completados / total_habitos * 100) if total_habitos > 0 else 0
@@ -0,0 +1,103 @@
+from typing import Any, Dict, List, Optional
+
+from dao.mapa_cumplimiento import MapaCumplimiento
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se opera sobre el entero de bits
+    np = None
+
+
+class MotorHistorial:
+    """Estadísticas del historial de un hábito a partir de sus días completados
+
+    El período llega como un entero de bits (el bit i es el día i del período,
+    el 0 el más antiguo), que es lo que entrega el mapa de cumplimiento del
+    hábito. Con NumPy se desempaca a un vector denso de un valor por día y se
+    calcula todo con operaciones sobre el vector; sin NumPy se usan operaciones
+    sobre el entero, que dan los mismos resultados.
+    """
+
+    # Días mínimos del período para comparar sus dos mitades
+    DIAS_MINIMOS_TENDENCIA = 14
+    # Diferencia en puntos porcentuales entre mitades para hablar de tendencia
+    UMBRAL_TENDENCIA = 10
+
+    def __init__(self, usar_numpy: Optional[bool] = None):
+        self.usar_numpy = np is not None if usar_numpy is None else usar_numpy and np is not None
+
+    def vector_completados(self, bits: int, dias: int):
+        """Vector denso de días completados del período (array de bool con NumPy, lista sin él)"""
+        dias = max(dias, 0)  # Un período negativo no tiene días, como range()
+        bits &= (1 << dias) - 1
+        if self.usar_numpy:
+            bytes_dias = np.frombuffer(bits.to_bytes((dias + 7) // 8, 'little'), dtype=np.uint8)
+            return np.unpackbits(bytes_dias, bitorder='little')[:dias].astype(bool)
+        if not dias:
+            return []  # format(0, '00b') daría un día
+        return [digito == '1' for digito in reversed(format(bits, f'0{dias}b'))]
+
+    def analizar(self, bits: int, dias: int) -> Dict[str, Any]:
+        """Tasa de cumplimiento, rachas, tendencia y completados por semana de un período
+
+        'racha_actual' es la racha más reciente del período y 'semanas' cuenta
+        los días completados de cada bloque de 7 días desde el inicio.
+        """
+        dias = max(dias, 0)
+        bits &= (1 << dias) - 1
+        mitad = dias // 2
+        if self.usar_numpy:
+            conteos = self._analizar_vector(self.vector_completados(bits, dias), mitad)
+        else:
+            conteos = self._analizar_bits(bits, dias, mitad)
+        completados, racha_actual, racha_maxima, completados_primera, semanas = conteos
+
+        porcentaje_primera = completados_primera / mitad * 100 if mitad else 0
+        porcentaje_segunda = (completados - completados_primera) / (dias - mitad) * 100 if dias else 0
+        tendencia = None
+        if dias >= self.DIAS_MINIMOS_TENDENCIA:
+            if porcentaje_segunda > porcentaje_primera + self.UMBRAL_TENDENCIA:
+                tendencia = 'positiva'
+            elif porcentaje_primera > porcentaje_segunda + self.UMBRAL_TENDENCIA:
+                tendencia = 'decreciente'
+            else:
+                tendencia = 'estable'
+
+        return {
+            'completados': completados,
+            'total': dias,
+            'porcentaje': completados / dias * 100 if dias else 0,
+            'racha_actual': racha_actual,
+            'racha_maxima': racha_maxima,
+            'porcentaje_primera_mitad': porcentaje_primera,
+            'porcentaje_segunda_mitad': porcentaje_segunda,
+            'tendencia': tendencia,
+            'semanas': semanas,
+        }
+
+    @staticmethod
+    def _analizar_vector(vector, mitad: int):
+        """Conteos del período con operaciones de NumPy sobre el vector denso"""
+        completados = int(vector.sum())
+
+        # Los cambios de 0 a 1 y de 1 a 0 marcan dónde empieza y termina cada racha
+        bordes = np.diff(np.concatenate(([0], vector.astype(np.int8), [0])))
+        rachas = np.flatnonzero(bordes == -1) - np.flatnonzero(bordes == 1)
+        racha_actual = int(rachas[-1]) if rachas.size else 0
+        racha_maxima = int(rachas.max()) if rachas.size else 0
+
+        completados_primera = int(vector[:mitad].sum())
+        semanas: List[int] = []
+        if vector.size:
+            semanas = np.add.reduceat(vector.astype(np.int32), np.arange(0, vector.size, 7)).tolist()
+        return completados, racha_actual, racha_maxima, completados_primera, semanas
+
+    @staticmethod
+    def _analizar_bits(bits: int, dias: int, mitad: int):
+        """Conteos del período con operaciones sobre el entero de bits"""
+        mapa = MapaCumplimiento()
+        mapa.origen, mapa.bits = 0, bits
+        racha_actual = mapa.racha_hasta(bits.bit_length() - 1) if bits else 0
+        semanas = [mapa.contar(inicio, inicio + 6) for inicio in range(0, dias, 7)]
+        return (mapa.contar(), racha_actual, mapa.racha_maxima(),
+                mapa.contar(0, mitad - 1) if mitad else 0, semanas)